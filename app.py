@@ -1,14 +1,22 @@
 import streamlit as st
 from PIL import Image
-import numpy as np
-import tensorflow as tf
-import json
-from utils.preprocess import preprocess_image
-from utils.recommendations import get_recommendation
-from utils.db import get_user_by_username, create_user, save_scan, get_scan_history, get_disease_frequency, get_daily_scan_counts, get_severity_breakdown
-from utils.auth import hash_password, verify_password, validate_registration
+import gc
+import hashlib
+from datetime import datetime
+import os
+from utils.diagnosis import diagnose
+from utils.recommendations import load_bundles
+from utils.db import (get_user_by_username, create_user, get_scan_history_page, get_dashboard_summary,
+                      database_available, update_password_hash)
+from utils.auth import AuthBusyError, hash_password, needs_rehash, rehash_password, verify_login, validate_registration
 from utils.report import generate_report_pdf
 from utils.weather import get_weather, assess_disease_risk, weather_icon_emoji
+from utils.model_store import load_best_model
+from utils.scan_writer import enqueue_scan
+from utils.export import (APP_EXPORT_MAX_ROWS, EXPORT_FORMATS, MEDIA_TYPES, prepare_export_file,
+                          remove_export_file)
+from utils.metrics import start_http_server
+from utils.image_store import THUMBNAIL_DIR, store_image_in_background, thumbnail_path, thumbnail_relpath
 
 # ─── Page Config ───
 st.set_page_config(
@@ -26,172 +34,81 @@ if "user" not in st.session_state:
 if "auth_page" not in st.session_state:
     st.session_state.auth_page = "login"  # "login" or "register"
 
+# ─── Heap Freezing ───
+# Streamlit runs a full gc.collect() after every script and fragment run, and
+# another through keras.clear_session() once TensorFlow is imported. The ~400k
+# objects TensorFlow and the model leave on the heap live as long as the
+# process, so they are moved out of the collector's reach (gc.freeze); each
+# collection then only walks what the run itself created (~200 ms -> <1 ms).
+def freeze_heap():
+    gc.collect()
+    gc.freeze()
+
+@st.cache_resource
+def freeze_startup_heap():
+    freeze_heap()
+
 # ─── Load Model ───
 @st.cache_resource
 def load_model():
-    return tf.keras.models.load_model("models/crop_disease_model.h5")
+    model = load_best_model()
+    freeze_heap()
+    return model
+
+# ─── Metrics Endpoint (METRICS_PORT) ───
+@st.cache_resource
+def start_metrics_server():
+    return start_http_server()
+
+start_metrics_server()
+freeze_startup_heap()
+
+# ─── Result Bundles (one per model class; fails fast if any class lacks a recommendation) ───
+@st.cache_resource
+def load_result_bundles():
+    return load_bundles()
 
-def load_class_indices():
-    with open("models/class_indices.json", "r") as f:
-        return json.load(f)
+RESULT_BUNDLES = load_result_bundles()
 
 
 # ══════════════════════════════════════════════════════
-#  AUTH PAGES CSS + FUNCTIONS
+#  STYLESHEETS
 # ══════════════════════════════════════════════════════
-AUTH_CSS = """
+# The CSS lives in static/ and Streamlit serves it (server.enableStaticServing in
+# .streamlit/config.toml), so the browser downloads and caches it once instead of
+# every rerun sending it again. ?v= is the content hash, so an edit is picked up.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+FONT_LINKS = """
 <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.1/css/all.min.css">
-<link href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-<style>
-    h1, h2, h3, h4, h5, h6, p, a, li, button, label, input, textarea,
-    .stMarkdown, .stButton, .stTextInput, .stSelectbox {
-        font-family: 'Plus Jakarta Sans', sans-serif !important;
-    }
-    .stApp { background: linear-gradient(135deg, #0f172a 0%, #1e293b 50%, #0f172a 100%); }
-
-    /* Auth card */
-    .auth-wrap {
-        max-width: 440px;
-        margin: 0 auto;
-        padding: 40px 0;
-    }
-    .auth-logo {
-        text-align: center;
-        margin-bottom: 32px;
-    }
-    .auth-logo-icon {
-        width: 68px; height: 68px;
-        border-radius: 18px;
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        display: inline-flex; align-items: center; justify-content: center;
-        font-size: 1.8rem;
-        box-shadow: 0 10px 30px rgba(99,102,241,0.4);
-        margin-bottom: 16px;
-    }
-    .auth-logo h1 {
-        color: #f8fafc !important;
-        font-size: 1.8rem !important;
-        font-weight: 800 !important;
-        margin: 0 0 4px 0 !important;
-    }
-    .auth-logo p {
-        color: #64748b !important;
-        font-size: 0.85rem !important;
-        margin: 0 !important;
-    }
-    .auth-card {
-        background: rgba(30,41,59,0.7);
-        border: 1px solid rgba(148,163,184,0.1);
-        border-radius: 20px;
-        padding: 36px 36px;
-        backdrop-filter: blur(20px);
-        box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-    }
-    .auth-title {
-        font-size: 1.35rem !important;
-        font-weight: 800 !important;
-        color: #f1f5f9 !important;
-        margin: 0 0 4px 0 !important;
-    }
-    .auth-sub {
-        font-size: 0.82rem !important;
-        color: #64748b !important;
-        margin: 0 0 24px 0 !important;
-    }
-
-    /* Input styling */
-    .stTextInput input {
-        background: rgba(15,23,42,0.6) !important;
-        border: 1px solid rgba(148,163,184,0.15) !important;
-        border-radius: 10px !important;
-        color: #f1f5f9 !important;
-        padding: 12px 16px !important;
-        font-size: 0.9rem !important;
-    }
-    .stTextInput input:focus {
-        border-color: #6366f1 !important;
-        box-shadow: 0 0 0 3px rgba(99,102,241,0.15) !important;
-    }
-    .stTextInput label {
-        color: #94a3b8 !important;
-        font-size: 0.8rem !important;
-        font-weight: 600 !important;
-    }
-
-    /* Primary button */
-    .stButton > button {
-        background: linear-gradient(135deg, #6366f1, #8b5cf6) !important;
-        color: #fff !important;
-        border: none !important;
-        border-radius: 10px !important;
-        padding: 12px 20px !important;
-        font-weight: 700 !important;
-        font-size: 0.95rem !important;
-        width: 100% !important;
-        transition: all 0.3s ease !important;
-        box-shadow: 0 4px 15px rgba(99,102,241,0.3) !important;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 8px 25px rgba(99,102,241,0.5) !important;
-    }
-
-    /* Divider */
-    .auth-divider {
-        display: flex; align-items: center; gap: 12px;
-        margin: 20px 0;
-    }
-    .auth-divider hr {
-        flex: 1; border: none;
-        border-top: 1px solid rgba(148,163,184,0.12);
-        margin: 0;
-    }
-    .auth-divider span {
-        font-size: 0.75rem; color: #475569;
-    }
-
-    /* Switch link */
-    .auth-switch {
-        text-align: center;
-        margin-top: 20px;
-        font-size: 0.82rem;
-        color: #64748b;
-    }
-    .auth-error {
-        background: rgba(239,68,68,0.1);
-        border: 1px solid rgba(239,68,68,0.3);
-        border-radius: 10px;
-        padding: 12px 16px;
-        color: #fca5a5;
-        font-size: 0.82rem;
-        margin-bottom: 16px;
-    }
-    .auth-success {
-        background: rgba(16,185,129,0.1);
-        border: 1px solid rgba(16,185,129,0.3);
-        border-radius: 10px;
-        padding: 12px 16px;
-        color: #6ee7b7;
-        font-size: 0.82rem;
-        margin-bottom: 16px;
-    }
-    /* Center buttons on auth pages */
-    .auth-btn-wrap { text-align: center; margin-top: 6px; }
-    .auth-btn-wrap .stButton > button {
-        display: inline-block !important;
-        width: 100% !important;
-    }
-    /* Auth card inner header */
-    .auth-card-header {
-        border-bottom: 1px solid rgba(148,163,184,0.1);
-        padding-bottom: 18px;
-        margin-bottom: 20px;
-    }
-    /* Hide sidebar on auth pages */
-    section[data-testid="stSidebar"] { display: none !important; }
-</style>
+<link href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@300;400;500;600;700;800&display=swap" rel="stylesheet">
 """
 
+@st.cache_resource
+def stylesheet_links(name):
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    return FONT_LINKS + f'<link rel="stylesheet" href="app/static/{name}?v={version}">'
+
+# ─── Scan Thumbnails ───
+# Thumbnails are written under static/thumbs (IMAGE_THUMBNAIL_DIR), so History
+# links to them and the browser fetches each one once, instead of every rerun
+# sending its bytes. Their names are content hashes, so a URL never goes stale.
+_THUMBNAIL_DIR_IN_STATIC = os.path.relpath(os.path.abspath(THUMBNAIL_DIR), STATIC_DIR).replace(os.sep, "/")
+THUMBNAIL_URL_ROOT = (None if _THUMBNAIL_DIR_IN_STATIC.startswith("..")   # not served: show none
+                      else f"app/static/{_THUMBNAIL_DIR_IN_STATIC}")
+
+def thumbnail_url(image_hash):
+    # A missing file may still be being written in the background
+    if THUMBNAIL_URL_ROOT is None or not os.path.exists(thumbnail_path(image_hash)):
+        return None
+    return f"{THUMBNAIL_URL_ROOT}/{thumbnail_relpath(image_hash)}"
+
+
+# ══════════════════════════════════════════════════════
+#  AUTH PAGES CSS (static/auth.css) + FUNCTIONS
+# ══════════════════════════════════════════════════════
+AUTH_CSS = stylesheet_links("auth.css")
+
 def show_login_page():
     st.markdown(AUTH_CSS, unsafe_allow_html=True)
     _, col, _ = st.columns([1, 1.2, 1])
@@ -225,10 +142,23 @@ def show_login_page():
                 st.markdown('<div class="auth-error"><i class="fa-solid fa-circle-exclamation"></i> Please fill in all fields.</div>', unsafe_allow_html=True)
             else:
                 user = get_user_by_username(username)
-                if user and verify_password(password, user["password_hash"]):
+                try:
+                    # Unknown usernames are checked against a dummy hash, so they take as long
+                    valid = verify_login(password, user["password_hash"] if user else None)
+                except AuthBusyError:
+                    valid = None
+                if valid:
+                    if needs_rehash(user["password_hash"]):
+                        # Upgrade legacy / lower-cost hashes without delaying the sign-in
+                        user_id = user["id"]
+                        rehash_password(password, lambda new_hash: update_password_hash(user_id, new_hash))
                     st.session_state.logged_in = True
                     st.session_state.user = {"id": user["id"], "username": user["username"], "email": user["email"]}
                     st.rerun()
+                elif valid is None:
+                    st.markdown('<div class="auth-error"><i class="fa-solid fa-hourglass-half"></i> Too many sign-ins right now. Please try again in a moment.</div>', unsafe_allow_html=True)
+                elif user is None and not database_available():
+                    st.markdown('<div class="auth-error"><i class="fa-solid fa-plug-circle-xmark"></i> Cannot reach the database right now. Please try again shortly.</div>', unsafe_allow_html=True)
                 else:
                     st.markdown('<div class="auth-error"><i class="fa-solid fa-triangle-exclamation"></i> Invalid username or password.</div>', unsafe_allow_html=True)
 
@@ -275,9 +205,14 @@ def show_register_page():
                 for err in errors:
                     st.markdown(f'<div class="auth-error"><i class="fa-solid fa-circle-exclamation"></i> {err}</div>', unsafe_allow_html=True)
             else:
-                pw_hash = hash_password(password)
-                success = create_user(username, email, pw_hash)
-                if success:
+                try:
+                    pw_hash = hash_password(password)
+                except AuthBusyError:
+                    pw_hash = None
+                success = pw_hash is not None and create_user(username, email, pw_hash)
+                if pw_hash is None:
+                    st.markdown('<div class="auth-error"><i class="fa-solid fa-hourglass-half"></i> Too many sign-ups right now. Please try again in a moment.</div>', unsafe_allow_html=True)
+                elif success:
                     st.markdown('<div class="auth-success"><i class="fa-solid fa-circle-check"></i> Account created! Please sign in.</div>', unsafe_allow_html=True)
                     st.session_state.auth_page = "login"
                     st.rerun()
@@ -302,440 +237,9 @@ if not st.session_state.logged_in:
     st.stop()
 
 # ══════════════════════════════════════════════════════
-#  CUSTOM CSS — Full Premium Theme
+#  CUSTOM CSS — Full Premium Theme (static/theme.css)
 # ══════════════════════════════════════════════════════
-st.markdown("""
-<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.1/css/all.min.css">
-<link href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@300;400;500;600;700;800&display=swap" rel="stylesheet">
-
-<style>
-    /* ═══ GLOBAL ═══ */
-    /* Target only text elements to avoid breaking Streamlit icons */
-    h1, h2, h3, h4, h5, h6, p, a, li, button, label, input, textarea,
-    .stMarkdown, .stButton, .stTextInput, .stSelectbox {
-        font-family: 'Plus Jakarta Sans', sans-serif !important;
-    }
-    .stApp {
-        background: #f0f2f5;
-    }
-    #MainMenu, footer { visibility: hidden; }
-
-    /* ═══ SIDEBAR ═══ */
-    section[data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #0f172a 0%, #1e293b 100%);
-        box-shadow: 4px 0 24px rgba(0,0,0,0.12);
-    }
-    section[data-testid="stSidebar"] [data-testid="stRadio"] > div {
-        gap: 2px !important;
-    }
-    section[data-testid="stSidebar"] [data-testid="stRadio"] label {
-        display: flex !important;
-        align-items: center !important;
-        gap: 12px !important;
-        color: #ffffff !important;
-        font-size: 0.95rem !important;
-        padding: 8px 18px !important;
-        border-radius: 10px !important;
-        transition: all 0.25s ease !important;
-        cursor: pointer !important;
-        border: 1px solid transparent !important;
-        font-weight: 500 !important;
-    }
-    section[data-testid="stSidebar"] [data-testid="stRadio"] label p {
-        color: #ffffff !important;
-        margin: 0 !important;
-        line-height: 1.2 !important;
-        font-weight: 500 !important;
-    }
-    section[data-testid="stSidebar"] [data-testid="stRadio"] label:hover {
-        background: rgba(99,102,241,0.15) !important;
-        border-color: rgba(99,102,241,0.2) !important;
-    }
-
-    /* ═══ BUTTONS ═══ */
-    .stButton > button {
-        background: linear-gradient(135deg, #6366f1 0%, #4f46e5 100%) !important;
-        color: #fff !important;
-        border: none !important;
-        border-radius: 12px !important;
-        padding: 14px 32px !important;
-        font-weight: 600 !important;
-        font-size: 0.95rem !important;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1) !important;
-        box-shadow: 0 4px 14px rgba(99,102,241,0.35) !important;
-        letter-spacing: 0.3px !important;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 8px 25px rgba(99,102,241,0.5) !important;
-        background: linear-gradient(135deg, #818cf8 0%, #6366f1 100%) !important;
-    }
-    .stButton > button:active {
-        transform: translateY(0px) !important;
-    }
-
-    /* ═══ HERO ═══ */
-    .hero-section {
-        position: relative;
-        border-radius: 24px;
-        overflow: hidden;
-        margin-bottom: 40px;
-        min-height: 420px;
-        display: flex;
-        align-items: center;
-    }
-    .hero-bg {
-        position: absolute;
-        inset: 0;
-        background: url('https://images.unsplash.com/photo-1574943320219-553eb213f72d?w=1400&q=80') center/cover no-repeat;
-    }
-    .hero-overlay {
-        position: absolute;
-        inset: 0;
-        background: linear-gradient(135deg, rgba(15,23,42,0.88) 0%, rgba(30,41,59,0.75) 50%, rgba(15,23,42,0.65) 100%);
-    }
-    .hero-content {
-        position: relative;
-        z-index: 2;
-        padding: 60px 55px;
-        width: 100%;
-    }
-    .hero-tag {
-        display: inline-flex;
-        align-items: center;
-        gap: 8px;
-        background: rgba(99,102,241,0.2);
-        border: 1px solid rgba(99,102,241,0.3);
-        color: #a5b4fc;
-        padding: 6px 16px;
-        border-radius: 20px;
-        font-size: 0.72rem;
-        font-weight: 700;
-        letter-spacing: 1.2px;
-        text-transform: uppercase;
-        margin-bottom: 20px;
-    }
-    .hero-title {
-        font-size: 3rem;
-        font-weight: 800;
-        color: #ffffff;
-        line-height: 1.15;
-        margin-bottom: 6px;
-    }
-    .hero-title span {
-        background: linear-gradient(135deg, #818cf8, #a78bfa);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-    }
-    .hero-subtitle {
-        font-size: 1rem;
-        color: #94a3b8;
-        margin-bottom: 16px;
-        font-weight: 400;
-    }
-    .hero-desc {
-        font-size: 0.9rem;
-        color: #64748b;
-        max-width: 520px;
-        line-height: 1.7;
-        margin-bottom: 32px;
-    }
-    .hero-stats-row {
-        display: flex;
-        gap: 32px;
-        margin-top: 8px;
-    }
-    .hero-stat {
-        text-align: center;
-    }
-    .hero-stat-val {
-        font-size: 1.6rem;
-        font-weight: 800;
-        color: #a5b4fc;
-    }
-    .hero-stat-lbl {
-        font-size: 0.68rem;
-        color: #64748b;
-        text-transform: uppercase;
-        letter-spacing: 0.8px;
-        font-weight: 600;
-    }
-
-    /* ═══ FEATURE CARDS ═══ */
-    .f-card {
-        background: #ffffff;
-        border-radius: 18px;
-        padding: 32px 24px;
-        text-align: center;
-        border: 1px solid #e5e7eb;
-        transition: all 0.35s cubic-bezier(0.4, 0, 0.2, 1);
-        cursor: default;
-    }
-    .f-card:hover {
-        transform: translateY(-6px);
-        box-shadow: 0 20px 40px rgba(0,0,0,0.08);
-        border-color: #c7d2fe;
-    }
-    .f-icon {
-        width: 64px;
-        height: 64px;
-        border-radius: 16px;
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.5rem;
-        margin-bottom: 18px;
-        color: #fff;
-    }
-    .f-icon.indigo { background: linear-gradient(135deg, #6366f1, #4f46e5); }
-    .f-icon.emerald { background: linear-gradient(135deg, #10b981, #059669); }
-    .f-icon.amber { background: linear-gradient(135deg, #f59e0b, #d97706); }
-    .f-card h4 {
-        font-size: 1.05rem;
-        font-weight: 700;
-        color: #1e293b;
-        margin: 0 0 8px 0;
-    }
-    .f-card p {
-        font-size: 0.85rem;
-        color: #64748b;
-        line-height: 1.6;
-        margin: 0;
-    }
-
-    /* ═══ STEPS ═══ */
-    .step-wrap {
-        text-align: center;
-        padding: 10px;
-    }
-    .step-num {
-        width: 44px; height: 44px;
-        border-radius: 12px;
-        background: linear-gradient(135deg, #6366f1, #8b5cf6);
-        color: #fff;
-        font-weight: 800;
-        font-size: 1rem;
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        margin-bottom: 12px;
-        box-shadow: 0 4px 12px rgba(99,102,241,0.3);
-    }
-    .step-wrap p {
-        font-size: 0.82rem;
-        color: #475569;
-        line-height: 1.5;
-        margin: 0;
-    }
-
-    /* ═══ SECTION HEADER ═══ */
-    .sec-header {
-        text-align: center;
-        margin-bottom: 28px;
-    }
-    .sec-header h3 {
-        font-size: 1.4rem;
-        font-weight: 700;
-        color: #1e293b;
-        margin: 0 0 4px 0;
-    }
-    .sec-header p {
-        font-size: 0.85rem;
-        color: #94a3b8;
-        margin: 0;
-    }
-
-    /* ═══ DIVIDER ═══ */
-    .sep { border:0; height:1px; background:#e5e7eb; margin:36px 0; }
-
-    /* ═══ PAGE HEADER ═══ */
-    .pg-h { font-size:1.6rem; font-weight:800; color:#1e293b; margin-bottom:2px; }
-    .pg-sub { font-size:0.88rem; color:#94a3b8; margin-bottom:24px; }
-    .col-h { font-size:1rem; font-weight:700; color:#334155; margin-bottom:4px; }
-    .col-sub { font-size:0.78rem; color:#94a3b8; margin-bottom:14px; }
-
-    /* ═══ DETECT PAGE BANNER ═══ */
-    .detect-banner {
-        background: linear-gradient(135deg, #1e293b 0%, #334155 100%);
-        border-radius: 18px;
-        padding: 36px 40px;
-        margin-bottom: 30px;
-        position: relative;
-        overflow: hidden;
-    }
-    .detect-banner::before {
-        content: "";
-        position: absolute;
-        top: -40px; right: -40px;
-        width: 180px; height: 180px;
-        border-radius: 50%;
-        background: radial-gradient(circle, rgba(99,102,241,0.2), transparent 70%);
-    }
-    .detect-banner h2 {
-        color: #f8fafc;
-        font-size: 1.6rem;
-        font-weight: 800;
-        margin: 0 0 6px 0;
-        position: relative;
-        z-index: 1;
-    }
-    .detect-banner p {
-        color: #94a3b8;
-        font-size: 0.88rem;
-        margin: 0;
-        position: relative;
-        z-index: 1;
-    }
-
-    /* ═══ UPLOAD CARD WRAPPER ═══ */
-    .upload-wrap {
-        background: #ffffff;
-        border-radius: 16px;
-        padding: 28px;
-        border: 1px solid #e5e7eb;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.03);
-    }
-
-    /* ═══ RESULT CARDS ═══ */
-    .r-card {
-        background: #ffffff;
-        border-radius: 14px;
-        padding: 18px 22px;
-        border: 1px solid #e5e7eb;
-        border-left: 4px solid #6366f1;
-        margin-bottom: 10px;
-        transition: all 0.25s cubic-bezier(0.4,0,0.2,1);
-    }
-    .r-card:hover {
-        box-shadow: 0 6px 20px rgba(0,0,0,0.06);
-        transform: translateX(2px);
-    }
-    .r-card.green { border-left-color: #10b981; }
-    .r-card.amber { border-left-color: #f59e0b; }
-    .r-card.red   { border-left-color: #ef4444; }
-    .r-label {
-        font-size: 0.68rem;
-        color: #94a3b8;
-        font-weight: 700;
-        text-transform: uppercase;
-        letter-spacing: 1.2px;
-        margin-bottom: 4px;
-    }
-    .r-val {
-        font-size: 1.5rem;
-        font-weight: 800;
-        color: #1e293b;
-    }
-    .r-val-sm {
-        font-size: 0.9rem;
-        color: #475569;
-        line-height: 1.65;
-    }
-
-    /* ═══ SEVERITY ═══ */
-    .sv-none { color: #10b981 !important; }
-    .sv-low { color: #eab308 !important; }
-    .sv-mod { color: #f97316 !important; }
-    .sv-high { color: #ef4444 !important; }
-
-    /* ═══ TREATMENT BOX ═══ */
-    .tx-box {
-        background: linear-gradient(135deg, #fefce8, #fffbeb);
-        border: 1px solid #fde68a;
-        border-radius: 16px;
-        padding: 24px;
-        margin-top: 10px;
-    }
-    .tx-title {
-        font-size: 1rem;
-        font-weight: 700;
-        color: #92400e;
-        margin-bottom: 14px;
-        display: flex;
-        align-items: center;
-        gap: 8px;
-    }
-    .tx-item {
-        font-size: 0.86rem;
-        color: #78350f;
-        padding: 9px 0;
-        border-bottom: 1px solid rgba(253,230,138,0.5);
-        display: flex;
-        align-items: flex-start;
-        gap: 10px;
-        line-height: 1.55;
-    }
-    .tx-item:last-child { border-bottom: none; }
-    .tx-check {
-        color: #16a34a;
-        font-size: 0.85rem;
-        margin-top: 2px;
-        flex-shrink: 0;
-    }
-
-    /* ═══ EMPTY STATE ═══ */
-    .empty-state {
-        text-align: center;
-        padding: 50px 24px;
-        background: #ffffff;
-        border-radius: 16px;
-        border: 2px dashed #e2e8f0;
-    }
-    .empty-icon {
-        width: 72px; height: 72px;
-        border-radius: 50%;
-        background: linear-gradient(135deg, #eef2ff, #e0e7ff);
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        margin-bottom: 16px;
-    }
-    .empty-icon i {
-        font-size: 1.6rem;
-        color: #6366f1;
-    }
-    .empty-state h4 {
-        font-size: 1rem;
-        font-weight: 700;
-        color: #334155;
-        margin: 0 0 6px 0;
-    }
-    .empty-state p {
-        font-size: 0.82rem;
-        color: #94a3b8;
-        margin: 0;
-        line-height: 1.5;
-    }
-
-    /* ═══ FOOTER ═══ */
-    .app-ft {
-        text-align: center;
-        padding: 30px 0 10px 0;
-        font-size: 0.75rem;
-        color: #94a3b8;
-    }
-    .app-ft a {
-        color: #6366f1;
-        text-decoration: none;
-    }
-
-    /* ═══ FILE UPLOADER ═══ */
-    [data-testid="stFileUploader"] section {
-        border: 2px dashed #d1d5db !important;
-        border-radius: 14px !important;
-        transition: border-color 0.2s ease !important;
-    }
-    [data-testid="stFileUploader"] section:hover {
-        border-color: #6366f1 !important;
-    }
-
-    /* ═══ PROGRESS BAR ═══ */
-    .stProgress > div > div > div {
-        background: linear-gradient(90deg, #10b981, #eab308, #f97316, #ef4444) !important;
-        border-radius: 6px !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(stylesheet_links("theme.css"), unsafe_allow_html=True)
 
 
 # ══════════════════════════════════════════════════════
@@ -836,34 +340,16 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
-    # Logout button with custom red style
-    st.markdown("""
-    <style>
-    div[data-testid="stSidebar"] .stButton > button {
-        background: linear-gradient(135deg, #ef4444, #dc2626) !important;
-        color: #fff !important;
-        border: none !important;
-        border-radius: 10px !important;
-        padding: 9px 18px !important;
-        font-weight: 600 !important;
-        font-size: 0.82rem !important;
-        margin: 0 8px !important;
-        width: calc(100% - 16px) !important;
-        transition: all 0.2s ease !important;
-        box-shadow: 0 2px 10px rgba(239,68,68,0.3) !important;
-    }
-    div[data-testid="stSidebar"] .stButton > button:hover {
-        box-shadow: 0 4px 18px rgba(239,68,68,0.5) !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
+    # Sign out (red button style in static/theme.css)
     if st.button("🚪  Sign Out", key="logout_btn"):
         st.session_state.logged_in = False
         st.session_state.user = None
         st.session_state.auth_page = "login"
         st.rerun()
 
+if not database_available():
+    st.warning("Database unreachable — history and stats may be incomplete. New scans are kept locally and saved once it is back.")
+
 
 # ══════════════════════════════════════════════════════
 #  HOME PAGE
@@ -964,68 +450,73 @@ if app_mode == "🏠  Home":
     </div>
     """, unsafe_allow_html=True)
 
-    inp_col, btn_col = st.columns([3, 1])
-    with inp_col:
-        city_input = st.text_input(
-            "🏙️  City Name",
-            placeholder="e.g.  Mumbai,  Delhi,  Pune,  Nagpur ...",
-            key="weather_city",
-        )
-    with btn_col:
-        st.markdown("<br>", unsafe_allow_html=True)
-        search_clicked = st.button("🔍  Check Weather", use_container_width=True, key="weather_search")
-
-    if city_input and (search_clicked or True):
-        weather = get_weather(city_input.strip())
-        if weather:
-            temp      = weather["main"]["temp"]
-            humidity  = weather["main"]["humidity"]
-            feels     = weather["main"]["feels_like"]
-            wind      = weather["wind"]["speed"]
-            condition = weather["weather"][0]["main"]
-            desc      = weather["weather"][0]["description"].title()
-            emoji     = weather_icon_emoji(condition)
-            risk      = assess_disease_risk(temp, humidity, condition)
-
-            wc1, wc2, wc3, wc4 = st.columns(4)
-            for col, label, val, icon, color in [
-                (wc1, "Temperature",  f"{temp:.1f}°C",  "fa-thermometer-half",  "#6366f1"),
-                (wc2, "Humidity",     f"{humidity}%",   "fa-droplet",           "#3b82f6"),
-                (wc3, "Condition",    f"{emoji} {desc}","fa-cloud-sun",         "#8b5cf6"),
-                (wc4, "Wind Speed",   f"{wind} m/s",    "fa-wind",              "#10b981"),
-            ]:
-                with col:
-                    st.markdown(f"""
-                    <div style='background:#fff;border-radius:14px;padding:18px 20px;
-                         border:1px solid #e5e7eb;text-align:center;'>
-                        <i class='fa-solid {icon}' style='color:{color};font-size:1.3rem;'></i>
-                        <div style='font-size:1.2rem;font-weight:800;color:#1e293b;margin:8px 0 2px 0;'>{val}</div>
-                        <div style='font-size:0.7rem;color:#94a3b8;font-weight:600;
-                             text-transform:uppercase;letter-spacing:1px;'>{label}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-
+    # Typing a city or pressing Check Weather reruns only the widget
+    @st.fragment
+    def weather_panel():
+        inp_col, btn_col = st.columns([3, 1])
+        with inp_col:
+            city_input = st.text_input(
+                "🏙️  City Name",
+                placeholder="e.g.  Mumbai,  Delhi,  Pune,  Nagpur ...",
+                key="weather_city",
+            )
+        with btn_col:
             st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown(f"""
-            <div style='background:{risk["bg"]};border:1px solid {risk["border"]};
-                 border-left:4px solid {risk["color"]};border-radius:14px;
-                 padding:16px 22px;display:flex;align-items:flex-start;gap:14px;'>
-                <i class='fa-solid {risk["icon"]}' style='color:{risk["color"]};font-size:1.3rem;margin-top:2px;'></i>
-                <div>
-                    <div style='font-size:0.85rem;font-weight:700;color:{risk["color"]};
-                         margin-bottom:4px;'>Disease Risk: {risk["level"]}</div>
-                    <div style='font-size:0.82rem;color:#475569;line-height:1.5;'>{risk["message"]}</div>
+            search_clicked = st.button("🔍  Check Weather", use_container_width=True, key="weather_search")
+
+        if city_input and (search_clicked or True):
+            weather = get_weather(city_input.strip())
+            if weather:
+                temp      = weather["main"]["temp"]
+                humidity  = weather["main"]["humidity"]
+                feels     = weather["main"]["feels_like"]
+                wind      = weather["wind"]["speed"]
+                condition = weather["weather"][0]["main"]
+                desc      = weather["weather"][0]["description"].title()
+                emoji     = weather_icon_emoji(condition)
+                risk      = assess_disease_risk(temp, humidity, condition)
+
+                wc1, wc2, wc3, wc4 = st.columns(4)
+                for col, label, val, icon, color in [
+                    (wc1, "Temperature",  f"{temp:.1f}°C",  "fa-thermometer-half",  "#6366f1"),
+                    (wc2, "Humidity",     f"{humidity}%",   "fa-droplet",           "#3b82f6"),
+                    (wc3, "Condition",    f"{emoji} {desc}","fa-cloud-sun",         "#8b5cf6"),
+                    (wc4, "Wind Speed",   f"{wind} m/s",    "fa-wind",              "#10b981"),
+                ]:
+                    with col:
+                        st.markdown(f"""
+                        <div style='background:#fff;border-radius:14px;padding:18px 20px;
+                             border:1px solid #e5e7eb;text-align:center;'>
+                            <i class='fa-solid {icon}' style='color:{color};font-size:1.3rem;'></i>
+                            <div style='font-size:1.2rem;font-weight:800;color:#1e293b;margin:8px 0 2px 0;'>{val}</div>
+                            <div style='font-size:0.7rem;color:#94a3b8;font-weight:600;
+                                 text-transform:uppercase;letter-spacing:1px;'>{label}</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown(f"""
+                <div style='background:{risk["bg"]};border:1px solid {risk["border"]};
+                     border-left:4px solid {risk["color"]};border-radius:14px;
+                     padding:16px 22px;display:flex;align-items:flex-start;gap:14px;'>
+                    <i class='fa-solid {risk["icon"]}' style='color:{risk["color"]};font-size:1.3rem;margin-top:2px;'></i>
+                    <div>
+                        <div style='font-size:0.85rem;font-weight:700;color:{risk["color"]};
+                             margin-bottom:4px;'>Disease Risk: {risk["level"]}</div>
+                        <div style='font-size:0.82rem;color:#475569;line-height:1.5;'>{risk["message"]}</div>
+                    </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
-        elif weather is None:
-            st.markdown("""
-            <div style='background:#fef2f2;border:1px solid #fecaca;border-radius:12px;
-                 padding:14px 18px;color:#dc2626;font-size:0.85rem;'>
-                <i class='fa-solid fa-triangle-exclamation' style='margin-right:8px;'></i>
-                City not found or API key not configured. Please check the city name.
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
+            elif weather is None:
+                st.markdown("""
+                <div style='background:#fef2f2;border:1px solid #fecaca;border-radius:12px;
+                     padding:14px 18px;color:#dc2626;font-size:0.85rem;'>
+                    <i class='fa-solid fa-triangle-exclamation' style='margin-right:8px;'></i>
+                    City not found or API key not configured. Please check the city name.
+                </div>
+                """, unsafe_allow_html=True)
+
+    weather_panel()
 
     st.markdown("<hr class='sep'>", unsafe_allow_html=True)
 
@@ -1087,175 +578,191 @@ elif app_mode == "🔬  Detect Disease":
     </div>
     """, unsafe_allow_html=True)
 
-    col_upload, col_result = st.columns([1, 1], gap="large")
+    # Uploading, analysing and the report button rerun only this panel
+    @st.fragment
+    def detect_panel():
+        col_upload, col_result = st.columns([1, 1], gap="large")
 
-    # ── Upload Column ──
-    with col_upload:
-        st.markdown("""
-        <div style='display:flex; align-items:center; gap:10px; margin-bottom:16px;'>
-            <div style='width:36px; height:36px; border-radius:10px; background:linear-gradient(135deg,#6366f1,#818cf8); display:flex; align-items:center; justify-content:center;'>
-                <i class='fa-solid fa-cloud-arrow-up' style='color:#fff; font-size:0.85rem;'></i>
-            </div>
-            <div>
-                <div style='font-size:0.95rem; font-weight:700; color:#1e293b;'>Upload Leaf Image</div>
-                <div style='font-size:0.72rem; color:#94a3b8;'>Drag & drop or browse — JPG, PNG, JPEG</div>
+        # ── Upload Column ──
+        with col_upload:
+            st.markdown("""
+            <div style='display:flex; align-items:center; gap:10px; margin-bottom:16px;'>
+                <div style='width:36px; height:36px; border-radius:10px; background:linear-gradient(135deg,#6366f1,#818cf8); display:flex; align-items:center; justify-content:center;'>
+                    <i class='fa-solid fa-cloud-arrow-up' style='color:#fff; font-size:0.85rem;'></i>
+                </div>
+                <div>
+                    <div style='font-size:0.95rem; font-weight:700; color:#1e293b;'>Upload Leaf Image</div>
+                    <div style='font-size:0.72rem; color:#94a3b8;'>Drag & drop or browse — JPG, PNG, JPEG</div>
+                </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
 
-        uploaded_file = st.file_uploader("Upload image", type=["jpg", "png", "jpeg"], label_visibility="collapsed")
+            uploaded_file = st.file_uploader("Upload image", type=["jpg", "png", "jpeg"], label_visibility="collapsed")
+
+            if uploaded_file is not None:
+                image = Image.open(uploaded_file)
+                st.markdown("<div class='upload-wrap'>", unsafe_allow_html=True)
+                st.image(image, caption="Uploaded Leaf Image", use_container_width=True)
+                st.markdown("</div>", unsafe_allow_html=True)
+                detect_city = st.text_input(
+                    "📍  Your location (optional)",
+                    placeholder="City or town, to include today's weather risk",
+                    key="detect_city",
+                )
+                predict_clicked = st.button("🔍  Analyze Disease", use_container_width=True)
+            else:
+                predict_clicked = False
+                st.markdown("""
+                <div class="empty-state">
+                    <div class="empty-icon"><i class="fa-solid fa-leaf"></i></div>
+                    <h4>No Image Uploaded</h4>
+                    <p>Choose or drag a leaf photo above to start analysis</p>
+                </div>
+                """, unsafe_allow_html=True)
 
-        if uploaded_file is not None:
-            image = Image.open(uploaded_file)
-            st.markdown("<div class='upload-wrap'>", unsafe_allow_html=True)
-            st.image(image, caption="Uploaded Leaf Image", use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-            predict_clicked = st.button("🔍  Analyze Disease", use_container_width=True)
-        else:
-            predict_clicked = False
+        # ── Results Column ──
+        with col_result:
             st.markdown("""
-            <div class="empty-state">
-                <div class="empty-icon"><i class="fa-solid fa-leaf"></i></div>
-                <h4>No Image Uploaded</h4>
-                <p>Choose or drag a leaf photo above to start analysis</p>
+            <div style='display:flex; align-items:center; gap:10px; margin-bottom:16px;'>
+                <div style='width:36px; height:36px; border-radius:10px; background:linear-gradient(135deg,#10b981,#34d399); display:flex; align-items:center; justify-content:center;'>
+                    <i class='fa-solid fa-chart-column' style='color:#fff; font-size:0.85rem;'></i>
+                </div>
+                <div>
+                    <div style='font-size:0.95rem; font-weight:700; color:#1e293b;'>Analysis Results</div>
+                    <div style='font-size:0.72rem; color:#94a3b8;'>Disease diagnosis & treatment info</div>
+                </div>
             </div>
             """, unsafe_allow_html=True)
 
-    # ── Results Column ──
-    with col_result:
-        st.markdown("""
-        <div style='display:flex; align-items:center; gap:10px; margin-bottom:16px;'>
-            <div style='width:36px; height:36px; border-radius:10px; background:linear-gradient(135deg,#10b981,#34d399); display:flex; align-items:center; justify-content:center;'>
-                <i class='fa-solid fa-chart-column' style='color:#fff; font-size:0.85rem;'></i>
-            </div>
-            <div>
-                <div style='font-size:0.95rem; font-weight:700; color:#1e293b;'>Analysis Results</div>
-                <div style='font-size:0.72rem; color:#94a3b8;'>Disease diagnosis & treatment info</div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+            if uploaded_file is not None and predict_clicked:
+                with st.spinner("🧠 AI is analyzing the image..."):
+                    try:
+                        model = load_model()
+
+                        # Inference and the weather lookup run at the same time;
+                        # a slow weather API only costs the weather card
+                        diagnosis = diagnose(uploaded_file.getvalue(), detect_city, model, RESULT_BUNDLES)
+                        bundle, conf = diagnosis["bundle"], diagnosis["confidence"]
+
+                        # Keep the image (deduplicated, with a thumbnail) for History and
+                        # audits; only the hash is computed here, the writes happen in the background
+                        image_hash = store_image_in_background(uploaded_file.getvalue())
+
+                        # Auto-save scan to database (batched in the background)
+                        enqueue_scan(
+                            user_id=st.session_state.user["id"],
+                            disease_name=bundle.display_name,
+                            confidence=round(conf, 2),
+                            severity=bundle.severity,
+                            image_hash=image_hash
+                        )
 
-        if uploaded_file is not None and predict_clicked:
-            with st.spinner("🧠 AI is analyzing the image..."):
-                try:
-                    processed_image = preprocess_image(image)
-                    model = load_model()
-                    class_indices = load_class_indices()
-                    class_names = {v: k for k, v in class_indices.items()}
-
-                    predictions = model.predict(processed_image)
-                    idx = np.argmax(predictions)
-                    name = class_names[idx]
-                    conf = float(predictions[0][idx]) * 100
-                    info = get_recommendation(name)
-
-                    severity = info["severity"]
-                    sev_cls, sev_score = "sv-none", 0
-                    sev_card = "green"
-                    if severity == "Low":
-                        sev_cls, sev_score, sev_card = "sv-low", 25, "amber"
-                    elif severity == "Moderate":
-                        sev_cls, sev_score, sev_card = "sv-mod", 50, "amber"
-                    elif severity == "High":
-                        sev_cls, sev_score, sev_card = "sv-high", 85, "red"
-
-                    display_name = name.replace("_", " ")
-
-                    # Auto-save scan to database
-                    save_scan(
-                        user_id=st.session_state.user["id"],
-                        disease_name=display_name,
-                        confidence=round(conf, 2),
-                        severity=severity
-                    )
+                        # Kept in the session so the results, and the report button,
+                        # survive the reruns that widget clicks cause
+                        st.session_state.last_result = {
+                            "upload_id": uploaded_file.file_id,
+                            "bundle": bundle,
+                            "conf": conf,
+                            "weather": diagnosis["weather"],
+                            "weather_status": diagnosis["weather_status"],
+                            "weather_risk": diagnosis["weather_risk"],
+                            "outlook": diagnosis["outlook"],
+                            "scanned_at": datetime.now(),
+                        }
+
+                    except Exception as e:
+                        st.error(f"⚠️ Error: {e}")
+
+            result = st.session_state.get("last_result")
+            if uploaded_file is not None and result and "bundle" in result and result["upload_id"] == uploaded_file.file_id:
+                bundle, conf = result["bundle"], result["conf"]
+
+                # Success indicator
+                st.markdown("""
+                <div style='background:linear-gradient(135deg,#ecfdf5,#f0fdf4); border:1px solid #bbf7d0; border-radius:12px; padding:14px 18px; margin-bottom:12px; display:flex; align-items:center; gap:10px;'>
+                    <i class='fa-solid fa-circle-check' style='color:#16a34a; font-size:1.1rem;'></i>
+                    <span style='font-size:0.85rem; color:#166534; font-weight:600;'>Analysis completed successfully — saved to history</span>
+                </div>
+                """, unsafe_allow_html=True)
 
-                    # Success indicator
-                    st.markdown("""
-                    <div style='background:linear-gradient(135deg,#ecfdf5,#f0fdf4); border:1px solid #bbf7d0; border-radius:12px; padding:14px 18px; margin-bottom:12px; display:flex; align-items:center; gap:10px;'>
-                        <i class='fa-solid fa-circle-check' style='color:#16a34a; font-size:1.1rem;'></i>
-                        <span style='font-size:0.85rem; color:#166534; font-weight:600;'>Analysis completed successfully — saved to history</span>
-                    </div>
-                    """, unsafe_allow_html=True)
+                # Disease Name
+                st.markdown(bundle.disease_html, unsafe_allow_html=True)
 
-                    # Disease Name
+                # Confidence & Severity
+                rc1, rc2 = st.columns(2)
+                with rc1:
                     st.markdown(f"""
                     <div class="r-card">
-                        <div class="r-label"><i class="fa-solid fa-virus" style="margin-right:4px; color:#6366f1;"></i>Detected Disease</div>
-                        <div class="r-val">{display_name}</div>
+                        <div class="r-label"><i class="fa-solid fa-bullseye" style="margin-right:4px; color:#6366f1;"></i>Confidence</div>
+                        <div class="r-val" style="color:#6366f1;">{conf:.1f}%</div>
                     </div>
                     """, unsafe_allow_html=True)
+                with rc2:
+                    st.markdown(bundle.severity_html, unsafe_allow_html=True)
 
-                    # Confidence & Severity
-                    rc1, rc2 = st.columns(2)
-                    with rc1:
-                        st.markdown(f"""
-                        <div class="r-card">
-                            <div class="r-label"><i class="fa-solid fa-bullseye" style="margin-right:4px; color:#6366f1;"></i>Confidence</div>
-                            <div class="r-val" style="color:#6366f1;">{conf:.1f}%</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    with rc2:
-                        st.markdown(f"""
-                        <div class="r-card {sev_card}">
-                            <div class="r-label"><i class="fa-solid fa-gauge-high" style="margin-right:4px;"></i>Severity</div>
-                            <div class="r-val {sev_cls}">{severity}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                    st.progress(sev_score)
+                st.progress(bundle.severity_score)
 
-                    # Description
+                # Weather risk at the scan's location, combined with the diagnosis
+                risk, outlook, wx = result.get("weather_risk"), result.get("outlook"), result.get("weather")
+                if risk and outlook:
                     st.markdown(f"""
-                    <div class="r-card green">
-                        <div class="r-label"><i class="fa-solid fa-circle-info" style="margin-right:4px; color:#10b981;"></i>About This Disease</div>
-                        <div class="r-val-sm">{info['description']}</div>
+                    <div style='background:{risk["bg"]};border:1px solid {risk["border"]};
+                         border-left:4px solid {risk["color"]};border-radius:14px;
+                         padding:14px 18px;margin-bottom:12px;display:flex;align-items:flex-start;gap:12px;'>
+                        <i class='fa-solid {risk["icon"]}' style='color:{risk["color"]};font-size:1.1rem;margin-top:2px;'></i>
+                        <div>
+                            <div style='font-size:0.82rem;font-weight:700;color:{risk["color"]};margin-bottom:4px;'>
+                                Overall Risk: {outlook["level"]} · Weather in {wx["city"]}: {wx["temp"]:.0f}°C,
+                                {wx["humidity"]}% humidity, {wx["condition"]}
+                            </div>
+                            <div style='font-size:0.8rem;color:#475569;line-height:1.5;'>{outlook["message"]}</div>
+                        </div>
                     </div>
                     """, unsafe_allow_html=True)
-
-                    # Treatment
-                    items = "".join(
-                        f'<div class="tx-item"><span class="tx-check"><i class="fa-solid fa-circle-check"></i></span>{t}</div>'
-                        for t in info["treatment"]
+                elif result.get("weather_status") in ("timeout", "unavailable", "not_found"):
+                    reason = {"not_found": "location not found",
+                              "timeout": "the weather service did not respond in time",
+                              "unavailable": "the weather service is unavailable"}[result["weather_status"]]
+                    st.caption(f"🌤️ Weather risk not included — {reason}.")
+
+                # Description & Treatment
+                st.markdown(bundle.description_html, unsafe_allow_html=True)
+                st.markdown(bundle.treatment_html, unsafe_allow_html=True)
+
+                # ── PDF Report (rendered only when asked for, then cached) ──
+                st.markdown("<br>", unsafe_allow_html=True)
+                if "pdf" not in result:
+                    if st.button("📄  Create PDF Report", key="make_report", use_container_width=True):
+                        try:
+                            result["pdf"] = generate_report_pdf(
+                                username=st.session_state.user["username"],
+                                disease_name=bundle.display_name,
+                                confidence=conf,
+                                severity=bundle.severity,
+                                description=bundle.description,
+                                treatments=bundle.treatments,
+                                scanned_at=result["scanned_at"],
+                            )
+                        except Exception as pdf_err:
+                            st.warning(f"Could not generate PDF: {pdf_err}")
+                if "pdf" in result:
+                    st.download_button(
+                        label="📥  Download PDF Report",
+                        data=result["pdf"],
+                        file_name=bundle.report_filename,
+                        mime="application/pdf",
+                        use_container_width=True,
                     )
-                    st.markdown(f"""
-                    <div class="tx-box">
-                        <div class="tx-title"><i class="fa-solid fa-kit-medical"></i> Treatment Recommendations</div>
-                        {items}
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                    # ── Download PDF Report ──
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    try:
-                        pdf_bytes = generate_report_pdf(
-                            username=st.session_state.user["username"],
-                            disease_name=display_name,
-                            confidence=conf,
-                            severity=severity,
-                            description=info.get("description", ""),
-                            treatments=info.get("treatment", []),
-                        )
-                        fname = f"CropGuard_Report_{display_name.replace(' ', '_')}.pdf"
-                        st.download_button(
-                            label="📥  Download PDF Report",
-                            data=pdf_bytes,
-                            file_name=fname,
-                            mime="application/pdf",
-                            use_container_width=True,
-                        )
-                    except Exception as pdf_err:
-                        st.warning(f"Could not generate PDF: {pdf_err}")
+            else:
+                st.markdown("""
+                <div class="empty-state">
+                    <div class="empty-icon"><i class="fa-solid fa-chart-pie"></i></div>
+                    <h4>Awaiting Analysis</h4>
+                    <p>Upload an image and click "Analyze Disease" to see results here</p>
+                </div>
+                """, unsafe_allow_html=True)
 
-                except Exception as e:
-                    st.error(f"⚠️ Error: {e}")
-        else:
-            st.markdown("""
-            <div class="empty-state">
-                <div class="empty-icon"><i class="fa-solid fa-chart-pie"></i></div>
-                <h4>Awaiting Analysis</h4>
-                <p>Upload an image and click "Analyze Disease" to see results here</p>
-            </div>
-            """, unsafe_allow_html=True)
+    detect_panel()
 
     st.markdown('<div class="app-ft"><p>© 2026 <strong>CropGuard AI</strong></p></div>', unsafe_allow_html=True)
 
@@ -1277,9 +784,11 @@ elif app_mode == "\U0001f4dc  History":
     </div>
     """, unsafe_allow_html=True)
 
-    scans = get_scan_history(st.session_state.user["id"])
+    user_id = st.session_state.user["id"]
+    # Stats cover the full history, not just the rows listed below
+    summary = get_dashboard_summary(user_id)
 
-    if not scans:
+    if not summary["total"]:
         st.markdown("""
         <div style='text-align:center; padding:60px 24px; background:#fff;
              border-radius:18px; border:2px dashed #e2e8f0;'>
@@ -1293,9 +802,9 @@ elif app_mode == "\U0001f4dc  History":
         </div>
         """, unsafe_allow_html=True)
     else:
-        total     = len(scans)
-        high_risk = sum(1 for s in scans if s["severity"] == "High")
-        avg_conf  = sum(s["confidence"] for s in scans) / total
+        total     = summary["total"]
+        high_risk = summary["high_risk"]
+        avg_conf  = summary["avg_confidence"]
 
         c1, c2, c3 = st.columns(3)
         stat_data = [
@@ -1317,39 +826,119 @@ elif app_mode == "\U0001f4dc  History":
 
         st.markdown("<br>", unsafe_allow_html=True)
 
-        sev_colors = {"None": "#10b981", "Low": "#eab308", "Moderate": "#f97316", "High": "#ef4444"}
-        sev_bg     = {"None": "#ecfdf5", "Low": "#fefce8", "Moderate": "#fff7ed",  "High": "#fef2f2"}
-
-        for scan in scans:
-            sev   = scan.get("severity", "None")
-            color = sev_colors.get(sev, "#94a3b8")
-            bg    = sev_bg.get(sev, "#f8fafc")
-            ts    = scan["scanned_at"].strftime("%d %b %Y, %I:%M %p") if scan.get("scanned_at") else "N/A"
-            st.markdown(f"""
-            <div style='background:#fff;border:1px solid #e5e7eb;border-left:4px solid {color};
-                 border-radius:14px;padding:18px 22px;margin-bottom:10px;
-                 display:flex;align-items:center;justify-content:space-between;flex-wrap:wrap;gap:10px;'>
-                <div style='flex:1;min-width:180px;'>
-                    <div style='font-size:0.95rem;font-weight:700;color:#1e293b;margin-bottom:4px;'>
-                        <i class='fa-solid fa-leaf' style='color:{color};margin-right:6px;'></i>
-                        {scan["disease_name"]}
-                    </div>
-                    <div style='font-size:0.75rem;color:#94a3b8;'>
-                        <i class='fa-regular fa-clock' style='margin-right:4px;'></i>{ts}
+        # Export, filters, the list and "Load more" rerun on their own; the stats above stay put
+        @st.fragment
+        def history_panel(user_id, total):
+            # ── Export (streamed from the database to a temp file, then offered) ──
+            with st.expander("Export full history"):
+                if total > APP_EXPORT_MAX_ROWS:
+                    st.info(f"Downloads here are limited to {APP_EXPORT_MAX_ROWS:,} scans and your history has "
+                            f"{total:,}. Ask your administrator for a full export with "
+                            f"`python -m utils.export --user {st.session_state.user['username']}`.")
+                else:
+                    e1, e2 = st.columns([1, 2])
+                    with e1:
+                        export_fmt = st.selectbox("Format", EXPORT_FORMATS, key="export_fmt")
+                    with e2:
+                        st.markdown("<div style='height:28px'></div>", unsafe_allow_html=True)
+                        if st.button("Prepare export", key="export_prepare"):
+                            if "export_file" in st.session_state:
+                                remove_export_file(st.session_state.export_file[0])
+                                del st.session_state.export_file
+                            try:
+                                path = prepare_export_file(export_fmt, [user_id])
+                                st.session_state.export_file = (path, export_fmt, user_id)
+                            except Exception as e:
+                                st.error(f"Export failed: {e}")
+                # Only offer a file prepared for the signed-in user
+                if st.session_state.get("export_file", (None, None, None))[2] == user_id:
+                    path, fmt, _ = st.session_state.export_file
+                    try:
+                        with open(path, "rb") as f:
+                            st.download_button(f"Download {fmt.upper()}", f, file_name=f"cropguard_scans.{fmt}",
+                                               mime=MEDIA_TYPES[fmt], key="export_download")
+                    except FileNotFoundError:
+                        # Swept after EXPORT_FILE_TTL
+                        del st.session_state.export_file
+                        st.caption("That export has expired. Prepare it again to download.")
+
+            # ── Filters (applied in the database) ──
+            f1, f2, f3, f4 = st.columns([2, 1, 2, 1.5])
+            with f1:
+                disease = st.selectbox("Disease", ["All"] + sorted(b.display_name for b in RESULT_BUNDLES),
+                                       key="hist_disease")
+            with f2:
+                severity = st.selectbox("Severity", ["All", "None", "Low", "Moderate", "High"], key="hist_severity")
+            with f3:
+                date_range = st.date_input("Date range", value=(), key="hist_dates")
+            with f4:
+                min_conf = st.slider("Min confidence %", 0, 100, 0, 5, key="hist_conf")
+
+            filters = {
+                "disease":        None if disease == "All" else disease,
+                "severity":       None if severity == "All" else severity,
+                "date_from":      date_range[0] if len(date_range) > 0 else None,
+                "date_to":        date_range[1] if len(date_range) > 1 else None,
+                "min_confidence": min_conf or None,
+            }
+
+            # Pages are fetched on demand and kept across reruns; a new scan or
+            # a filter change starts again from the first page.
+            page_key = (user_id, total, tuple(filters.values()))
+            if st.session_state.get("history_key") != page_key:
+                st.session_state.history_key = page_key
+                st.session_state.history_scans, st.session_state.history_cursor = get_scan_history_page(user_id, **filters)
+            scans = st.session_state.history_scans
+
+            if not scans:
+                st.info("No scans match these filters.")
+
+            sev_colors = {"None": "#10b981", "Low": "#eab308", "Moderate": "#f97316", "High": "#ef4444"}
+            sev_bg     = {"None": "#ecfdf5", "Low": "#fefce8", "Moderate": "#fff7ed",  "High": "#fef2f2"}
+
+            for scan in scans:
+                sev   = scan.get("severity", "None")
+                color = sev_colors.get(sev, "#94a3b8")
+                bg    = sev_bg.get(sev, "#f8fafc")
+                ts    = scan["scanned_at"].strftime("%d %b %Y, %I:%M %p") if scan.get("scanned_at") else "N/A"
+                thumb = thumbnail_url(scan["image_hash"]) if scan.get("image_hash") else None
+                thumb_html = (f"<img src='{thumb}' style='width:56px;height:56px;object-fit:cover;"
+                              f"border-radius:10px;border:1px solid #e5e7eb;'>") if thumb else ""
+                st.markdown(f"""
+                <div style='background:#fff;border:1px solid #e5e7eb;border-left:4px solid {color};
+                     border-radius:14px;padding:18px 22px;margin-bottom:10px;
+                     display:flex;align-items:center;justify-content:space-between;flex-wrap:wrap;gap:10px;'>
+                    {thumb_html}
+                    <div style='flex:1;min-width:180px;'>
+                        <div style='font-size:0.95rem;font-weight:700;color:#1e293b;margin-bottom:4px;'>
+                            <i class='fa-solid fa-leaf' style='color:{color};margin-right:6px;'></i>
+                            {scan["disease_name"]}
+                        </div>
+                        <div style='font-size:0.75rem;color:#94a3b8;'>
+                            <i class='fa-regular fa-clock' style='margin-right:4px;'></i>{ts}
+                        </div>
                     </div>
-                </div>
-                <div style='display:flex;gap:12px;align-items:center;'>
-                    <div style='text-align:center;'>
-                        <div style='font-size:0.65rem;color:#94a3b8;font-weight:600;
-                             text-transform:uppercase;letter-spacing:1px;margin-bottom:2px;'>Confidence</div>
-                        <div style='font-size:1rem;font-weight:700;color:#6366f1;'>{scan["confidence"]:.1f}%</div>
+                    <div style='display:flex;gap:12px;align-items:center;'>
+                        <div style='text-align:center;'>
+                            <div style='font-size:0.65rem;color:#94a3b8;font-weight:600;
+                                 text-transform:uppercase;letter-spacing:1px;margin-bottom:2px;'>Confidence</div>
+                            <div style='font-size:1rem;font-weight:700;color:#6366f1;'>{scan["confidence"]:.1f}%</div>
+                        </div>
+                        <div style='background:{bg};color:{color};font-size:0.72rem;font-weight:700;
+                             padding:5px 14px;border-radius:20px;border:1px solid {color};
+                             text-transform:uppercase;letter-spacing:0.5px;'>{sev}</div>
                     </div>
-                    <div style='background:{bg};color:{color};font-size:0.72rem;font-weight:700;
-                         padding:5px 14px;border-radius:20px;border:1px solid {color};
-                         text-transform:uppercase;letter-spacing:0.5px;'>{sev}</div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
+
+            if st.session_state.history_cursor is not None:
+                if st.button("Load more", key="history_more", use_container_width=True):
+                    more, st.session_state.history_cursor = get_scan_history_page(
+                        user_id, st.session_state.history_cursor, **filters)
+                    st.session_state.history_scans = scans + more
+                    st.rerun(scope="fragment")
+
+        history_panel(user_id, total)
 
     st.markdown('<div class="app-ft"><p>\u00a9 2026 <strong>CropGuard AI</strong></p></div>', unsafe_allow_html=True)
 
@@ -1373,13 +962,12 @@ elif app_mode == "\U0001f4ca  Dashboard":
     </div>
     """, unsafe_allow_html=True)
 
-    uid = st.session_state.user["id"]
-    scans     = get_scan_history(uid)
-    freq_data = get_disease_frequency(uid)
-    daily_data = get_daily_scan_counts(uid)
-    sev_data  = get_severity_breakdown(uid)
+    summary    = get_dashboard_summary(st.session_state.user["id"])
+    freq_data  = summary["disease_frequency"]
+    daily_data = summary["daily_counts"]
+    sev_data   = summary["severity_breakdown"]
 
-    if not scans:
+    if not summary["total"]:
         st.markdown("""
         <div style='text-align:center;padding:60px 24px;background:#fff;
              border-radius:18px;border:2px dashed #e2e8f0;'>
@@ -1391,10 +979,10 @@ elif app_mode == "\U0001f4ca  Dashboard":
         </div>
         """, unsafe_allow_html=True)
     else:
-        total     = len(scans)
-        high_risk = sum(1 for s in scans if s["severity"] == "High")
-        avg_conf  = sum(s["confidence"] for s in scans) / total
-        unique_d  = len(set(s["disease_name"] for s in scans))
+        total     = summary["total"]
+        high_risk = summary["high_risk"]
+        avg_conf  = summary["avg_confidence"]
+        unique_d  = summary["unique_diseases"]
 
         # ── Summary KPI cards ──
         c1, c2, c3, c4 = st.columns(4)
@@ -0,0 +1,269 @@
+"""
+Server CPU time and websocket traffic per interaction in the Streamlit app.
+
+Starts `streamlit run <app>` and drives it over its websocket like a
+browser would: it sends widget values in BackMsg rerun requests and the
+fragment id for widgets inside a fragment. It also reports the cached
+message hashes, so large repeated messages come back as references, as
+they do for a real browser. For each interaction it records:
+
+  server CPU  - user+system time of the Streamlit process (from /proc)
+  payload     - bytes of ForwardMsg protobufs received until the run finished
+  wire        - bytes the server actually sent, counted by a TCP proxy in
+                front of it (including websocket framing and compression)
+
+Weather comes from benchmarks/fake_openweather.py. The run signs in as
+--username, creating that user (and --seed-scans scans for it) in the
+configured database if it does not exist.
+
+To compare against an earlier version of the app:
+    git show <rev>:app.py > app_before.py
+    python benchmarks/bench_app_reruns.py --app app_before.py
+    python benchmarks/bench_app_reruns.py
+
+Usage:
+    python benchmarks/bench_app_reruns.py [--app app.py] [--repeat 10]
+"""
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import fake_openweather  # noqa: E402
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+FINISHED_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.Value("FINISHED_EARLY_FOR_RERUN")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class CountingProxy:
+    """TCP proxy that counts the bytes flowing from the server to the client."""
+
+    def __init__(self, target_port: int):
+        self.target_port, self.downstream = target_port, 0
+        self._lock = threading.Lock()
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self._listener.accept()
+            server = socket.create_connection(("127.0.0.1", self.target_port))
+            threading.Thread(target=self._pipe, args=(client, server, False), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(server, client, True), daemon=True).start()
+
+    def _pipe(self, src, dst, count):
+        try:
+            while data := src.recv(65536):
+                if count:
+                    with self._lock:
+                        self.downstream += len(data)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class BrowserSession:
+    """Just enough of the Streamlit frontend's protocol to click through the app."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}        # key or label -> (widget id, fragment id)
+        self.states = {}         # widget id -> WidgetState sent with every rerun
+        self.cached = set()      # hashes of cacheable messages already received
+        self.page_hash = ""
+
+    def _widget(self, name):
+        return self.widgets[name]
+
+    def set(self, name, value):
+        widget_id, fragment_id = self._widget(name)
+        state = WidgetState(id=widget_id)
+        if value is True:
+            state.trigger_value = True
+        else:
+            state.string_value = value
+        self.states[widget_id] = state
+        return fragment_id
+
+    def rerun(self, fragment_id: str = "") -> int:
+        """Request a (fragment) rerun; returns ForwardMsg payload bytes received until it finished."""
+        msg = BackMsg()
+        client = msg.rerun_script
+        client.page_script_hash = self.page_hash
+        client.fragment_id = fragment_id
+        client.widget_states.widgets.extend(self.states.values())
+        client.cached_message_hashes.extend(self.cached)
+        self.ws.send(msg.SerializeToString())
+        # Buttons are triggers: pressed for one run only
+        self.states = {k: s for k, s in self.states.items() if s.WhichOneof("value") != "trigger_value"}
+
+        received = 0
+        while True:
+            data = self.ws.recv()
+            received += len(data)
+            fwd = ForwardMsg()
+            fwd.ParseFromString(data)
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = fwd.new_session.page_script_hash
+            elif kind == "delta":
+                if fwd.metadata.cacheable:
+                    self.cached.add(fwd.hash)
+                self._record_widget(fwd)
+            elif kind == "script_finished" and fwd.script_finished != FINISHED_FOR_RERUN:
+                return received
+
+    def _record_widget(self, fwd):
+        if fwd.delta.WhichOneof("type") != "new_element":
+            return
+        element = fwd.delta.new_element
+        kind = element.WhichOneof("type")
+        proto = getattr(element, kind) if kind else None
+        if proto is None or "id" not in proto.DESCRIPTOR.fields_by_name or not proto.id:
+            return
+        entry = (proto.id, fwd.delta.fragment_id)
+        self.widgets[proto.id.rsplit("-", 1)[-1]] = entry     # user key
+        if "label" in proto.DESCRIPTOR.fields_by_name:
+            self.widgets[proto.label] = entry
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def _ensure_user(username, password, seed_scans):
+    from utils import auth, db
+    user = db.get_user_by_username(username)
+    if user is None:
+        db.create_user(username, f"{username}@example.com", auth.hash_password(password))
+        user = db.get_user_by_username(username)
+        rng = random.Random(0)
+        start = datetime.now() - timedelta(days=60)
+        names = [("Tomato Early Blight", "Moderate"), ("Tomato Late Blight", "High"), ("Tomato Healthy", "None")]
+        scans = []
+        for i in range(seed_scans):
+            name, severity = rng.choice(names)
+            scans.append({"user_id": user["id"], "disease_name": name, "severity": severity,
+                          "confidence": round(rng.uniform(55, 99), 2),
+                          "scanned_at": start + timedelta(minutes=i * 60 * 24 * 60 // max(seed_scans, 1))})
+        db.save_scans(scans)
+        print(f"Created user {username!r} with {seed_scans} scans")
+
+
+def _start_app(app, port, weather_url):
+    env = dict(os.environ, OPENWEATHER_BASE_URL=weather_url, OPENWEATHER_API_KEY="bench", METRICS_PORT="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app, "--server.headless", "true", "--server.port", str(port),
+         "--server.enableStaticServing", "true", "--browser.gatherUsageStats", "false",
+         "--server.fileWatcherType", "none"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.3)
+    proc.kill()
+    sys.exit("Streamlit did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--repeat", type=int, default=10, help="Times each interaction is measured")
+    parser.add_argument("--username", default="bench_ui")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--seed-scans", type=int, default=120)
+    args = parser.parse_args()
+
+    _ensure_user(args.username, args.password, args.seed_scans)
+    weather_server = fake_openweather.start()
+    port = _free_port()
+    proc = _start_app(args.app, port, weather_server.url)
+    proxy = CountingProxy(port)
+    try:
+        with connect(f"ws://127.0.0.1:{proxy.port}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as ws:
+            session = BrowserSession(ws)
+            session.rerun()
+            session.set("login_username", args.username)
+            session.set("login_password", args.password)
+            session.set("login_btn", True)
+            session.rerun()
+            if "weather_city" not in session.widgets:
+                sys.exit("Sign-in failed; check --username/--password")
+
+            def interact(steps):
+                """steps: list of (widget, value) set before one rerun."""
+                fragment_id = ""
+                for name, value in steps:
+                    fragment_id = session.set(name, value)
+                return session.rerun(fragment_id)
+
+            nav = "Nav"
+            scenarios = [
+                ("Home: type a city", lambda i: [("weather_city", ("Pune", "Nagpur")[i % 2])], "🏠  Home"),
+                ("Home: press Check Weather", lambda i: [("weather_search", True)], "🏠  Home"),
+                ("Open History page", lambda i: [(nav, ("📜  History", "🏠  Home")[i % 2])], None),
+                ("History: change severity filter", lambda i: [("hist_severity", ("High", "All")[i % 2])], "📜  History"),
+                ("History: change disease filter",
+                 lambda i: [("hist_disease", ("Tomato Late Blight", "All")[i % 2])], "📜  History"),
+                ("Open Dashboard page", lambda i: [(nav, ("📊  Dashboard", "🏠  Home")[i % 2])], None),
+            ]
+
+            results = []
+            for name, steps, page in scenarios:
+                if page:
+                    interact([(nav, page)])
+                cpu, payload, wire = [], [], []
+                for i in range(args.repeat * (2 if page is None else 1)):
+                    measured = page is not None or i % 2 == 0   # page opens: only the forward switch
+                    before_cpu, before_wire = _cpu_seconds(proc.pid), proxy.downstream
+                    size = interact(steps(i))
+                    time.sleep(0.05)   # let the proxy drain the last frames
+                    if measured:
+                        cpu.append((_cpu_seconds(proc.pid) - before_cpu) * 1000)
+                        payload.append(size)
+                        wire.append(proxy.downstream - before_wire)
+                results.append((name, cpu, payload, wire))
+
+            print(f"\n{args.app}: {args.repeat} runs per interaction "
+                  f"(CPU resolution {1000 / CLOCK_TICKS:.0f} ms, so per-run CPU is a mean)\n")
+            print(f"{'interaction':<34} {'server CPU ms':>14} {'payload KB':>11} {'wire KB':>9}")
+            for name, cpu, payload, wire in results:
+                print(f"{name:<34} {statistics.mean(cpu):>14.1f} {statistics.median(payload) / 1024:>11.1f} "
+                      f"{statistics.median(wire) / 1024:>9.1f}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
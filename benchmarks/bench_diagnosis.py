@@ -0,0 +1,86 @@
+"""
+Time per scan on the Detect page: inference then weather one after the
+other (as before) versus both at once through utils.diagnosis.
+
+Weather comes from the local fake OpenWeatherMap server with --weather-ms
+of latency, every lookup a new city so none are cached. The model is the
+real one when TensorFlow and a trained model are available, otherwise a
+stand-in that sleeps --inference-ms per prediction. A last run makes the
+weather slower than DIAGNOSIS_WEATHER_TIMEOUT to show the diagnosis is
+returned on time without it.
+
+Usage:
+    python benchmarks/bench_diagnosis.py [--scans 10] [--weather-ms 300] [--inference-ms 250]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_openweather  # noqa: E402
+from utils import diagnosis, weather  # noqa: E402
+from utils.recommendations import load_bundles  # noqa: E402
+
+
+class SleepingModel:
+    """Stands in for the model: fixed latency, uniform-ish output."""
+
+    def __init__(self, seconds, classes):
+        self.seconds, self.classes = seconds, classes
+
+    def predict(self, x, verbose=0):
+        time.sleep(self.seconds)
+        return np.linspace(0.2, 0.8, self.classes, dtype="float32")[None, :]
+
+
+def _load_model(inference_ms, classes):
+    try:
+        from utils.model_store import load_best_model
+        return load_best_model(), "trained model"
+    except Exception:
+        return SleepingModel(inference_ms / 1000, classes), f"stand-in model ({inference_ms:.0f} ms)"
+
+
+def _sequential(image_bytes, city, model, bundles):
+    start = time.perf_counter()
+    diagnosis._infer(image_bytes, model, bundles)
+    diagnosis._weather(city)
+    return (time.perf_counter() - start) * 1000
+
+
+def _concurrent(image_bytes, city, model, bundles):
+    return diagnosis.diagnose(image_bytes, city, model, bundles)["timings"]["total_ms"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=10)
+    parser.add_argument("--weather-ms", type=float, default=300, help="Fake weather API latency")
+    parser.add_argument("--inference-ms", type=float, default=250, help="Stand-in model latency")
+    args = parser.parse_args()
+
+    server = fake_openweather.start(latency=args.weather_ms / 1000)
+    weather.BASE_URL, weather.OPENWEATHER_API_KEY = server.url, "bench"
+    bundles = load_bundles()
+    model, model_label = _load_model(args.inference_ms, len(bundles))
+    buf = io.BytesIO()
+    Image.new("RGB", (1024, 768), (60, 140, 60)).save(buf, "JPEG")
+    image_bytes = buf.getvalue()
+
+    print(f"{args.scans} scans, {model_label}, weather API {args.weather_ms:.0f} ms\n")
+    print(f"{'mode':<18} {'median ms':>10} {'max ms':>8}")
+    for name, fn in (("sequential", _sequential), ("concurrent", _concurrent)):
+        timings = [fn(image_bytes, f"{name} {i}", model, bundles) for i in range(args.scans)]
+        print(f"{name:<18} {statistics.median(timings):>10.1f} {max(timings):>8.1f}")
+
+    server.latency = diagnosis.DIAGNOSIS_WEATHER_TIMEOUT + 1
+    result = diagnosis.diagnose(image_bytes, "Slow City", model, bundles)
+    print(f"\nWeather API {server.latency * 1000:.0f} ms (timeout {diagnosis.DIAGNOSIS_WEATHER_TIMEOUT * 1000:.0f} ms): "
+          f"diagnosis in {result['timings']['total_ms']:.0f} ms, weather_status={result['weather_status']}")
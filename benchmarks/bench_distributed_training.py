@@ -0,0 +1,51 @@
+"""
+Scaling benchmark for data-parallel training across local worker processes.
+
+Runs the same training job with 1, 2, 4 and 8 workers (CPU threads split
+evenly between them) and reports throughput and speedup over one worker.
+
+Usage:
+    python benchmarks/bench_distributed_training.py --epochs 3 --batch-size 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from train_model import launch_workers  # noqa: E402
+
+
+def run(worker_counts, epochs, batch_size):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in worker_counts:
+            stats_path = os.path.join(tmp, f"stats_{n}.json")
+            wall = launch_workers(n, stats_path=stats_path, extra_args=[
+                "--epochs", str(epochs), "--batch-size", str(batch_size),
+                "--model-path", os.path.join(tmp, f"model_{n}.h5"),
+                "--indices-path", os.path.join(tmp, f"class_indices_{n}.json"),
+            ])
+            with open(stats_path) as f:
+                stats = json.load(f)
+            images = stats["steps_per_epoch"] * stats["global_batch_size"] * stats["epochs"]
+            stats.update(wall_seconds=wall, images_per_sec=images / stats["fit_seconds"])
+            results.append(stats)
+
+    base = results[0]["images_per_sec"]
+    print(f"\n{'workers':>7} {'fit s':>8} {'wall s':>8} {'img/s':>9} {'speedup':>8} {'val_acc':>8}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['fit_seconds']:>8.1f} {r['wall_seconds']:>8.1f} "
+              f"{r['images_per_sec']:>9.1f} {r['images_per_sec'] / base:>7.2f}x {r['val_accuracy']:>8.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=8, help="Per-worker batch size")
+    args = parser.parse_args()
+    run(args.workers, args.epochs, args.batch_size)
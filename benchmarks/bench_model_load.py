@@ -0,0 +1,76 @@
+"""
+Cold-load benchmark for each exported model artifact format.
+
+Every format is loaded in a fresh Python process (TensorFlow already
+imported, so only deserialisation is timed), followed by one prediction.
+Reports load time, first-prediction time and the process's peak RSS, and
+writes the ranking to models/load_benchmark.json for load_best_model().
+
+Usage:
+    python benchmarks/bench_model_load.py [--runs 3] [--export]
+
+--export first writes every format from the existing .h5 model.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import json, resource, sys, time
+import numpy as np
+import tensorflow as tf
+from utils.model_store import load_format
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+model = load_format(sys.argv[1])
+load_s = time.perf_counter() - start
+x = np.zeros((1, 224, 224, 3), dtype=np.float32)
+start = time.perf_counter()
+model.predict(x, verbose=0)
+predict_s = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"load_seconds": load_s, "first_predict_seconds": predict_s,
+                  "peak_rss_mb": rss_after / 1024, "load_rss_mb": (rss_after - rss_before) / 1024}))
+"""
+
+
+def bench_format(fmt, runs):
+    samples = []
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3")
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", CHILD, fmt], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    # Report the median run by load time.
+    return sorted(samples, key=lambda s: s["load_seconds"])[len(samples) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--export", action="store_true", help="Export all formats from the .h5 first")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    from utils.model_store import BENCHMARK_PATH, DEFAULT_ORDER, available_formats, export_model, load_format
+
+    if args.export:
+        export_model(load_format("h5"), formats=[f for f in DEFAULT_ORDER if f != "h5"])
+
+    results = {}
+    for fmt in available_formats():
+        results[fmt] = bench_format(fmt, args.runs)
+
+    print(f"\n{'format':<11} {'load ms':>9} {'1st predict ms':>15} {'peak RSS MB':>12} {'load RSS MB':>12}")
+    for fmt, r in sorted(results.items(), key=lambda kv: kv[1]["load_seconds"]):
+        print(f"{fmt:<11} {r['load_seconds'] * 1000:>9.1f} {r['first_predict_seconds'] * 1000:>15.1f} "
+              f"{r['peak_rss_mb']:>12.1f} {r['load_rss_mb']:>12.1f}")
+
+    with open(BENCHMARK_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nRanking written to {BENCHMARK_PATH}")
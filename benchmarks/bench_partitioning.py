@@ -0,0 +1,200 @@
+"""
+Query time on scan_history with and without monthly partitioning.
+
+Loads the same synthetic scans (default 10M rows, 1000 users, 24 months)
+into two schemas of the configured database: bench_plain (one table) and
+bench_part (utils/partitions.py layout). Both carry the same indexes. Then
+times the scan_history queries from utils/db.py in each, reports how many
+partitions each query touched, and finally times dropping the oldest month
+(DELETE vs DROP of a detached partition), which is what retention does.
+
+Usage:
+    python benchmarks/bench_partitioning.py [--rows 10000000] [--runs 5] [--keep]
+
+--keep leaves both schemas in place; a later run with --reuse skips loading.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import db  # noqa: E402
+from utils.partitions import PARTITIONED_SCHEMA  # noqa: E402
+
+SCHEMAS = ("bench_plain", "bench_part")
+
+COMMON_DDL = """
+CREATE TABLE users (id SERIAL PRIMARY KEY, username VARCHAR(50) NOT NULL);
+CREATE SEQUENCE scan_history_id_seq;
+"""
+
+PLAIN_DDL = """
+CREATE TABLE scan_history (
+    id INTEGER NOT NULL DEFAULT nextval('scan_history_id_seq') PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    disease_name VARCHAR(100),
+    confidence FLOAT,
+    severity VARCHAR(20),
+    scanned_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX ON scan_history (user_id, scanned_at DESC, id DESC);
+CREATE INDEX ON scan_history (user_id, disease_name, scanned_at DESC, id DESC);
+CREATE INDEX ON scan_history (user_id, severity, scanned_at DESC, id DESC);
+"""
+
+LOAD_SQL = """
+INSERT INTO scan_history (user_id, disease_name, confidence, severity, scanned_at)
+SELECT 1 + (i %% %(users)s),
+       (ARRAY['Tomato Early Blight', 'Tomato Late Blight', 'Tomato Healthy'])[1 + (i %% 3)],
+       50 + random() * 50,
+       (ARRAY['None', 'Low', 'Moderate', 'High'])[1 + (i %% 4)],
+       NOW() - random() * %(months)s * INTERVAL '30 days'
+FROM generate_series(1, %(rows)s) AS i
+"""
+
+
+def _connect(schema):
+    conn = db.get_connection()
+    conn.autocommit = True
+    conn.cursor().execute(f"SET search_path = {schema}, public")
+    return conn
+
+
+def load(rows, users, months):
+    for schema in SCHEMAS:
+        conn = db.get_connection()
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path = {schema}, public")
+        cur.execute(COMMON_DDL)
+        cur.execute("INSERT INTO users (username) SELECT 'user_' || i FROM generate_series(1, %s) AS i", (users,))
+        if schema == "bench_plain":
+            cur.execute(PLAIN_DDL)
+        else:
+            cur.execute(PARTITIONED_SCHEMA)
+            cur.execute("""SELECT create_scan_history_partition(m::date)
+                           FROM generate_series(date_trunc('month', NOW() - %s * INTERVAL '30 days'),
+                                                date_trunc('month', NOW()), INTERVAL '1 month') AS m""", (months,))
+        start = time.perf_counter()
+        if schema == "bench_plain":
+            cur.execute(LOAD_SQL, {"rows": rows, "users": users, "months": months})
+        else:  # identical rows in both schemas
+            cur.execute("INSERT INTO scan_history SELECT * FROM bench_plain.scan_history")
+        cur.execute("ANALYZE scan_history")
+        print(f"Loaded {rows:,} rows into {schema} in {time.perf_counter() - start:.1f}s")
+        conn.close()
+
+
+def queries(user_id):
+    today = date.today()
+    month_start = (today.replace(day=1) - timedelta(days=200)).replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    # Cursor about a year back, as if the user had paged that far
+    deep_cursor = (today - timedelta(days=365), 2 ** 31 - 1)
+    return [
+        ("daily counts (30 days)", db.DAILY_SCAN_COUNTS_SQL, (user_id,)),
+        ("summary fallback", db.SUMMARY_FROM_SCANS_SQL, {"uid": user_id}),
+        ("severity breakdown (all time)", db.SEVERITY_BREAKDOWN_SQL, (user_id,)),
+        ("history first page", *db.build_scan_history_query(user_id)),
+        ("history page ~1 year back", *db.build_scan_history_query(user_id, cursor=deep_cursor)),
+        ("history one month", *db.build_scan_history_query(user_id, date_from=month_start, date_to=month_end)),
+        ("history one disease", *db.build_scan_history_query(user_id, disease="Tomato Late Blight")),
+        ("all users, last 30 days", "SELECT COUNT(*) FROM scan_history WHERE scanned_at >= NOW() - INTERVAL '30 days'", None),
+    ]
+
+
+def _partitions_touched(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    touched, stack = set(), [plan]
+    while stack:
+        node = stack.pop()
+        # Partitions pruned at executor start-up never appear; ones pruned
+        # later in execution are reported with "never executed" loops.
+        if "Relation Name" in node and node.get("Actual Loops", 1) > 0:
+            touched.add(node["Relation Name"])
+        stack.extend(node.get("Plans", []))
+    return len(touched)
+
+
+def time_queries(user_id, runs):
+    results = {}
+    for schema in SCHEMAS:
+        conn = _connect(schema)
+        cur = conn.cursor()
+        for name, sql, params in queries(user_id):
+            cur.execute(sql, params)  # warm-up
+            cur.fetchall()
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results.setdefault(name, {})[schema] = (statistics.median(timings),
+                                                    _partitions_touched(cur, sql, params))
+        conn.close()
+
+    print(f"\n{'query':<32} {'plain ms':>9} {'partitioned ms':>15} {'speedup':>8} {'partitions':>11}")
+    for name, r in results.items():
+        plain, (part, touched) = r["bench_plain"][0], r["bench_part"]
+        print(f"{name:<32} {plain:>9.2f} {part:>15.2f} {plain / part:>7.2f}x {touched:>11}")
+    return results
+
+
+def time_retention():
+    """Remove the oldest month: DELETE on the plain table vs DETACH + DROP."""
+    conn = _connect("bench_part")
+    cur = conn.cursor()
+    cur.execute("""SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = 'scan_history'::regclass AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+                   ORDER BY c.relname LIMIT 1""")
+    oldest = cur.fetchone()[0]
+    lo = date(int(oldest[-7:-3]), int(oldest[-2:]), 1)
+    hi = (lo + timedelta(days=32)).replace(day=1)
+
+    start = time.perf_counter()
+    cur.execute(f"ALTER TABLE scan_history DETACH PARTITION {oldest}")
+    cur.execute(f"DROP TABLE {oldest}")
+    part_s = time.perf_counter() - start
+    conn.close()
+
+    conn = _connect("bench_plain")
+    cur = conn.cursor()
+    start = time.perf_counter()
+    cur.execute("DELETE FROM scan_history WHERE scanned_at >= %s AND scanned_at < %s", (lo, hi))
+    deleted = cur.rowcount
+    plain_s = time.perf_counter() - start
+    conn.close()
+    print(f"\nRetention, drop {lo:%Y-%m} ({deleted:,} rows): DELETE {plain_s:.2f}s, "
+          f"DETACH + DROP {part_s:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=24, help="Months of history to spread rows over")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--reuse", action="store_true", help="Reuse schemas left by a --keep run")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark schemas afterwards")
+    args = parser.parse_args()
+
+    if not args.reuse:
+        load(args.rows, args.users, args.months)
+    time_queries(user_id=1, runs=args.runs)
+    if not args.keep:
+        time_retention()
+        conn = db.get_connection()
+        conn.autocommit = True
+        for schema in SCHEMAS:
+            conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
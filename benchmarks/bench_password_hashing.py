@@ -0,0 +1,105 @@
+"""
+Login latency under concurrent load for each password hashing cost.
+
+Simulates --sessions users signing in at the same time, each verifying
+--logins passwords in a row through utils.auth (the bounded worker pool,
+AUTH_WORKERS threads). For every scrypt and PBKDF2 cost in the grid it
+reports median and p99 login latency and throughput, then recommends the
+highest cost whose p99 stays under --target-p99-ms. Finally compares the
+pool against hashing inline on every session's own thread at that cost.
+
+Usage:
+    python benchmarks/bench_password_hashing.py [--sessions 16] [--logins 10] [--target-p99-ms 500]
+    AUTH_WORKERS=8 python benchmarks/bench_password_hashing.py
+
+Set the chosen cost with SCRYPT_N (or PASSWORD_HASH_ALGORITHM=pbkdf2_sha256
+and PBKDF2_ITERATIONS); existing hashes are upgraded at their next login.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import auth  # noqa: E402
+
+GRID = [("scrypt", {"n": 2 ** k, "r": 8, "p": 1}) for k in (12, 13, 14, 15, 16)] + \
+       [("pbkdf2_sha256", {"iterations": i}) for i in (100_000, 200_000, 400_000, 600_000, 1_000_000)]
+
+
+def _label(algorithm, params):
+    if algorithm == "scrypt":
+        return f"scrypt n=2^{params['n'].bit_length() - 1}"
+    return f"pbkdf2 {params['iterations']:,}"
+
+
+def run_load(stored_hash, sessions, logins, verify):
+    """Start `sessions` threads at once, each doing `logins` verifications. Returns latencies (ms), wall s."""
+    latencies, lock = [], threading.Lock()
+    barrier = threading.Barrier(sessions + 1)
+
+    def session():
+        barrier.wait()
+        for _ in range(logins):
+            start = time.perf_counter()
+            assert verify("correct horse", stored_hash)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - start
+
+
+def p99(values):
+    return statistics.quantiles(values, n=100)[98] if len(values) > 1 else values[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent sign-ins")
+    parser.add_argument("--logins", type=int, default=10, help="Sign-ins per session")
+    parser.add_argument("--target-p99-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} concurrent sessions x {args.logins} logins, "
+          f"{auth.AUTH_WORKERS} hashing workers, {os.cpu_count()} CPUs\n")
+    print(f"{'cost':<22} {'single ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'logins/s':>9} {'mem/hash':>9}")
+    best = None
+    for algorithm, params in GRID:
+        stored = auth._hash("correct horse", algorithm, params)
+        start = time.perf_counter()
+        auth._verify("correct horse", stored)
+        single = (time.perf_counter() - start) * 1000
+        latencies, wall = run_load(stored, args.sessions, args.logins, auth.verify_password)
+        mem = f"{128 * params['n'] * params['r'] / 2 ** 20:.0f} MB" if algorithm == "scrypt" else "-"
+        print(f"{_label(algorithm, params):<22} {single:>10.1f} {statistics.median(latencies):>9.1f} "
+              f"{p99(latencies):>9.1f} {len(latencies) / wall:>9.1f} {mem:>9}")
+        if algorithm == auth.PASSWORD_HASH_ALGORITHM and p99(latencies) <= args.target_p99_ms:
+            best = (algorithm, params, stored)
+
+    if best is None:
+        print(f"\nNo {auth.PASSWORD_HASH_ALGORITHM} cost meets p99 <= {args.target_p99_ms:.0f} ms "
+              f"at {args.sessions} concurrent sign-ins; add workers or CPUs.")
+        sys.exit(1)
+
+    algorithm, params, stored = best
+    print(f"\nHighest {algorithm} cost with p99 <= {args.target_p99_ms:.0f} ms: {_label(algorithm, params)}")
+    print("  " + (f"SCRYPT_N={params['n']}" if algorithm == "scrypt" else f"PBKDF2_ITERATIONS={params['iterations']}"))
+
+    print(f"\nPool vs inline hashing at that cost ({args.sessions} sessions):")
+    for name, verify in (("pool", auth.verify_password), ("inline", auth._verify)):
+        latencies, wall = run_load(stored, args.sessions, args.logins, verify)
+        peak = min(args.sessions, auth.AUTH_WORKERS) if name == "pool" else args.sessions
+        mem = f", peak {peak * 128 * params['n'] * params['r'] / 2 ** 20:.0f} MB scrypt memory" \
+            if algorithm == "scrypt" else ""
+        print(f"  {name:<7} p50 {statistics.median(latencies):7.1f} ms  p99 {p99(latencies):7.1f} ms  "
+              f"{len(latencies) / wall:6.1f} logins/s{mem}")
@@ -0,0 +1,86 @@
+"""
+Per-report PDF generation time, before and after template caching.
+
+Renders the report for every disease in utils/recommendations.py four ways:
+
+  before   - the original renderer (benchmarks/report_baseline.py, a copy
+             of utils/report.py from before caching)
+  cold     - current renderer with its line-break and report caches
+             cleared before each report
+  template - new scan (different user/confidence/time) of a disease whose
+             texts were already laid out once
+  cached   - the same report requested again (Download pressed twice,
+             page rerun); served from the content-hash cache
+
+Speedups are relative to `before`.
+
+The Detect page used to pay the `before` cost on every prediction. It now
+renders a report only when "Create PDF Report" is clicked.
+
+Usage:
+    python benchmarks/bench_report.py [--runs 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import report_baseline  # noqa: E402
+from utils import report  # noqa: E402
+from utils.recommendations import recommendations  # noqa: E402
+
+
+def _reports(runs):
+    start = datetime(2026, 1, 1)
+    for i in range(runs):
+        for name, info in recommendations.items():
+            yield dict(username=f"user_{i}", disease_name=name.replace("_", " "), confidence=60 + i % 40,
+                       severity=info["severity"], description=info.get("description", ""),
+                       treatments=info.get("treatment", []), scanned_at=start + timedelta(minutes=i))
+
+
+def _time(reports, before_each=None, render=report.generate_report_pdf):
+    timings = []
+    for args in reports:
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        render(**args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50, help="Reports per disease")
+    args = parser.parse_args()
+
+    reports = list(_reports(args.runs))
+    report.REPORT_CACHE_SIZE = len(reports)
+    report.generate_report_pdf(**reports[0])  # import-time warm-up (fonts, fpdf modules)
+    report._reports.clear()
+
+    def render_before(scanned_at, **args):
+        return report_baseline.generate_report_pdf(**args)   # stamped with the current time
+
+    def clear_caches():
+        report._wrap.cache_clear()
+        report._reports.clear()
+
+    before = _time(reports, render=render_before)
+    cold = _time(reports, clear_caches)
+    report._reports.clear()
+    template = _time(reports)   # line breaks cached, every report new
+    cached = _time(reports)     # every report already rendered
+    results = [("before", before), ("cold", cold), ("template", template), ("cached", cached)]
+    print(f"{len(reports)} reports ({len(recommendations)} diseases x {args.runs})\n")
+    print(f"{'mode':<16} {'median ms':>10} {'p95 ms':>8} {'speedup':>8}")
+    base = statistics.median(results[0][1])
+    for name, timings in results:
+        median = statistics.median(timings)
+        p95 = statistics.quantiles(timings, n=20)[18]
+        print(f"{name:<16} {median:>10.3f} {p95:>8.3f} {base / median:>7.1f}x")
@@ -0,0 +1,94 @@
+"""
+Disease risk over a forecast grid: the vectorised engine (utils/risk_grid.py)
+against calling the scalar assess_disease_risk rules once per reading.
+
+Builds a synthetic --locations x --hours hourly forecast (diurnal
+temperature and humidity cycles, rain spells), then:
+
+  1. checks risk_codes matches weather.risk_code on every reading of a
+     sample grid and on all threshold boundaries
+  2. times assess_risk_grid + summarize_grid over the full grid
+  3. times the scalar rules on a slice and scales to the full grid
+
+Usage:
+    python benchmarks/bench_risk_grid.py [--locations 10000] [--hours 120] [--runs 5]
+"""
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import risk_grid, weather  # noqa: E402
+
+CONDITION_NAMES = {200: "Thunderstorm", 300: "Drizzle", 500: "Rain", 800: "Clear", 803: "Clouds"}
+
+
+def forecast(locations, hours, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(hours)
+    day = np.sin(2 * np.pi * (t - 9) / 24)                       # warmest mid-afternoon
+    base = rng.uniform(10, 34, (locations, 1))
+    temp = base + 6 * day + rng.normal(0, 1.5, (locations, hours))
+    humidity = np.clip(rng.uniform(45, 90, (locations, 1)) - 15 * day + rng.normal(0, 6, (locations, hours)), 5, 100)
+    rain = rng.random((locations, hours)) < 0.08
+    rain |= np.roll(rain, 1, axis=1) & (rng.random((locations, hours)) < 0.7)   # spells last a while
+    ids = np.where(rain, rng.choice([200, 300, 500], (locations, hours)), rng.choice([800, 803], (locations, hours)))
+    return temp, humidity, ids
+
+
+def check_consistency(temp, humidity, ids):
+    codes = risk_grid.risk_codes(temp, humidity, risk_grid.wet_from_condition_ids(ids))
+    for index in np.ndindex(temp.shape):
+        expected = weather.risk_code(temp[index], humidity[index], CONDITION_NAMES[int(ids[index])])
+        assert codes[index] == expected, (index, temp[index], humidity[index], ids[index])
+    lo, hi = weather.HIGH_RISK_TEMP
+    temps = [lo - 0.01, lo, (lo + hi) / 2, hi, hi + 0.01, weather.HEAT_STRESS_TEMP - 0.01, weather.HEAT_STRESS_TEMP]
+    hums = [weather.MODERATE_RISK_HUMIDITY - 0.01, weather.MODERATE_RISK_HUMIDITY,
+            weather.HIGH_RISK_HUMIDITY - 0.01, weather.HIGH_RISK_HUMIDITY, 100]
+    for t, h, (cid, name) in itertools.product(temps, hums, CONDITION_NAMES.items()):
+        assert risk_grid.risk_codes(t, h, risk_grid.wet_from_condition_ids(cid)) == weather.risk_code(t, h, name)
+        assert risk_grid.risk_levels(weather.risk_code(t, h, name)) == weather.assess_disease_risk(t, h, name)["level"]
+    return temp.size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=10_000)
+    parser.add_argument("--hours", type=int, default=120)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    temp, humidity, ids = forecast(args.locations, args.hours)
+    checked = check_consistency(temp[:200], humidity[:200], ids[:200])
+    print(f"Consistency: {checked:,} readings + threshold boundaries match weather.risk_code ✓\n")
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        grid = risk_grid.assess_risk_grid(temp, humidity, condition_ids=ids)
+        summary = risk_grid.summarize_grid(grid)
+        timings.append(time.perf_counter() - start)
+    vector = statistics.median(timings)
+
+    rows = max(1, min(args.locations, 200))
+    names = np.vectorize(CONDITION_NAMES.get)(ids[:rows])
+    start = time.perf_counter()
+    for i in range(rows):
+        for h in range(args.hours):
+            weather.assess_disease_risk(temp[i, h], humidity[i, h], names[i, h])
+    scalar = (time.perf_counter() - start) * args.locations / rows
+
+    cells = args.locations * args.hours
+    print(f"{args.locations:,} locations x {args.hours} hours = {cells:,} readings")
+    print(f"  vectorised (risk + wetness/humidity features + summary): {vector * 1000:8.1f} ms")
+    print(f"  scalar assess_disease_risk per reading (risk only, est.): {scalar * 1000:8.1f} ms  "
+          f"({scalar / vector:.0f}x slower)")
+    high = (summary["peak_risk"] == weather.RISK_HIGH).sum()
+    print(f"\n{high:,} locations reach High risk; longest leaf-wetness run "
+          f"{summary['max_wet_run'].max()} h; median High hours {np.median(summary['high_hours']):.0f}")
@@ -0,0 +1,92 @@
+"""
+Weather lookup latency with and without the cache, against the local fake
+OpenWeatherMap server (benchmarks/fake_openweather.py).
+
+  uncached  - a new requests.get per lookup, as every "Check Weather"
+              click and page rerun used to make
+  miss      - first lookup of a city through the pooled session
+  hit       - the same city again within WEATHER_CACHE_TTL
+  stale     - after the TTL: served from cache while a refresh runs
+
+Then --concurrent threads look up one uncached city at once and the
+server's request count shows whether they shared a single request.
+
+Usage:
+    python benchmarks/bench_weather.py [--latency 0.15] [--lookups 20] [--concurrent 32]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_openweather  # noqa: E402
+from utils import weather  # noqa: E402
+
+
+def _time(fn, cities):
+    timings = []
+    for city in cities:
+        start = time.perf_counter()
+        assert fn(city) is not None
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _uncached(city):
+    response = requests.get(weather.BASE_URL, timeout=5,
+                            params={"q": city, "appid": weather.OPENWEATHER_API_KEY, "units": "metric"})
+    return response.json() if response.status_code == 200 else None
+
+
+def _expire_all():
+    with weather._lock:
+        for key, (fetched_at, data) in weather._cache.items():
+            weather._cache[key] = (fetched_at - weather.WEATHER_CACHE_TTL, data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.15, help="Fake API response delay (s)")
+    parser.add_argument("--lookups", type=int, default=20, help="Cities per mode")
+    parser.add_argument("--concurrent", type=int, default=32, help="Simultaneous lookups of one city")
+    args = parser.parse_args()
+
+    server = fake_openweather.start(latency=args.latency)
+    weather.BASE_URL, weather.OPENWEATHER_API_KEY = server.url, "bench"
+    cities = [f"City {i}" for i in range(args.lookups)]
+
+    results = [("uncached (before)", _time(_uncached, cities)), ("miss", _time(weather.get_weather, cities)),
+               ("hit", _time(weather.get_weather, cities))]
+    _expire_all()
+    results.append(("stale", _time(weather.get_weather, cities)))
+
+    print(f"{args.lookups} cities, fake API latency {args.latency * 1000:.0f} ms\n")
+    print(f"{'mode':<18} {'median ms':>10} {'p95 ms':>8}")
+    for name, timings in results:
+        print(f"{name:<18} {statistics.median(timings):>10.3f} {statistics.quantiles(timings, n=20)[18]:>8.3f}")
+
+    barrier = threading.Barrier(args.concurrent)
+    latencies, lock = [], threading.Lock()
+
+    def lookup():
+        barrier.wait()
+        start = time.perf_counter()
+        weather.get_weather("  Shared   CITY ")
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=lookup) for _ in range(args.concurrent)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"\n{args.concurrent} concurrent lookups of one city: {server.requests['shared city']} API request(s), "
+          f"max wait {max(latencies):.0f} ms")
+    print(f"Cache lookups: " + ", ".join(f"{r} {weather.LOOKUPS.value(result=r)}"
+                                         for r in ("hit", "stale", "miss", "coalesced")))
@@ -0,0 +1,101 @@
+"""
+Local stand-in for the OpenWeatherMap current-weather API.
+
+Answers GET /data/2.5/weather?q=<city>&appid=<key>&units=metric with a
+response shaped like the real one. Conditions are derived from the city
+name, so the same city always gets the same weather. Cities in UNKNOWN_CITIES
+get a 404 and a missing appid gets a 401, as the real API does. --latency
+adds a delay to every response to stand in for the round trip.
+
+    python benchmarks/fake_openweather.py --port 8099 --latency 0.3
+    OPENWEATHER_BASE_URL=http://localhost:8099/data/2.5/weather \\
+        OPENWEATHER_API_KEY=test streamlit run app.py
+
+GET /stats returns the number of weather requests served per city.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+UNKNOWN_CITIES = {"atlantis", "nowhere"}
+CONDITIONS = [("Clear", "clear sky"), ("Clouds", "broken clouds"), ("Rain", "light rain"),
+              ("Drizzle", "light intensity drizzle"), ("Thunderstorm", "thunderstorm"), ("Mist", "mist")]
+
+
+def fake_weather(city: str) -> dict:
+    seed = hashlib.sha256(city.casefold().encode()).digest()
+    main, description = CONDITIONS[seed[0] % len(CONDITIONS)]
+    temp = 10 + seed[1] % 300 / 10          # 10.0 - 39.9 °C
+    return {
+        "coord": {"lon": seed[2] - 128, "lat": (seed[3] - 128) / 1.5},
+        "weather": [{"id": 800, "main": main, "description": description, "icon": "01d"}],
+        "main": {"temp": temp, "feels_like": temp + seed[4] % 40 / 10 - 2,
+                 "pressure": 1000 + seed[5] % 30, "humidity": 30 + seed[6] % 70},
+        "wind": {"speed": seed[7] % 120 / 10, "deg": seed[8] % 360},
+        "name": city.title(),
+        "cod": 200,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self._json(200, dict(self.server.requests))
+        if url.path != "/data/2.5/weather":
+            return self._json(404, {"cod": "404", "message": "Internal error"})
+        query = parse_qs(url.query)
+        city = query.get("q", [""])[0]
+        with self.server.lock:
+            self.server.requests[city] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not query.get("appid", [""])[0]:
+            return self._json(401, {"cod": 401, "message": "Invalid API key."})
+        if not city or city.casefold() in UNKNOWN_CITIES:
+            return self._json(404, {"cod": "404", "message": "city not found"})
+        self._json(200, fake_weather(city))
+
+    def _json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Serve in a daemon thread. `server.url` is the weather endpoint;
+    `server.requests` counts requests per city."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.requests = Counter()
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}/data/2.5/weather"
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-openweather").start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency)
+    print(f"Fake OpenWeatherMap at {server.url}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,237 @@
+"""
+Conformance and performance suite for the storage backends in utils/db.py.
+
+Checks that every function in db.BACKEND_API has the same signature in the
+PostgreSQL and SQLite implementations, then runs the same behaviour checks
+and timings against each backend through the public utils.db functions
+(each backend in its own process, selected with DB_BACKEND). Exits
+non-zero if any check fails.
+
+The Postgres run uses the configured database and removes the users and
+scans it creates; the SQLite run uses a temporary file.
+
+Usage:
+    python benchmarks/storage_conformance.py [--backends postgres sqlite] [--scans 5000]
+"""
+import argparse
+import inspect
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# As stored by the app: the display names from utils/recommendations.py
+DISEASES = ["Tomato Early Blight", "Tomato Late Blight", "Tomato Healthy"]
+SEVERITIES = ["None", "Low", "Moderate", "High"]
+
+
+# ─── Signatures (parent process) ───
+
+def check_signatures() -> bool:
+    os.environ["DB_BACKEND"] = "postgres"
+    from utils import db, db_sqlite
+
+    ok = True
+    for name in db.BACKEND_API:
+        pg, lite = inspect.signature(getattr(db, name)), inspect.signature(getattr(db_sqlite, name))
+        if pg != lite:
+            ok = False
+            print(f"✗ signature {name}: postgres{pg} vs sqlite{lite}")
+    print(f"{'✓' if ok else '✗'} {len(db.BACKEND_API)} backend functions have matching signatures")
+    return ok
+
+
+# ─── Behaviour checks (child process) ───
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def __call__(self, name, condition, detail=""):
+        if condition:
+            print(f"  ✓ {name}")
+        else:
+            self.failures += 1
+            print(f"  ✗ {name} {detail}")
+
+
+def _expected(scans, user_id, **filters):
+    rows = [s for s in scans if s["user_id"] == user_id]
+    if filters.get("disease"):
+        rows = [s for s in rows if s["disease_name"] == filters["disease"]]
+    if filters.get("severity"):
+        rows = [s for s in rows if s["severity"] == filters["severity"]]
+    if filters.get("min_confidence") is not None:
+        rows = [s for s in rows if s["confidence"] >= filters["min_confidence"]]
+    if filters.get("date_from"):
+        rows = [s for s in rows if s["scanned_at"].date() >= filters["date_from"]]
+    if filters.get("date_to"):
+        rows = [s for s in rows if s["scanned_at"].date() <= filters["date_to"]]
+    return rows
+
+
+def _all_pages(db, user_id, limit, **filters):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = db.get_scan_history_page(user_id, cursor, limit=limit, **filters)
+        rows += page
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+def run_checks(db, n_scans: int) -> tuple[int, list, list]:
+    check = Checker()
+    tag = uuid.uuid4().hex[:8]
+    names = [f"conf_{tag}_a", f"conf_{tag}_b"]
+
+    print("users")
+    check("create_user", db.create_user(names[0], f"{names[0]}@example.com", "salt:hash"))
+    check("create_user second user", db.create_user(names[1], f"{names[1]}@example.com", "salt:hash"))
+    check("duplicate username rejected", db.create_user(names[0], f"other_{tag}@example.com", "x") is False)
+    check("duplicate email rejected", db.create_user(f"other_{tag}", f"{names[0]}@example.com", "x") is False)
+    user = db.get_user_by_username(names[0])
+    check("get_user_by_username", user is not None and user["email"] == f"{names[0]}@example.com"
+          and {"id", "username", "email", "password_hash", "created_at"} <= set(user))
+    check("get_user_by_email", (db.get_user_by_email(f"{names[0]}@example.com") or {}).get("id") == user["id"])
+    check("unknown user is None", db.get_user_by_username(f"missing_{tag}") is None)
+    check("update_password_hash", db.update_password_hash(user["id"], "scrypt$new")
+          and db.get_user_by_username(names[0])["password_hash"] == "scrypt$new")
+    uid, other = user["id"], db.get_user_by_username(names[1])["id"]
+
+    print("scans")
+    rng = random.Random(7)
+    now = datetime.now().replace(microsecond=0)
+    scans = [{
+        "user_id": uid if i % 5 else other,
+        "disease_name": rng.choice(DISEASES),
+        "confidence": round(rng.uniform(40, 100), 2),
+        "severity": rng.choice(SEVERITIES),
+        # Some scans share a timestamp, so paging must order by id too
+        "scanned_at": now - timedelta(minutes=rng.randrange(60 * 24 * 60)) if i % 7 else now - timedelta(days=3),
+    } for i in range(n_scans)]
+    check("save_scans([])", db.save_scans([]))
+    check("save_scans", db.save_scans(scans))
+    check("save_scan", db.save_scan(uid, "Tomato Healthy", 99.0, "None", "ab" * 32))
+    scans.append({"user_id": uid, "disease_name": "Tomato Healthy", "confidence": 99.0,
+                  "severity": "None", "scanned_at": datetime.now()})
+
+    print("history")
+    mine = _expected(scans, uid)
+    rows, pages = _all_pages(db, uid, 50)
+    check("pages cover every scan once", len(rows) == len(mine) and len({r["id"] for r in rows}) == len(rows),
+          f"({len(rows)} rows, {len(mine)} expected)")
+    check("pages ordered by (scanned_at, id) desc",
+          all((a["scanned_at"], a["id"]) > (b["scanned_at"], b["id"]) for a, b in zip(rows, rows[1:])))
+    check("scanned_at is a datetime", isinstance(rows[0]["scanned_at"], datetime))
+    check("image_hash round-trips", rows[0]["image_hash"] == "ab" * 32 and rows[-1]["image_hash"] is None)
+    check("get_scan_history first page", len(db.get_scan_history(uid)) == min(20, len(mine)))
+    week_ago = date.today() - timedelta(days=7)
+    for filters in ({"disease": "Tomato Late Blight"}, {"severity": "High", "min_confidence": 80.0},
+                    {"date_from": week_ago, "date_to": date.today() - timedelta(days=3)}):
+        got, _ = _all_pages(db, uid, 25, **filters)
+        check(f"filter {filters}", len(got) == len(_expected(scans, uid, **filters)),
+              f"({len(got)} vs {len(_expected(scans, uid, **filters))})")
+    try:
+        db.get_scan_history_page(uid, colour="red")
+        check("unknown filter raises ValueError", False)
+    except ValueError:
+        check("unknown filter raises ValueError", True)
+
+    print("aggregates")
+    freq = {d: sum(s["disease_name"] == d for s in mine) for d in DISEASES}
+    got_freq = {r["disease_name"]: r["count"] for r in db.get_disease_frequency(uid)}
+    check("get_disease_frequency", got_freq == {d: n for d, n in freq.items() if n})
+    sev = {s: sum(x["severity"] == s for x in mine) for s in SEVERITIES}
+    check("get_severity_breakdown",
+          {r["severity"]: r["count"] for r in db.get_severity_breakdown(uid)} == {s: n for s, n in sev.items() if n})
+    daily = db.get_daily_scan_counts(uid)
+    check("get_daily_scan_counts returns dates", all(isinstance(r["scan_date"], date) for r in daily))
+    summary = db.get_dashboard_summary(uid)
+    check("get_dashboard_summary total", summary["total"] == len(mine), f"({summary['total']} vs {len(mine)})")
+    check("get_dashboard_summary high risk", summary["high_risk"] == sev["High"])
+    check("get_dashboard_summary avg confidence",
+          abs(summary["avg_confidence"] - sum(s["confidence"] for s in mine) / len(mine)) < 1e-6)
+    check("get_pool_stats", isinstance(db.get_pool_stats(), dict))
+    return check.failures, [uid, other], mine
+
+
+# ─── Timings (child process) ───
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run_timings(db, uid, mine):
+    deep = sorted(mine, key=lambda s: s["scanned_at"])[len(mine) // 10]
+    cursor = (deep["scanned_at"], 2 ** 31 - 1)
+    batch = [{"user_id": uid, "disease_name": "Tomato Healthy", "confidence": 90.0,
+              "severity": "None", "scanned_at": datetime.now()} for _ in range(500)]
+    timings = [
+        ("save_scan", _timed(lambda: db.save_scan(uid, "Tomato Healthy", 90.0, "None"), 50)),
+        ("save_scans (500 rows)", _timed(lambda: db.save_scans(batch), 5)),
+        ("get_user_by_username", _timed(lambda: db.get_user_by_username("nobody"), 200)),
+        ("history first page", _timed(lambda: db.get_scan_history_page(uid), 100)),
+        ("history deep page", _timed(lambda: db.get_scan_history_page(uid, cursor), 100)),
+        ("history filtered", _timed(lambda: db.get_scan_history_page(uid, severity="High"), 100)),
+        ("get_dashboard_summary", _timed(lambda: db.get_dashboard_summary(uid), 50)),
+    ]
+    print("timings (ms per call)")
+    for name, ms in timings:
+        print(f"  {name:<24} {ms:>8.3f}")
+
+
+def _cleanup(db, user_ids):
+    if db.DB_BACKEND == "sqlite":
+        return  # temporary file
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        if db.rollups_available():  # keep the rollups consistent with what is deleted
+            for table in ("scan_daily_rollup", "scan_disease_rollup", "scan_severity_rollup", "scan_user_totals"):
+                cur.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+        cur.execute("DELETE FROM scan_history WHERE user_id = ANY(%s)", (user_ids,))
+        cur.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids,))
+        conn.commit()
+        cur.close()
+
+
+def child(n_scans: int) -> int:
+    from utils import db
+    print(f"\n═══ {db.DB_BACKEND} ═══")
+    failures, user_ids, mine = run_checks(db, n_scans)
+    try:
+        run_timings(db, user_ids[0], mine)
+    finally:
+        _cleanup(db, user_ids)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["postgres", "sqlite"], choices=["postgres", "sqlite"])
+    parser.add_argument("--scans", type=int, default=5000, help="Scans inserted for the checks")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.exit(1 if child(args.scans) else 0)
+
+    ok = check_signatures()
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            env = {**os.environ, "DB_BACKEND": backend, "DB_SQLITE_PATH": os.path.join(tmp, "conformance.db")}
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--scans", str(args.scans)],
+                                    env=env, cwd=ROOT)
+            ok = ok and result.returncode == 0
+    print("\nAll backends conform." if ok else "\nConformance failures — see above.")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,200 @@
+"""
+Evaluate a saved model against a held-out, labeled image directory.
+
+Streams <data_dir>/<class_name>/*.jpg through batched inference (images are
+decoded one batch at a time, never all at once) and reports per-class
+precision/recall, a confusion matrix, expected calibration error, and
+throughput / batch latency percentiles for each runtime.
+
+Runtimes:
+    keras   — the Keras model as app.py loads it
+    tflite  — the same model converted in memory to TensorFlow Lite
+
+Usage:
+    python evaluate_model.py --data-dir dataset/test --runtimes keras tflite --json report.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils.preprocess import preprocess_image
+
+MODEL_PATH = "models/crop_disease_model.h5"
+INDICES_PATH = "models/class_indices.json"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+ECE_BINS = 10
+
+
+# ─── Data ───
+
+def list_labeled_files(data_dir: str, class_indices: dict) -> list[tuple[str, int]]:
+    """(path, label) pairs for every image whose folder is a known class."""
+    files = []
+    for class_name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        if class_name not in class_indices:
+            print(f"Skipping unknown class folder: {class_name}")
+            continue
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.lower().endswith(IMAGE_EXTS):
+                files.append((os.path.join(class_dir, fname), class_indices[class_name]))
+    return files
+
+
+def _load(path, target_size):
+    with Image.open(path) as img:
+        return preprocess_image(img, target_size)[0]
+
+
+def iter_batches(files, batch_size, target_size, decode_threads=4):
+    """Yield (images, labels) batches, decoding the next batch while the
+    caller runs inference on the current one."""
+    with ThreadPoolExecutor(max_workers=decode_threads) as pool:
+        def submit(chunk):
+            return [pool.submit(_load, path, target_size) for path, _ in chunk]
+
+        chunks = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+        pending = submit(chunks[0]) if chunks else None
+        for i, chunk in enumerate(chunks):
+            images = np.stack([f.result() for f in pending])
+            pending = submit(chunks[i + 1]) if i + 1 < len(chunks) else None
+            yield images, np.array([label for _, label in chunk])
+
+
+# ─── Runtimes ───
+
+def keras_runtime(model):
+    return lambda x: model.predict_on_batch(x)
+
+
+def tflite_runtime(model):
+    import tensorflow as tf
+    interpreter = tf.lite.Interpreter(model_content=tf.lite.TFLiteConverter.from_keras_model(model).convert())
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    state = {"batch": None}
+
+    def predict(x):
+        if state["batch"] != len(x):
+            interpreter.resize_tensor_input(inp["index"], list(x.shape))
+            interpreter.allocate_tensors()
+            state["batch"] = len(x)
+        interpreter.set_tensor(inp["index"], x.astype(np.float32))
+        interpreter.invoke()
+        return interpreter.get_tensor(out["index"])
+
+    return predict
+
+
+RUNTIMES = {"keras": keras_runtime, "tflite": tflite_runtime}
+
+
+# ─── Metrics ───
+
+def confusion_matrix(labels, preds, num_classes):
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(cm, (labels, preds), 1)
+    return cm
+
+
+def expected_calibration_error(confidences, correct, bins=ECE_BINS):
+    """Weighted mean |accuracy - confidence| over equal-width confidence bins."""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    ece = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = (confidences > lo) & (confidences <= hi)
+        if mask.any():
+            ece += mask.mean() * abs(correct[mask].mean() - confidences[mask].mean())
+    return float(ece)
+
+
+def evaluate(predict, files, num_classes, batch_size, target_size) -> dict:
+    """Run one runtime over the files and return its metrics."""
+    labels, preds, confs, batch_ms = [], [], [], []
+    total_start = time.perf_counter()
+    for images, y in iter_batches(files, batch_size, target_size):
+        start = time.perf_counter()
+        probs = np.asarray(predict(images))
+        batch_ms.append((time.perf_counter() - start) * 1000)
+        labels.append(y)
+        preds.append(probs.argmax(axis=1))
+        confs.append(probs.max(axis=1))
+    wall = time.perf_counter() - total_start
+
+    labels, preds, confs = np.concatenate(labels), np.concatenate(preds), np.concatenate(confs)
+    cm = confusion_matrix(labels, preds, num_classes)
+    tp = np.diag(cm).astype(float)
+    precision = np.divide(tp, cm.sum(axis=0), out=np.zeros_like(tp), where=cm.sum(axis=0) > 0)
+    recall = np.divide(tp, cm.sum(axis=1), out=np.zeros_like(tp), where=cm.sum(axis=1) > 0)
+    infer_s = sum(batch_ms) / 1000
+
+    return {
+        "images": int(len(labels)),
+        "accuracy": float((preds == labels).mean()),
+        "ece": expected_calibration_error(confs, preds == labels),
+        "precision": precision.tolist(),
+        "recall": recall.tolist(),
+        "confusion_matrix": cm.tolist(),
+        "throughput_img_s": len(labels) / infer_s if infer_s else None,
+        "end_to_end_img_s": len(labels) / wall,
+        "batch_latency_ms": {
+            f"p{q}": float(np.percentile(batch_ms, q)) for q in (50, 90, 99)
+        },
+    }
+
+
+def print_report(name, result, class_names):
+    print(f"\n═══ {name} ═══")
+    print(f"Images: {result['images']}   Accuracy: {result['accuracy']:.3f}   ECE: {result['ece']:.3f}")
+    width = max(len(c) for c in class_names)
+    print(f"\n{'class':<{width}}  precision  recall")
+    for c, p, r in zip(class_names, result["precision"], result["recall"]):
+        print(f"{c:<{width}}  {p:>9.3f}  {r:>6.3f}")
+    print("\nConfusion matrix (rows = true, cols = predicted):")
+    for c, row in zip(class_names, result["confusion_matrix"]):
+        print(f"{c:<{width}}  " + " ".join(f"{v:>6}" for v in row))
+    lat = result["batch_latency_ms"]
+    print(f"\nThroughput: {result['throughput_img_s']:.1f} img/s (inference), "
+          f"{result['end_to_end_img_s']:.1f} img/s (incl. decode)")
+    print(f"Batch latency: p50 {lat['p50']:.1f} ms   p90 {lat['p90']:.1f} ms   p99 {lat['p99']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a saved crop disease model")
+    parser.add_argument("--data-dir", required=True, help="Labeled directory: <class_name>/<image>")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--indices", default=INDICES_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--runtimes", nargs="+", default=["keras"], choices=sorted(RUNTIMES))
+    parser.add_argument("--json", default=None, help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    with open(args.indices) as f:
+        class_indices = json.load(f)
+    class_names = [name for name, _ in sorted(class_indices.items(), key=lambda kv: kv[1])]
+    model = tf.keras.models.load_model(args.model)
+    target_size = (model.input_shape[2], model.input_shape[1])  # PIL wants (width, height)
+    files = list_labeled_files(args.data_dir, class_indices)
+    if not files:
+        raise SystemExit(f"No labeled images found under {args.data_dir}")
+
+    report = {}
+    for name in args.runtimes:
+        predict = RUNTIMES[name](model)
+        predict(np.zeros((args.batch_size, target_size[1], target_size[0], 3), np.float32))  # warm-up
+        report[name] = evaluate(predict, files, len(class_names), args.batch_size, target_size)
+        print_report(name, report[name], class_names)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"classes": class_names, "runtimes": report}, f, indent=2)
+        print(f"\nReport written to {args.json}")
@@ -0,0 +1,176 @@
+"""
+Synthetic dataset generator for training, batch-scoring and scale tests.
+
+Writes `images_per_class` JPEGs for each of `num_classes` classes in the
+flow_from_directory layout (<out_dir>/<class_name>/img_N.jpg), and can also
+emit pre-decoded uint8 .npy shards that skip JPEG decoding entirely.
+
+Output is deterministic for a given seed: every chunk of images draws from
+its own RNG seeded by (seed, class, chunk), so the result does not depend
+on the number of worker processes.
+
+Usage:
+    python generate_data.py --out-dir dataset/scale --classes 100 --per-class 10000 \
+        --resolutions 224 256x192 --quality 85 --format both
+"""
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_CLASSES = ["Tomato_Early_Blight", "Tomato_Late_Blight", "Tomato_Healthy"]
+CHUNK_SIZE = 256  # images per task; also the number of images per shard
+
+
+def class_names(num_classes: int) -> list[str]:
+    """The original three tomato classes first, then numbered synthetic ones."""
+    names = DEFAULT_CLASSES[:num_classes]
+    names += [f"Synthetic_Class_{i:03d}" for i in range(len(names), num_classes)]
+    return names
+
+
+def parse_resolution(value: str) -> tuple[int, int]:
+    """'224' -> (224, 224); '256x192' -> (256, 192) as (width, height)."""
+    w, _, h = value.lower().partition("x")
+    return int(w), int(h or w)
+
+
+def _synth_image(rng, class_idx, num_classes, size):
+    """A class-tinted gradient plus noise, so classes are (weakly) separable."""
+    w, h = size
+    hue = class_idx / max(1, num_classes)
+    base = np.array([np.sin(2 * np.pi * (hue + k / 3)) * 0.5 + 0.5 for k in range(3)]) * 160
+    ramp = np.linspace(0, 60, w, dtype=np.float32)[None, :, None]
+    noise = rng.integers(0, 96, (h, w, 3), dtype=np.uint8)
+    return np.clip(base[None, None, :] + ramp + noise, 0, 255).astype(np.uint8)
+
+
+def _generate_chunk(task):
+    """Worker: render one chunk of a class, write its JPEGs and/or shard."""
+    (out_dir, shard_dir, class_idx, class_name, num_classes, start, count,
+     resolutions, shard_size, quality, seed, write_jpeg) = task
+    rng = np.random.default_rng([seed, class_idx, start])
+    class_dir = os.path.join(out_dir, class_name)
+    shard = np.empty((count, shard_size[1], shard_size[0], 3), dtype=np.uint8) if shard_dir else None
+    written = 0
+
+    for j in range(count):
+        size = resolutions[rng.integers(len(resolutions))]
+        pixels = _synth_image(rng, class_idx, num_classes, size)
+        img = Image.fromarray(pixels)
+        if write_jpeg:
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality)
+            with open(os.path.join(class_dir, f"img_{start + j}.jpg"), "wb") as f:
+                f.write(buf.getbuffer())
+            written += buf.tell()
+        if shard is not None:
+            shard[j] = np.asarray(img.resize(shard_size) if size != shard_size else img)
+
+    if shard is not None:
+        stem = os.path.join(shard_dir, f"shard_{class_idx:04d}_{start:07d}")
+        np.save(f"{stem}_images.npy", shard)
+        np.save(f"{stem}_labels.npy", np.full(count, class_idx, dtype=np.int32))
+        written += shard.nbytes
+    return count, written
+
+
+def generate_dataset(
+    out_dir: str,
+    num_classes: int = 3,
+    images_per_class: int = 10,
+    resolutions=((224, 224),),
+    quality: int = 75,
+    seed: int = 0,
+    fmt: str = "jpeg",
+    shard_size=None,
+    workers=None,
+    skip_existing: bool = True,
+) -> dict:
+    """Generate a synthetic dataset and return a summary dict.
+
+    fmt is "jpeg", "shards" or "both". Shards go next to the dataset in
+    <out_dir>_shards (inside it, flow_from_directory would treat them as a
+    class) as paired *_images.npy / *_labels.npy files at `shard_size`
+    (default: the first resolution), readable with np.load(mmap_mode="r").
+    """
+    resolutions = [tuple(r) for r in resolutions]
+    shard_size = tuple(shard_size or resolutions[0])
+    write_jpeg = fmt in ("jpeg", "both")
+    shard_dir = os.path.normpath(out_dir) + "_shards" if fmt in ("shards", "both") else None
+    names = class_names(num_classes)
+
+    os.makedirs(out_dir, exist_ok=True)
+    if shard_dir:
+        os.makedirs(shard_dir, exist_ok=True)
+
+    tasks = []
+    for class_idx, name in enumerate(names):
+        class_dir = os.path.join(out_dir, name)
+        if write_jpeg:
+            if skip_existing and os.path.isdir(class_dir):
+                continue
+            os.makedirs(class_dir, exist_ok=True)
+        for start in range(0, images_per_class, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, images_per_class - start)
+            tasks.append((out_dir, shard_dir, class_idx, name, num_classes, start, count,
+                          resolutions, shard_size, quality, seed, write_jpeg))
+
+    start_time = time.perf_counter()
+    images = nbytes = 0
+    if len(tasks) <= 1 or workers == 1:
+        for count, written in map(_generate_chunk, tasks):
+            images, nbytes = images + count, nbytes + written
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for count, written in pool.map(_generate_chunk, tasks, chunksize=4):
+                images, nbytes = images + count, nbytes + written
+    elapsed = time.perf_counter() - start_time
+
+    if shard_dir:
+        with open(os.path.join(shard_dir, "manifest.json"), "w") as f:
+            json.dump({"classes": names, "image_size": shard_size, "seed": seed}, f, indent=2)
+
+    return {
+        "classes": len(names),
+        "images": images,
+        "bytes": nbytes,
+        "seconds": round(elapsed, 2),
+        "images_per_sec": round(images / elapsed, 1) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crop leaf dataset")
+    parser.add_argument("--out-dir", default="dataset/train")
+    parser.add_argument("--classes", type=int, default=3)
+    parser.add_argument("--per-class", type=int, default=10)
+    parser.add_argument("--resolutions", nargs="+", default=["224"], help="e.g. 224 256x192")
+    parser.add_argument("--quality", type=int, default=75, help="JPEG quality (1-95)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["jpeg", "shards", "both"], default="jpeg")
+    parser.add_argument("--shard-size", default=None, help="Shard image size (default: first resolution)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate existing class folders")
+    args = parser.parse_args()
+
+    summary = generate_dataset(
+        args.out_dir,
+        num_classes=args.classes,
+        images_per_class=args.per_class,
+        resolutions=[parse_resolution(r) for r in args.resolutions],
+        quality=args.quality,
+        seed=args.seed,
+        fmt=args.format,
+        shard_size=parse_resolution(args.shard_size) if args.shard_size else None,
+        workers=args.workers,
+        skip_existing=not args.overwrite,
+    )
+    print(f"Generated {summary['images']} images across {summary['classes']} classes "
+          f"({summary['bytes'] / 1e6:.1f} MB) in {summary['seconds']}s "
+          f"— {summary['images_per_sec']} img/s")
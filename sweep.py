@@ -0,0 +1,245 @@
+"""
+Hyperparameter sweep over the training configuration in train_model.py.
+
+Runs each trial in its own worker process with a fixed CPU thread budget,
+prunes trials whose validation accuracy falls below the running median, and
+writes a leaderboard with accuracy, model size and inference latency.
+
+Usage:
+    python sweep.py --spec sweep_spec.json --threads-per-trial 2
+
+Example spec (grid search):
+    {
+        "method": "grid",
+        "epochs": 5,
+        "params": {
+            "batch_size": [4, 8],
+            "learning_rate": [0.001, 0.0001],
+            "img_size": [128, 224],
+            "width": [8, 16, 32]
+        }
+    }
+
+For "method": "random", add "num_trials" and "seed". A parameter can then
+also be a range: {"min": 0.0001, "max": 0.01, "log": true}.
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_OUT_DIR = "sweeps"
+LATENCY_RUNS = 20
+LEADERBOARD_FIELDS = [
+    "rank", "trial", "status", "val_accuracy", "epochs_run",
+    "model_size_kb", "latency_p50_ms", "latency_p95_ms", "train_seconds",
+    "batch_size", "learning_rate", "img_size", "width",
+]
+
+
+# ─── Search Space ───
+
+def _sample_value(space, rng):
+    if isinstance(space, dict):
+        lo, hi = space["min"], space["max"]
+        if space.get("log"):
+            return math.exp(rng.uniform(math.log(lo), math.log(hi)))
+        value = rng.uniform(lo, hi)
+        return int(round(value)) if isinstance(lo, int) and isinstance(hi, int) else value
+    return rng.choice(space)
+
+
+def build_trials(spec: dict) -> list[dict]:
+    """Expand a sweep spec into a list of trial parameter dicts."""
+    params = spec["params"]
+    method = spec.get("method", "grid")
+    if method == "grid":
+        names = list(params)
+        return [dict(zip(names, combo)) for combo in itertools.product(*(params[n] for n in names))]
+    if method == "random":
+        rng = random.Random(spec.get("seed", 0))
+        return [
+            {name: _sample_value(space, rng) for name, space in params.items()}
+            for _ in range(spec.get("num_trials", 10))
+        ]
+    raise ValueError(f"Unknown sweep method: {method}")
+
+
+# ─── Worker Side ───
+
+def _init_worker(threads: int):
+    """Pin the TensorFlow thread pools before any op runs in this process."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _make_pruner(trial_id, scores, lock, warmup_epochs, min_trials):
+    """Median pruning: stop a trial whose val_accuracy is below the median
+    of the other trials that reached the same epoch."""
+    import tensorflow as tf
+
+    class MedianPruner(tf.keras.callbacks.Callback):
+        pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            acc = (logs or {}).get("val_accuracy")
+            if acc is None:
+                return
+            with lock:
+                seen = list(scores.get(epoch, []))
+                scores[epoch] = seen + [acc]
+            if epoch + 1 < warmup_epochs or len(seen) < min_trials:
+                return
+            if acc < statistics.median(seen):
+                print(f"[trial {trial_id}] pruned at epoch {epoch + 1} (val_accuracy={acc:.3f})")
+                self.pruned = True
+                self.model.stop_training = True
+
+    return MedianPruner()
+
+
+def _measure_latency(model, img_size, runs=LATENCY_RUNS) -> tuple[float, float]:
+    """Single-image predict latency (p50, p95) in ms, as the app calls it."""
+    import numpy as np
+    x = np.random.rand(1, img_size[0], img_size[1], 3).astype("float32")
+    model.predict(x, verbose=0)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(x, verbose=0)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def run_trial(trial_id, params, epochs, dataset_dir, out_dir, scores, lock,
+              warmup_epochs, min_trials) -> dict:
+    """Train one configuration and return its leaderboard row."""
+    import train_model
+
+    trial_dir = os.path.join(out_dir, f"trial_{trial_id:03d}")
+    os.makedirs(trial_dir, exist_ok=True)
+    img_size = (int(params.get("img_size", train_model.IMG_SIZE[0])),) * 2
+    config = {
+        "batch_size": int(params.get("batch_size", train_model.BATCH_SIZE)),
+        "learning_rate": float(params.get("learning_rate", train_model.LEARNING_RATE)),
+        "img_size": img_size[0],
+        "width": int(params.get("width", train_model.WIDTH)),
+    }
+    model_path = os.path.join(trial_dir, "model.h5")
+    pruner = _make_pruner(trial_id, scores, lock, warmup_epochs, min_trials)
+
+    start = time.perf_counter()
+    model, history = train_model.train(
+        img_size=img_size,
+        batch_size=config["batch_size"],
+        epochs=epochs,
+        learning_rate=config["learning_rate"],
+        width=config["width"],
+        dataset_dir=dataset_dir,
+        model_save_path=model_path,
+        indices_save_path=os.path.join(trial_dir, "class_indices.json"),
+        callbacks=[pruner],
+        verbose=0,
+        export_formats=(),
+    )
+    train_seconds = time.perf_counter() - start
+
+    val_acc = history.history.get("val_accuracy", [0.0])
+    p50, p95 = _measure_latency(model, img_size)
+    with open(os.path.join(trial_dir, "params.json"), "w") as f:
+        json.dump(config, f, indent=2)
+
+    return {
+        "trial": trial_id,
+        "status": "pruned" if pruner.pruned else "complete",
+        "val_accuracy": round(max(val_acc), 4),
+        "epochs_run": len(val_acc),
+        "model_size_kb": round(os.path.getsize(model_path) / 1024, 1),
+        "latency_p50_ms": round(p50, 2),
+        "latency_p95_ms": round(p95, 2),
+        "train_seconds": round(train_seconds, 1),
+        **config,
+    }
+
+
+# ─── Driver ───
+
+def write_leaderboard(rows: list[dict], out_dir: str) -> str:
+    """Rank completed trials first by accuracy, then by latency."""
+    rows = sorted(rows, key=lambda r: (r["status"] != "complete", -r["val_accuracy"], r["latency_p50_ms"]))
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+    path = os.path.join(out_dir, "leaderboard.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=LEADERBOARD_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(out_dir, "leaderboard.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    return path
+
+
+def run_sweep(spec: dict, out_dir=DEFAULT_OUT_DIR, workers=None, threads_per_trial=2,
+              warmup_epochs=1, min_trials=3) -> list[dict]:
+    """Run every trial of the spec in a process pool and return the leaderboard rows."""
+    from train_model import DATASET_DIR, EPOCHS, ensure_dataset
+
+    dataset_dir = spec.get("dataset_dir", DATASET_DIR)
+    epochs = spec.get("epochs", EPOCHS)
+    trials = build_trials(spec)
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_trial)
+    os.makedirs(out_dir, exist_ok=True)
+    ensure_dataset(dataset_dir)  # once, so workers don't race to generate it
+
+    print(f"Running {len(trials)} trials on {workers} workers x {threads_per_trial} threads")
+    ctx = mp.get_context("spawn")
+    rows = []
+    with ctx.Manager() as manager:
+        scores, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(threads_per_trial,)) as pool:
+            futures = {
+                pool.submit(run_trial, i, params, epochs, dataset_dir, out_dir,
+                            scores, lock, warmup_epochs, min_trials): i
+                for i, params in enumerate(trials)
+            }
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print(f"[trial {futures[future]}] failed: {type(e).__name__}: {e}")
+                    continue
+                rows.append(row)
+                print(f"[trial {row['trial']}] {row['status']}  acc={row['val_accuracy']:.3f}  "
+                      f"size={row['model_size_kb']}KB  p50={row['latency_p50_ms']}ms")
+
+    path = write_leaderboard(rows, out_dir)
+    print(f"Leaderboard written to {path}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep for the crop disease CNN")
+    parser.add_argument("--spec", required=True, help="Path to a JSON sweep spec")
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel trials (default: cores / threads)")
+    parser.add_argument("--threads-per-trial", type=int, default=2)
+    parser.add_argument("--warmup-epochs", type=int, default=1, help="Epochs before pruning may start")
+    parser.add_argument("--min-trials", type=int, default=3, help="Trials needed at an epoch before pruning")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        sweep_spec = json.load(f)
+    run_sweep(sweep_spec, args.out_dir, args.workers, args.threads_per_trial,
+              args.warmup_epochs, args.min_trials)
@@ -2,102 +2,288 @@ import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
+import argparse
 import os
-import numpy as np
-from PIL import Image
+import socket
+import subprocess
+import sys
+import tempfile
+import time
 import json
+from generate_data import generate_dataset
+from utils.model_store import EXPORT_FORMATS, export_model
 
 # Configuration
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 4
 EPOCHS = 5
+LEARNING_RATE = 0.001
+WIDTH = 16  # filters in the first conv layer; later layers scale from it
 DATASET_DIR = "dataset/train"
 MODEL_SAVE_PATH = "models/crop_disease_model.h5"
 INDICES_SAVE_PATH = "models/class_indices.json"
 
 # --- Step 1: Generate Dummy Data (If needed) ---
-def generate_dummy_data():
-    classes = ["Tomato_Early_Blight", "Tomato_Late_Blight", "Tomato_Healthy"]
-    
-    if not os.path.exists(DATASET_DIR):
-        os.makedirs(DATASET_DIR)
-        
-    for class_name in classes:
-        class_dir = os.path.join(DATASET_DIR, class_name)
-        if not os.path.exists(class_dir):
-            os.makedirs(class_dir)
-            print(f"Generating dummy images for {class_name}...")
-            # Generate 10 random images per class
-            for i in range(10):
-                # Random noise image
-                img_array = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
-                img = Image.fromarray(img_array)
-                img.save(os.path.join(class_dir, f"img_{i}.jpg"))
-
-print("Checking for dataset...")
-# Check if dataset has images, if not generate them
-if not os.path.exists(DATASET_DIR) or not os.listdir(DATASET_DIR):
-    generate_dummy_data()
-else:
-    # Check if subfolders exist
-    if not any(os.path.isdir(os.path.join(DATASET_DIR, d)) for d in os.listdir(DATASET_DIR)):
-        generate_dummy_data()
-
-print("Dataset ready.")
+def generate_dummy_data(dataset_dir=DATASET_DIR):
+    """Generate a small synthetic dataset (3 classes x 10 images).
+
+    See generate_data.py for larger, configurable datasets.
+    """
+    print("Generating dummy images...")
+    generate_dataset(dataset_dir, num_classes=3, images_per_class=10, resolutions=[IMG_SIZE])
+
+
+def ensure_dataset(dataset_dir=DATASET_DIR):
+    """Generate dummy data if the dataset directory has no class folders."""
+    print("Checking for dataset...")
+    # Check if dataset has images, if not generate them
+    if not os.path.exists(dataset_dir) or not os.listdir(dataset_dir):
+        generate_dummy_data(dataset_dir)
+    else:
+        # Check if subfolders exist
+        if not any(os.path.isdir(os.path.join(dataset_dir, d)) for d in os.listdir(dataset_dir)):
+            generate_dummy_data(dataset_dir)
+
+    print("Dataset ready.")
+
 
 # --- Step 2: Load Data ---
-print("Loading data...")
-train_datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
+def load_data(dataset_dir=DATASET_DIR, img_size=IMG_SIZE, batch_size=BATCH_SIZE):
+    """Return (train_generator, validation_generator) for the dataset directory."""
+    print("Loading data...")
+    train_datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
 
-train_generator = train_datagen.flow_from_directory(
-    DATASET_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='training'
-)
+    train_generator = train_datagen.flow_from_directory(
+        dataset_dir,
+        target_size=img_size,
+        batch_size=batch_size,
+        class_mode='categorical',
+        subset='training'
+    )
 
-validation_generator = train_datagen.flow_from_directory(
-    DATASET_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='validation'
-)
+    validation_generator = train_datagen.flow_from_directory(
+        dataset_dir,
+        target_size=img_size,
+        batch_size=batch_size,
+        class_mode='categorical',
+        subset='validation'
+    )
+    return train_generator, validation_generator
 
-# Save class indices for later use in prediction
-class_indices = train_generator.class_indices
-print(f"Classes found: {class_indices}")
-with open(INDICES_SAVE_PATH, 'w') as f:
-    json.dump(class_indices, f)
-    print(f"Saved class indices to {INDICES_SAVE_PATH}")
 
 # --- Step 3: Build Model ---
-print("Building model...")
-model = Sequential([
-    Conv2D(16, (3, 3), activation='relu', input_shape=(224, 224, 3)),
-    MaxPooling2D(2, 2),
-    Conv2D(32, (3, 3), activation='relu'),
-    MaxPooling2D(2, 2),
-    Flatten(),
-    Dense(64, activation='relu'),
-    Dense(len(class_indices), activation='softmax')
-])
-
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-model.summary()
-
-# --- Step 4: Train Model ---
-print("Starting training...")
-history = model.fit(
-    train_generator,
-    steps_per_epoch=train_generator.samples // BATCH_SIZE,
+def build_model(num_classes, img_size=IMG_SIZE, width=WIDTH, learning_rate=LEARNING_RATE):
+    """Build and compile the CNN. `width` scales the number of filters/units."""
+    print("Building model...")
+    model = Sequential([
+        Conv2D(width, (3, 3), activation='relu', input_shape=(img_size[0], img_size[1], 3)),
+        MaxPooling2D(2, 2),
+        Conv2D(width * 2, (3, 3), activation='relu'),
+        MaxPooling2D(2, 2),
+        Flatten(),
+        Dense(width * 4, activation='relu'),
+        Dense(num_classes, activation='softmax')
+    ])
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+
+def train(
+    img_size=IMG_SIZE,
+    batch_size=BATCH_SIZE,
+    epochs=EPOCHS,
+    learning_rate=LEARNING_RATE,
+    width=WIDTH,
+    dataset_dir=DATASET_DIR,
+    model_save_path=MODEL_SAVE_PATH,
+    indices_save_path=INDICES_SAVE_PATH,
+    callbacks=None,
+    verbose=1,
+    export_formats=EXPORT_FORMATS,
+):
+    """Run the full training pipeline and return (model, history)."""
+    ensure_dataset(dataset_dir)
+    train_generator, validation_generator = load_data(dataset_dir, img_size, batch_size)
+
+    # Save class indices for later use in prediction
+    class_indices = train_generator.class_indices
+    print(f"Classes found: {class_indices}")
+    with open(indices_save_path, 'w') as f:
+        json.dump(class_indices, f)
+        print(f"Saved class indices to {indices_save_path}")
+
+    model = build_model(len(class_indices), img_size, width, learning_rate)
+    if verbose:
+        model.summary()
+
+    # --- Step 4: Train Model ---
+    print("Starting training...")
+    history = model.fit(
+        train_generator,
+        steps_per_epoch=max(1, train_generator.samples // batch_size),
+        epochs=epochs,
+        validation_data=validation_generator,
+        validation_steps=max(1, validation_generator.samples // batch_size),
+        callbacks=callbacks,
+        verbose=verbose,
+    )
+
+    # --- Step 5: Save Model ---
+    model.save(model_save_path)
+    print(f"Model saved to {model_save_path}")
+    export_model(model, os.path.splitext(model_save_path)[0], export_formats)
+    return model, history
+
+
+# --- Data-Parallel Training (multi-worker) ---
+def load_sharded_dataset(dataset_dir=DATASET_DIR, img_size=IMG_SIZE, batch_size=BATCH_SIZE, seed=123):
+    """tf.data version of load_data() whose batches are sharded across workers.
+
+    Returns (train_ds, val_ds, class_indices). Class order matches
+    flow_from_directory (sorted folder names), so class_indices.json is
+    interchangeable between the two paths.
+    """
+    common = dict(
+        validation_split=0.2, seed=seed, image_size=img_size,
+        batch_size=batch_size, label_mode="categorical",
+    )
+    train_ds = tf.keras.utils.image_dataset_from_directory(dataset_dir, subset="training", **common)
+    val_ds = tf.keras.utils.image_dataset_from_directory(dataset_dir, subset="validation", **common)
+    class_indices = {name: i for i, name in enumerate(train_ds.class_names)}
+
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    rescale = lambda x, y: (x / 255.0, y)
+    train_ds = train_ds.map(rescale, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    val_ds = val_ds.map(rescale, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    return train_ds.with_options(options), val_ds.with_options(options), class_indices
+
+
+def train_multi_worker(
+    img_size=IMG_SIZE,
+    batch_size=BATCH_SIZE,
     epochs=EPOCHS,
-    validation_data=validation_generator,
-    validation_steps=validation_generator.samples // BATCH_SIZE
-)
-
-# --- Step 5: Save Model ---
-model.save(MODEL_SAVE_PATH)
-print(f"Model saved to {MODEL_SAVE_PATH}")
-print("Training Complete! ✅")
+    learning_rate=LEARNING_RATE,
+    width=WIDTH,
+    dataset_dir=DATASET_DIR,
+    model_save_path=MODEL_SAVE_PATH,
+    indices_save_path=INDICES_SAVE_PATH,
+    stats_path=None,
+):
+    """Worker entry point for MultiWorkerMirroredStrategy training.
+
+    Reads the cluster from TF_CONFIG. `batch_size` is per worker; gradients
+    are all-reduced every step. Only the chief writes the real model file
+    (same .h5 format train() produces, so app.py loads it unchanged).
+    """
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    task = json.loads(os.environ["TF_CONFIG"])["task"]
+    is_chief = task["index"] == 0
+    num_workers = strategy.num_replicas_in_sync
+
+    train_ds, val_ds, class_indices = load_sharded_dataset(
+        dataset_dir, img_size, batch_size * num_workers
+    )
+    with strategy.scope():
+        model = build_model(len(class_indices), img_size, width, learning_rate)
+
+    start = time.perf_counter()
+    history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, verbose=2 if is_chief else 0)
+    fit_seconds = time.perf_counter() - start
+
+    # Every worker must take part in saving; non-chiefs write to a scratch dir.
+    if is_chief:
+        model.save(model_save_path)
+        with open(indices_save_path, 'w') as f:
+            json.dump(class_indices, f)
+        print(f"Model saved to {model_save_path}")
+        export_model(model, os.path.splitext(model_save_path)[0])
+    else:
+        with tempfile.TemporaryDirectory() as scratch:
+            model.save(os.path.join(scratch, "model.h5"))
+
+    if is_chief and stats_path:
+        with open(stats_path, "w") as f:
+            json.dump({
+                "workers": num_workers,
+                "fit_seconds": fit_seconds,
+                "epochs": epochs,
+                "steps_per_epoch": int(train_ds.cardinality()),
+                "global_batch_size": batch_size * num_workers,
+                "val_accuracy": float(history.history["val_accuracy"][-1]),
+            }, f)
+    return model, history
+
+
+def _free_ports(n):
+    socks = [socket.socket() for _ in range(n)]
+    for s in socks:
+        s.bind(("localhost", 0))
+    ports = [s.getsockname()[1] for s in socks]
+    for s in socks:
+        s.close()
+    return ports
+
+
+def launch_workers(num_workers, threads_per_worker=None, extra_args=(), stats_path=None):
+    """Start `num_workers` local worker processes and wait for them.
+
+    Each worker gets its own TF_CONFIG and an equal share of the CPU
+    threads. Returns the wall-clock seconds for the whole run.
+    """
+    ensure_dataset(DATASET_DIR)  # once, before workers race to read it
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    workers = [f"localhost:{p}" for p in _free_ports(num_workers)]
+    procs = []
+    start = time.perf_counter()
+    for index in range(num_workers):
+        env = dict(
+            os.environ,
+            TF_CONFIG=json.dumps({"cluster": {"worker": workers}, "task": {"type": "worker", "index": index}}),
+            OMP_NUM_THREADS=str(threads),
+            TF_NUM_INTRAOP_THREADS=str(threads),
+            TF_NUM_INTEROP_THREADS="1",
+            TF_CPP_MIN_LOG_LEVEL="2",
+        )
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", *extra_args]
+        if stats_path:
+            cmd += ["--stats-path", stats_path]
+        procs.append(subprocess.Popen(cmd, env=env))
+    codes = [p.wait() for p in procs]
+    elapsed = time.perf_counter() - start
+    if any(codes):
+        raise RuntimeError(f"Worker processes failed with exit codes {codes}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the crop disease CNN")
+    parser.add_argument("--workers", type=int, default=1, help="Local data-parallel worker processes")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Per-worker batch size")
+    parser.add_argument("--model-path", default=MODEL_SAVE_PATH)
+    parser.add_argument("--indices-path", default=INDICES_SAVE_PATH)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stats-path", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        train_multi_worker(
+            epochs=args.epochs, batch_size=args.batch_size, model_save_path=args.model_path,
+            indices_save_path=args.indices_path, stats_path=args.stats_path,
+        )
+    elif args.workers > 1:
+        launch_workers(args.workers, extra_args=[
+            "--epochs", str(args.epochs), "--batch-size", str(args.batch_size),
+            "--model-path", args.model_path, "--indices-path", args.indices_path,
+        ])
+        print("Training Complete! ✅")
+    else:
+        train(epochs=args.epochs, batch_size=args.batch_size,
+              model_save_path=args.model_path, indices_save_path=args.indices_path)
+        print("Training Complete! ✅")
@@ -1,23 +1,177 @@
+"""
+Password hashing, verification and registration checks.
+
+Passwords are hashed with scrypt (or PBKDF2-SHA256 with
+PASSWORD_HASH_ALGORITHM=pbkdf2_sha256). The algorithm and its cost are
+stored in the hash string, so costs can be raised later without breaking
+existing logins:
+
+    scrypt$n=8192,r=8,p=1$<salt hex>$<hash hex>
+    pbkdf2_sha256$600000$<salt hex>$<hash hex>
+
+The key derivation runs on a small worker pool (AUTH_WORKERS threads;
+hashlib releases the GIL), so concurrent sign-ins cannot oversubscribe the
+CPU or, with scrypt, memory. Hashes in the old single-SHA-256 `salt:hash`
+format still verify and are upgraded after the next successful login (see
+needs_rehash / rehash_password). benchmarks/bench_password_hashing.py
+sizes the cost for a target login latency: the default N=2^13 keeps p99
+under 500 ms with 8 concurrent sign-ins on one CPU (2^14 measured ~530 ms).
+"""
 import hashlib
+import hmac
+import os
 import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
+PASSWORD_HASH_ALGORITHM = os.environ.get("PASSWORD_HASH_ALGORITHM", "scrypt")
+SCRYPT_N = int(os.environ.get("SCRYPT_N", 2 ** 13))       # CPU/memory cost (power of two)
+SCRYPT_R = int(os.environ.get("SCRYPT_R", 8))             # block size; memory = 128 * n * r bytes
+SCRYPT_P = int(os.environ.get("SCRYPT_P", 1))
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", 600_000))
 
-def hash_password(password: str) -> str:
-    """Hash a password using SHA-256 with a random salt."""
-    salt = secrets.token_hex(16)
-    hashed = hashlib.sha256((salt + password).encode()).hexdigest()
-    return f"{salt}:{hashed}"
+AUTH_WORKERS = int(os.environ.get("AUTH_WORKERS", min(4, os.cpu_count() or 1)))
+AUTH_MAX_PENDING = int(os.environ.get("AUTH_MAX_PENDING", 64))         # queued + running hashes
+AUTH_QUEUE_TIMEOUT = float(os.environ.get("AUTH_QUEUE_TIMEOUT", 10))   # seconds to wait for a slot
 
 
-def verify_password(password: str, stored_hash: str) -> bool:
-    """Verify a password against a stored hash."""
+class AuthBusyError(RuntimeError):
+    """Raised when AUTH_MAX_PENDING hashes are already waiting for the pool."""
+
+
+# ─── Key Derivation ───
+
+def current_params(algorithm: str = PASSWORD_HASH_ALGORITHM) -> dict:
+    """Cost parameters new hashes are made with."""
+    if algorithm == "scrypt":
+        return {"n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P}
+    if algorithm == "pbkdf2_sha256":
+        return {"iterations": PBKDF2_ITERATIONS}
+    raise ValueError(f"Unknown password hash algorithm: {algorithm!r} (expected 'scrypt' or 'pbkdf2_sha256')")
+
+
+def _derive(algorithm: str, params: dict, password: str, salt: bytes) -> bytes:
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=2 * 128 * n * r * p + 2 ** 20, dklen=32)
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["iterations"])
+    raise ValueError(f"Unknown password hash algorithm: {algorithm!r}")
+
+
+def _encode(algorithm: str, params: dict, salt: bytes, key: bytes) -> str:
+    if algorithm == "scrypt":
+        cost = f"n={params['n']},r={params['r']},p={params['p']}"
+    else:
+        cost = str(params["iterations"])
+    return f"{algorithm}${cost}${salt.hex()}${key.hex()}"
+
+
+def _decode(stored_hash: str) -> tuple[str, dict, bytes, bytes]:
+    algorithm, cost, salt, key = stored_hash.split("$")
+    if algorithm == "scrypt":
+        params = {k: int(v) for k, v in (item.split("=") for item in cost.split(","))}
+    else:
+        params = {"iterations": int(cost)}
+    return algorithm, params, bytes.fromhex(salt), bytes.fromhex(key)
+
+
+def _hash(password: str, algorithm: str = PASSWORD_HASH_ALGORITHM, params: dict | None = None) -> str:
+    params = params or current_params(algorithm)
+    salt = secrets.token_bytes(16)
+    return _encode(algorithm, params, salt, _derive(algorithm, params, password, salt))
+
+
+def _verify(password: str, stored_hash: str) -> bool:
     try:
-        salt, hashed = stored_hash.split(":")
-        return hashlib.sha256((salt + password).encode()).hexdigest() == hashed
+        if "$" not in stored_hash:  # legacy salt:sha256
+            salt, hashed = stored_hash.split(":")
+            candidate = hashlib.sha256((salt + password).encode()).hexdigest()
+            return hmac.compare_digest(candidate, hashed)
+        algorithm, params, salt, key = _decode(stored_hash)
+        return hmac.compare_digest(_derive(algorithm, params, password, salt), key)
     except Exception:
         return False
 
 
+# ─── Worker Pool ───
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(AUTH_MAX_PENDING)
+
+
+def _submit(fn, *args, timeout: float = AUTH_QUEUE_TIMEOUT) -> Future:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+    if not _slots.acquire(timeout=timeout):
+        raise AuthBusyError("Too many password checks in progress")
+    try:
+        future = _pool.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured KDF and a random salt."""
+    return _submit(_hash, password).result()
+
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    """Verify a password against a stored hash (any supported format)."""
+    return _submit(_verify, password, stored_hash).result()
+
+
+_dummy_hash = None
+_dummy_lock = threading.Lock()
+
+
+def verify_login(password: str, stored_hash: str | None) -> bool:
+    """verify_password for a sign-in. For an unknown user (stored_hash None)
+    the password is checked against a dummy hash at the current cost and
+    False returned, so unknown usernames take as long as wrong passwords."""
+    global _dummy_hash
+    if stored_hash is not None:
+        return verify_password(password, stored_hash)
+    if _dummy_hash is None:
+        with _dummy_lock:
+            if _dummy_hash is None:
+                _dummy_hash = hash_password(secrets.token_hex(16))
+    verify_password(password, _dummy_hash)
+    return False
+
+
+def needs_rehash(stored_hash: str) -> bool:
+    """True for legacy hashes, ones made with another algorithm, and ones
+    below the current cost (a lowered cost does not rehash existing ones)."""
+    try:
+        algorithm, params, _, _ = _decode(stored_hash)
+    except ValueError:
+        return True
+    if algorithm != PASSWORD_HASH_ALGORITHM:
+        return True
+    current = current_params()
+    return any(params.get(name, 0) < value for name, value in current.items())
+
+
+def rehash_password(password: str, save) -> Future | None:
+    """Hash the password with the current settings on the pool and pass it to
+    save(new_hash), without making the caller wait. Call after a successful
+    login when needs_rehash() is true; skipped (None) while the pool is
+    saturated, to be retried at the next login."""
+    try:
+        return _submit(lambda: save(_hash(password)), timeout=0)
+    except AuthBusyError:
+        return None
+
+
 def validate_registration(username: str, email: str, password: str, confirm: str) -> list[str]:
     """Validate registration inputs. Returns list of errors (empty = valid)."""
     errors = []
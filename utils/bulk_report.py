@@ -0,0 +1,210 @@
+"""
+Bulk PDF reports for many scans, written into a ZIP archive.
+
+Scans are streamed from the database in batches (utils/export.py) and
+rendered in a pool of worker processes, so a run over thousands of scans
+uses every core. Two modes:
+
+  individual - one report per scan, the same as the Detect page's
+               download, filed as <username>/<time>_<id>_<disease>.pdf
+  combined   - one multi-page document: a summary, a table of every scan
+               per user and treatment guidance for each disease found.
+               Split into parts of SCANS_PER_DOCUMENT scans.
+
+Only a bounded number of batches is in flight at once and each PDF is
+written to the archive as soon as it is ready, so memory stays flat however
+many scans are reported.
+
+Usage:
+    python -m utils.bulk_report --user alice --since 2026-10-12 --out alice_week.zip
+    python -m utils.bulk_report --all --mode combined --since 2026-10-12 --until 2026-10-18 --out weekly.zip
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from utils import db
+from utils.export import EXPORT_COLUMNS, iter_scan_batches
+from utils.recommendations import get_recommendation
+from utils.report import DISCLAIMER, CropReport, generate_report_pdf
+
+REPORT_MODES = ("individual", "combined")
+BULK_REPORT_WORKERS = int(os.environ.get("BULK_REPORT_WORKERS", os.cpu_count() or 1))
+BATCH_SIZE = int(os.environ.get("BULK_REPORT_BATCH_SIZE", 200))          # scans per worker task
+SCANS_PER_DOCUMENT = int(os.environ.get("BULK_REPORT_SCANS_PER_DOCUMENT", 5000))
+
+SEVERITY_RGB = {"None": (16, 185, 129), "Low": (210, 160, 8), "Moderate": (220, 100, 22), "High": (200, 50, 50)}
+
+
+def _recommendation(disease_name: str) -> dict:
+    # History stores the display name ("Tomato Late Blight"); recommendations use the class name
+    return get_recommendation(disease_name.replace(" ", "_"))
+
+
+# ─── Rendering (worker processes) ───
+
+def render_individual(rows: list[tuple]) -> list[tuple[str, bytes]]:
+    """One report per scan row, named for the archive."""
+    files = []
+    for row in rows:
+        scan = dict(zip(EXPORT_COLUMNS, row))
+        info = _recommendation(scan["disease_name"])
+        pdf = generate_report_pdf(
+            username=scan["username"],
+            disease_name=scan["disease_name"],
+            confidence=scan["confidence"],
+            severity=scan["severity"],
+            description=info.get("description", ""),
+            treatments=info.get("treatment", []),
+            scanned_at=scan["scanned_at"],
+        )
+        name = (f"{scan['username']}/{scan['scanned_at']:%Y%m%d_%H%M%S}_{scan['id']}_"
+                f"{scan['disease_name'].replace(' ', '_')}.pdf")
+        files.append((name, pdf))
+    return files
+
+
+def render_combined(rows: list[tuple], name: str, period: str) -> list[tuple[str, bytes]]:
+    """One document covering every scan row (ordered by user, then time)."""
+    scans = [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+    pdf = CropReport()
+    pdf.set_margins(left=15, top=10, right=15)
+    pdf.set_auto_page_break(auto=True, margin=20)
+    pdf.add_page()
+
+    # ── Summary ──
+    pdf.section_title("Scan Summary")
+    pdf.key_value("Period:", period)
+    pdf.key_value("Users:", str(len({s["user_id"] for s in scans})))
+    pdf.key_value("Scans:", str(len(scans)))
+    high = sum(s["severity"] == "High" for s in scans)
+    pdf.key_value("High Severity:", str(high), val_rgb=SEVERITY_RGB["High"] if high else (15, 23, 42))
+    pdf.ln(4)
+
+    # ── Scans, one table per user ──
+    widths = (45, 75, 30, 30)
+    user_id = None
+    for scan in scans:
+        if scan["user_id"] != user_id:
+            user_id = scan["user_id"]
+            if pdf.get_y() > 240:
+                pdf.add_page()
+            pdf.ln(2)
+            pdf.section_title(f"Scans by {scan['username']}")
+            pdf.set_font("Helvetica", "B", 9)
+            pdf.set_text_color(71, 85, 105)
+            for width, title in zip(widths, ("Date & Time", "Disease", "Confidence", "Severity")):
+                pdf.cell(width, 7, title)
+            pdf.ln(7)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.set_text_color(15, 23, 42)
+        pdf.cell(widths[0], 6, scan["scanned_at"].strftime("%d %b %Y, %I:%M %p"))
+        pdf.cell(widths[1], 6, scan["disease_name"])
+        pdf.cell(widths[2], 6, f"{scan['confidence']:.1f}%")
+        pdf.set_text_color(*SEVERITY_RGB.get(scan["severity"], (100, 100, 100)))
+        pdf.cell(widths[3], 6, scan["severity"], ln=True)
+
+    # ── Guidance for each disease found ──
+    pdf.add_page()
+    pdf.section_title("Treatment Recommendations")
+    for disease in sorted({s["disease_name"] for s in scans}):
+        info = _recommendation(disease)
+        pdf.set_font("Helvetica", "B", 11)
+        pdf.set_text_color(67, 56, 202)
+        pdf.cell(0, 8, disease, ln=True)
+        pdf.set_font("Helvetica", "", 10)
+        pdf.set_text_color(51, 65, 85)
+        if info.get("description"):
+            pdf.wrapped_text(info["description"], 6)
+        for i, t in enumerate(info.get("treatment", []), 1):
+            pdf.wrapped_text(f"{i}. {t}", 6)
+        pdf.ln(3)
+
+    pdf.set_font("Helvetica", "I", 8)
+    pdf.set_text_color(148, 163, 184)
+    pdf.wrapped_text(DISCLAIMER, 5)
+    return [(name, bytes(pdf.output()))]
+
+
+# ─── Orchestration ───
+
+def _tasks(mode: str, user_ids, since, until):
+    """(function, args) per worker task, in archive order."""
+    if mode == "individual":
+        for rows in iter_scan_batches(user_ids, BATCH_SIZE, since, until):
+            yield render_individual, (rows,)
+        return
+    period = f"{since or 'first scan'} to {until or date.today()}"
+    part, parts = [], 0
+    for rows in iter_scan_batches(user_ids, BATCH_SIZE, since, until):
+        part += rows
+        if len(part) >= SCANS_PER_DOCUMENT:
+            parts += 1
+            yield render_combined, (part[:SCANS_PER_DOCUMENT], f"scan_report_part{parts}.pdf", period)
+            part = part[SCANS_PER_DOCUMENT:]
+    if part or not parts:
+        name = f"scan_report_part{parts + 1}.pdf" if parts else "scan_report.pdf"
+        yield render_combined, (part, name, period)
+
+
+def write_bulk_reports(out, mode: str = "individual", user_ids: list[int] | None = None,
+                       since: date | None = None, until: date | None = None,
+                       workers: int = BULK_REPORT_WORKERS) -> int:
+    """Render reports for the selected scans into a ZIP at `out` (a path or
+    binary file, which need not be seekable). Returns the number of PDFs."""
+    if mode not in REPORT_MODES:
+        raise ValueError(f"Unknown report mode: {mode} (expected one of {', '.join(REPORT_MODES)})")
+    written = 0
+    # Workers only render; "spawn" keeps them free of the parent's DB
+    # connections and threads.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+            zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as archive:  # PDFs are already compressed
+        in_flight = deque()
+
+        def drain_one():
+            nonlocal written
+            for name, pdf in in_flight.popleft().result():
+                archive.writestr(name, pdf)
+                written += 1
+
+        for fn, args in _tasks(mode, user_ids, since, until):
+            in_flight.append(pool.submit(fn, *args))
+            if len(in_flight) >= 2 * workers:  # keep every worker busy, but no more
+                drain_one()
+        while in_flight:
+            drain_one()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk PDF scan reports")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user", action="append", help="Username to report on (repeat for several)")
+    who.add_argument("--all", action="store_true", help="Report on every user's scans")
+    parser.add_argument("--mode", choices=REPORT_MODES, default="individual")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--out", required=True, help="Output .zip path ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=BULK_REPORT_WORKERS)
+    args = parser.parse_args()
+
+    ids = None
+    if args.user:
+        ids = []
+        for name in args.user:
+            user = db.get_user_by_username(name)
+            if user is None:
+                sys.exit(f"Unknown user: {name}")
+            ids.append(user["id"])
+
+    start = time.perf_counter()
+    target = sys.stdout.buffer if args.out == "-" else args.out
+    count = write_bulk_reports(target, args.mode, ids, args.since, args.until, args.workers)
+    print(f"Wrote {count} PDF(s) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
@@ -1,5 +1,19 @@
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
+import psycopg2.pool
+
+from utils import metrics
 
 # ─── Database Configuration ───
 DB_CONFIG = {
@@ -10,25 +24,537 @@ DB_CONFIG = {
     "port": 5432
 }
 
-def get_connection():
-    """Get a PostgreSQL database connection."""
-    return psycopg2.connect(**DB_CONFIG)
+# ─── Pool Configuration ───
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX", 10))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))   # seconds to wait for a free connection
+CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 5))        # seconds for the TCP/auth handshake
+HEALTH_CHECK_AFTER = float(os.environ.get("DB_HEALTH_CHECK_AFTER", 30))  # ping connections idle longer than this
+
+# ─── Resilience Configuration ───
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 10000))  # 0 disables
+CONNECT_RETRIES = int(os.environ.get("DB_CONNECT_RETRIES", 2))               # extra attempts per checkout
+RETRY_BASE_DELAY = float(os.environ.get("DB_RETRY_BASE_DELAY", 0.1))         # seconds, doubled per attempt
+RETRY_MAX_DELAY = float(os.environ.get("DB_RETRY_MAX_DELAY", 2.0))
+BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", 3))             # consecutive failures that open it
+BREAKER_COOLDOWN = float(os.environ.get("DB_BREAKER_COOLDOWN", 15))          # seconds before a trial request
+ROLLUP_RECHECK = float(os.environ.get("DB_ROLLUP_RECHECK", 30))  # seconds before asking again whether rollups exist
+
+
+# ─── Instrumentation ───
+# Every public DB function records its wall time; inside it, time spent
+# checking out a connection and time spent executing statements are
+# recorded separately, with row counts. Statements slower than
+# SLOW_QUERY_MS go to the slow-query log with string values redacted.
+
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 200))   # 0 logs every statement
+SLOW_QUERY_LOG = os.environ.get("DB_SLOW_QUERY_LOG", "")         # JSONL file; empty prints instead
+
+CALL_SECONDS = metrics.histogram("db_call_seconds", "Wall time of each utils.db function call")
+CONNECT_SECONDS = metrics.histogram("db_connect_seconds", "Time to check out (or open) a connection")
+EXECUTE_SECONDS = metrics.histogram("db_execute_seconds", "Statement execution time")
+ROWS = metrics.counter("db_rows_total", "Rows returned or affected by statements")
+ERRORS = metrics.counter("db_errors_total", "Failed connection checkouts and statements")
+SLOW_QUERIES = metrics.counter("db_slow_queries_total", "Statements slower than DB_SLOW_QUERY_MS")
+
+_call = threading.local()
+_slow_log_lock = threading.Lock()
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def instrumented(func):
+    """Record the call's wall time, and label its connections and statements
+    with the function name. Nested calls count toward the outermost one."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_call, "function", None)
+        if outer is not None:
+            return func(*args, **kwargs)
+        _call.function = func.__name__
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _call.function = None
+            CALL_SECONDS.observe(time.perf_counter() - start, function=func.__name__)
+    return wrapper
+
+
+def _current_function() -> str:
+    return getattr(_call, "function", None) or "other"
+
+
+def record_connect(seconds: float, error: Exception | None = None):
+    CONNECT_SECONDS.observe(seconds, function=_current_function())
+    if error is not None:
+        ERRORS.inc(function=_current_function(), phase="connect")
+
+
+def _redact_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return f"<{len(value)} values>"
+    return f"<{type(value).__name__}>"
+
+
+def redact(params):
+    """Keep numbers, dates and NULLs; replace strings (names, emails, hashes) with their type."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _redact_value(v) for k, v in params.items()}
+    return [_redact_value(v) for v in params]
+
+
+def record_statement(sql, params, seconds: float, rows: int, error: Exception | None = None):
+    function = _current_function()
+    EXECUTE_SECONDS.observe(seconds, function=function)
+    ROWS.inc(rows, function=function)
+    if error is not None:
+        ERRORS.inc(function=function, phase="execute")
+    if seconds * 1000 < SLOW_QUERY_MS:
+        return
+    SLOW_QUERIES.inc(function=function)
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    entry = {
+        "ts": datetime.now().isoformat(),
+        "function": function,
+        "ms": round(seconds * 1000, 2),
+        "rows": rows,
+        "error": type(error).__name__ if error else None,
+        # Literals inlined by execute_values() would carry user data
+        "sql": " ".join(_STRING_LITERAL.sub("'?'", str(sql)).split())[:2000],
+        "params": redact(params),
+    }
+    line = json.dumps(entry, default=str)
+    if not SLOW_QUERY_LOG:
+        print(f"[SLOW QUERY] {line}")
+        return
+    with _slow_log_lock, open(SLOW_QUERY_LOG, "a") as f:
+        f.write(line + "\n")
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except Exception as e:
+            record_statement(query, vars, time.perf_counter() - start, 0, e)
+            raise
+        record_statement(query, vars, time.perf_counter() - start, max(self.rowcount, 0))
+        return result
+
+
+class TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class TimedDictCursor(_TimedCursorMixin, psycopg2.extras.DictCursor):
+    pass
+
+
+def get_connection(statement_timeout_ms: int = 0):
+    """Open a new, unpooled PostgreSQL connection.
+
+    Pooled connections pass STATEMENT_TIMEOUT_MS; maintenance scripts keep
+    the default of no limit.
+    """
+    return psycopg2.connect(**DB_CONFIG, connect_timeout=CONNECT_TIMEOUT, cursor_factory=TimedCursor,
+                            options=f"-c statement_timeout={statement_timeout_ms}")
+
+
+def _pooled_connect():
+    return get_connection(STATEMENT_TIMEOUT_MS)
+
+
+def without_statement_timeout(cur):
+    """Lift the statement timeout for the rest of the current transaction
+    (migrations, backfills, archiving and exports can legitimately run long)."""
+    cur.execute("SET LOCAL statement_timeout = 0")
+
+
+class ConnectionPool:
+    """Thread-safe pool of PostgreSQL connections shared by all DB functions.
+
+    `min_size` connections are opened on first use, and reopened after broken
+    ones are discarded; idle connections are kept (up to `max_size`) rather
+    than closed. Callers wait up to
+    `checkout_timeout` for a free connection when all are in use.
+    Connections idle longer than HEALTH_CHECK_AFTER are pinged before being
+    handed out, and broken ones are replaced.
+    """
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, connect=_pooled_connect):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self._connect = connect
+        self._idle = []            # [(conn, last_used_monotonic)]
+        self._open = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._opening = 0          # connections _top_up() has claimed but not opened yet
+        self._stats = {
+            "checkouts": 0, "in_use": 0, "peak_in_use": 0, "wait_seconds": 0.0,
+            "timeouts": 0, "connects": 0, "health_check_failures": 0, "discarded": 0,
+        }
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._lock:
+            self._open += 1
+            self._stats["connects"] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _top_up(self):
+        # Deferred to first use so importing this module never needs a live database.
+        # The shortfall is claimed under the lock, so concurrent callers never
+        # open more than min_size between them.
+        with self._lock:
+            missing = max(self.min_size - self._open - self._opening, 0)
+            self._opening += missing
+        opened = 0
+        try:
+            while opened < missing:
+                conn = self._new_connection()
+                opened += 1
+                with self._lock:
+                    self._opening -= 1
+                    self._idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            pass   # getconn() connects (and reports the error) itself
+        finally:
+            if opened < missing:
+                with self._lock:
+                    self._opening -= missing - opened
+
+    @staticmethod
+    def _is_healthy(conn, last_used) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < HEALTH_CHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise psycopg2.pool.PoolError(
+                f"No database connection available within {self.checkout_timeout}s"
+            )
+        try:
+            self._top_up()
+            conn = None
+            while conn is None:
+                with self._lock:
+                    conn, last_used = self._idle.pop() if self._idle else (None, None)
+                if conn is None:
+                    conn = self._new_connection()
+                elif not self._is_healthy(conn, last_used):
+                    with self._lock:
+                        self._stats["health_check_failures"] += 1
+                    self._discard(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - start
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+        return conn
+
+    def putconn(self, conn, discard=False):
+        try:
+            if not discard and not conn.closed:
+                try:
+                    conn.rollback()  # never hand out a connection mid-transaction
+                except psycopg2.Error:
+                    discard = True
+            if discard or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Snapshot of pool utilization counters."""
+        with self._lock:
+            stats = dict(self._stats, open=self._open, idle=len(self._idle))
+        stats["max_size"] = self.max_size
+        stats["utilization"] = stats["in_use"] / self.max_size
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of connecting while the circuit breaker is open."""
+
+
+class ScanRejected(Exception):
+    """Raised by save_scans when the database rejects the records themselves
+    (a constraint or an invalid value), so writing them again cannot succeed."""
+
+
+class CircuitBreaker:
+    """Fails fast while the database is unhealthy.
+
+    Closed: requests go through. After `failures` consecutive connection
+    errors or timeouts it opens, and every request raises
+    DatabaseUnavailable at once instead of waiting on the network. After
+    `cooldown` seconds it lets a single trial request through (half-open);
+    success closes it, failure reopens it for another cooldown.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_started = None   # monotonic time the half-open trial began
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a request may try the database now (claims the trial slot when half-open)."""
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = "half_open"
+            if self._state == "closed":
+                return True
+            # One trial at a time; a trial that never reported back expires after a cooldown
+            now = time.monotonic()
+            if self._state == "half_open" and (self._trial_started is None
+                                               or now - self._trial_started >= self.cooldown):
+                self._trial_started = now
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def available(self) -> bool:
+        """Like allow(), but without claiming anything: False only while open and cooling down."""
+        with self._lock:
+            return self._state != "open" or time.monotonic() - self._opened_at >= self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            if self._state != "closed":
+                print("[DB] database reachable again, closing circuit breaker")
+            self._state, self._consecutive, self._trial_started = "closed", 0, None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_started = None
+            if self._state == "half_open" or (self._state == "closed" and self._consecutive >= self.failures):
+                self._state, self._opened_at = "open", time.monotonic()
+                self._stats["opened"] += 1
+                print(f"[DB] {self._consecutive} consecutive failures, failing fast for {self.cooldown:.0f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, open=int(self._state == "open"), consecutive_failures=self._consecutive)
+
+
+_pool = ConnectionPool()
+_breaker = CircuitBreaker()
+
+RETRIES = metrics.counter("db_connect_retries_total", "Connection attempts retried after a transient error")
+
+# Connection-level failures: the server is down or unreachable. QueryCanceled
+# (statement_timeout) is an OperationalError too, but only means that one
+# query was slow; pooled_connection() keeps the connection and the breaker
+# closed for it.
+_UNHEALTHY = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retrying clients spread out."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _checkout():
+    attempt = 0
+    while True:
+        if not _breaker.allow():
+            raise DatabaseUnavailable("Database unavailable (circuit breaker open)")
+        try:
+            return _pool.getconn()
+        except _UNHEALTHY:
+            _breaker.record_failure()
+            if attempt >= CONNECT_RETRIES:
+                raise
+        RETRIES.inc()
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+@contextmanager
+def pooled_connection():
+    """Check a connection out of the shared pool and always return it.
+
+    Uncommitted work is rolled back on return; connections that raised a
+    connection-level error are closed instead of reused and count towards
+    the circuit breaker (a statement timeout does neither). Failed connects
+    are retried with jittered backoff, and raise DatabaseUnavailable without
+    touching the network while the circuit breaker is open.
+    """
+    start = time.perf_counter()
+    try:
+        conn = _checkout()
+    except Exception as e:
+        record_connect(time.perf_counter() - start, e)
+        raise
+    record_connect(time.perf_counter() - start)
+    healthy = True
+    try:
+        yield conn
+    except psycopg2.errors.QueryCanceled:
+        raise
+    except _UNHEALTHY:
+        healthy = False
+        raise
+    finally:
+        _pool.putconn(conn, discard=not healthy)
+        if healthy:
+            _breaker.record_success()
+        else:
+            _breaker.record_failure()
+
+
+def database_available() -> bool:
+    """False while the circuit breaker is open (the database recently failed)."""
+    return _breaker.available()
+
+
+def get_pool_stats() -> dict:
+    """Pool utilization metrics (checkouts, waits, in-use, open connections...)."""
+    return _pool.stats()
+
+
+# ─── Queries ───
+# Kept as constants so utils/migrations.py can EXPLAIN them.
+
+USER_BY_USERNAME_SQL = "SELECT * FROM users WHERE username = %s"
+
+USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = %s"
+
+CREATE_USER_SQL = "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)"
+
+UPDATE_PASSWORD_HASH_SQL = "UPDATE users SET password_hash = %s WHERE id = %s"
+
+INSERT_SCAN_SQL = """INSERT INTO scan_history (user_id, disease_name, confidence, severity, image_hash)
+    VALUES (%s, %s, %s, %s, %s)"""
+
+INSERT_SCANS_SQL = """INSERT INTO scan_history (user_id, disease_name, confidence, severity, scanned_at, image_hash)
+    VALUES %s"""
+
+SCAN_HISTORY_PAGE_SIZE = 20
+
+# Keyset pagination on (scanned_at, id): each page starts strictly after the
+# last row of the previous one, so page N costs the same as page 1.
+SCAN_HISTORY_SQL = """SELECT id, disease_name, confidence, severity, scanned_at, image_hash
+    FROM scan_history WHERE {where}
+    ORDER BY scanned_at DESC, id DESC LIMIT %(limit)s"""
+
+SCAN_HISTORY_FILTERS = {
+    # The plain scanned_at bound lets Postgres prune later monthly partitions.
+    "cursor": "scanned_at <= %(cursor_at)s AND (scanned_at, id) < (%(cursor_at)s, %(cursor_id)s)",
+    "disease": "disease_name = %(disease)s",
+    "severity": "severity = %(severity)s",
+    "date_from": "scanned_at >= %(date_from)s",
+    "date_to": "scanned_at < %(date_to)s::date + 1",
+    "min_confidence": "confidence >= %(min_confidence)s",
+}
+
+DISEASE_FREQUENCY_SQL = """SELECT disease_name, COUNT(*) as count
+    FROM scan_history WHERE user_id = %s
+    GROUP BY disease_name ORDER BY count DESC LIMIT 10"""
+
+DAILY_SCAN_COUNTS_SQL = """SELECT DATE(scanned_at) as scan_date, COUNT(*) as count
+    FROM scan_history WHERE user_id = %s
+      AND scanned_at >= CURRENT_DATE - 30
+    GROUP BY scan_date ORDER BY scan_date"""
+
+SEVERITY_BREAKDOWN_SQL = """SELECT severity, COUNT(*) as count
+    FROM scan_history WHERE user_id = %s
+    GROUP BY severity ORDER BY count DESC"""
+
+# "Last 30 days" is today plus the 30 whole days before it, in every
+# query (the rollups only know dates, not times).
+SUMMARY_FROM_ROLLUPS_SQL = """SELECT 'total' AS kind, NULL AS key, total AS count, high_risk, confidence_sum
+    FROM scan_user_totals WHERE user_id = %(uid)s
+    UNION ALL
+    SELECT 'disease', disease_name, count, NULL, NULL
+    FROM scan_disease_rollup WHERE user_id = %(uid)s
+    UNION ALL
+    SELECT 'severity', severity, count, NULL, NULL
+    FROM scan_severity_rollup WHERE user_id = %(uid)s
+    UNION ALL
+    SELECT 'day', scan_date::text, count, NULL, NULL
+    FROM scan_daily_rollup
+    WHERE user_id = %(uid)s AND scan_date >= CURRENT_DATE - 30"""
+
+SUMMARY_FROM_SCANS_SQL = """SELECT CASE WHEN GROUPING(disease_name) = 0 THEN 'disease'
+                WHEN GROUPING(severity) = 0 THEN 'severity'
+                WHEN GROUPING(recent_day) = 0 THEN 'day'
+                ELSE 'total' END AS kind,
+           COALESCE(disease_name, severity, recent_day::text) AS key,
+           COUNT(*) AS count,
+           COUNT(*) FILTER (WHERE severity = 'High') AS high_risk,
+           SUM(confidence) AS confidence_sum
+    FROM (SELECT disease_name, severity, confidence,
+                 CASE WHEN scanned_at >= CURRENT_DATE - 30
+                      THEN DATE(scanned_at) END AS recent_day
+          FROM scan_history WHERE user_id = %(uid)s) s
+    GROUP BY GROUPING SETS ((disease_name), (severity), (recent_day), ())"""
 
 
 # ─── User Functions ───
 
+@instrumented
 def create_user(username: str, email: str, password_hash: str) -> bool:
     """Insert a new user. Returns True on success, False if username/email exists."""
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-            (username, email, password_hash)
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(CREATE_USER_SQL, (username, email, password_hash))
+            conn.commit()
+            cur.close()
         return True
     except psycopg2.errors.UniqueViolation:
         return False
@@ -37,133 +563,394 @@ def create_user(username: str, email: str, password_hash: str) -> bool:
         return False
 
 
+@instrumented
 def get_user_by_username(username: str) -> dict | None:
     """Fetch user record by username. Returns dict or None."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM users WHERE username = %s", (username,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(USER_BY_USERNAME_SQL, (username,))
+            row = cur.fetchone()
+            cur.close()
         return dict(row) if row else None
     except Exception as e:
         print(f"Error fetching user: {e}")
         return None
 
 
+@instrumented
 def get_user_by_email(email: str) -> dict | None:
     """Fetch user record by email."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(USER_BY_EMAIL_SQL, (email,))
+            row = cur.fetchone()
+            cur.close()
         return dict(row) if row else None
     except Exception as e:
         print(f"Error fetching user by email: {e}")
         return None
 
 
+@instrumented
+def update_password_hash(user_id: int, password_hash: str) -> bool:
+    """Replace a user's password hash (used to upgrade hashes on login)."""
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(UPDATE_PASSWORD_HASH_SQL, (password_hash, user_id))
+            conn.commit()
+            cur.close()
+        return True
+    except Exception as e:
+        print(f"Error updating password hash: {e}")
+        return False
+
+
+# ─── Scan Rollups ───
+# Per-user aggregates kept in step with scan_history (see utils/rollups.py
+# for the DDL, backfill and consistency check). Each write folds exactly
+# the rows it inserts, in the same statement, so saves never wait on each
+# other and never aggregate more than their own rows. Rebuilding a user's
+# rollups takes that user's advisory lock exclusively; writers take it
+# shared, so a rebuild never misses or double-counts a concurrent write.
+
+ROLLUP_LOCK_ID = 727602  # advisory lock namespace; the second key is the user id
+
+LOCK_USER_ROLLUPS_SQL = "SELECT pg_advisory_xact_lock_shared(%s, uid) FROM unnest(%s::int[]) AS uid"
+
+# Present once the rollups have been backfilled (see utils/rollups.py).
+# Writers ask while holding their scan_history lock, which the backfill's
+# SHARE lock conflicts with, so no write can land between the backfill and
+# the marker appearing without being folded in.
+ROLLUPS_READY_SQL = "SELECT to_regclass('scan_rollup_backfill') IS NOT NULL"
+
+ROLLUPS_READY_FOR_WRITE_SQL = "LOCK TABLE scan_history IN ROW EXCLUSIVE MODE; " + ROLLUPS_READY_SQL
+
+ROLLUP_ROW_COLUMNS = "user_id, disease_name, severity, confidence, scanned_at"
+
+# Fold the scan rows produced by {rows} (a SELECT or an INSERT ... RETURNING
+# ROLLUP_ROW_COLUMNS) into the rollups. Returns the number of rows folded.
+# Keys are upserted in order, so concurrent multi-user batches cannot
+# deadlock on the rollup rows.
+FOLD_ROLLUPS_SQL = """
+WITH rows AS (
+    {rows}
+), new AS (
+    SELECT user_id, COALESCE(disease_name, 'Unknown') AS disease_name,
+           COALESCE(severity, 'Unknown') AS severity, confidence, scanned_at
+    FROM rows
+), daily AS (
+    INSERT INTO scan_daily_rollup AS r (user_id, scan_date, count, high_risk, confidence_sum)
+    SELECT user_id, DATE(scanned_at), COUNT(*), COUNT(*) FILTER (WHERE severity = 'High'),
+           COALESCE(SUM(confidence), 0)
+    FROM new GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (user_id, scan_date) DO UPDATE SET
+        count = r.count + EXCLUDED.count,
+        high_risk = r.high_risk + EXCLUDED.high_risk,
+        confidence_sum = r.confidence_sum + EXCLUDED.confidence_sum
+), disease AS (
+    INSERT INTO scan_disease_rollup AS r (user_id, disease_name, count)
+    SELECT user_id, disease_name, COUNT(*) FROM new GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (user_id, disease_name) DO UPDATE SET count = r.count + EXCLUDED.count
+), severity AS (
+    INSERT INTO scan_severity_rollup AS r (user_id, severity, count)
+    SELECT user_id, severity, COUNT(*) FROM new GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (user_id, severity) DO UPDATE SET count = r.count + EXCLUDED.count
+), totals AS (
+    INSERT INTO scan_user_totals AS r (user_id, total, high_risk, confidence_sum)
+    SELECT user_id, COUNT(*), COUNT(*) FILTER (WHERE severity = 'High'), COALESCE(SUM(confidence), 0)
+    FROM new GROUP BY 1 ORDER BY 1
+    ON CONFLICT (user_id) DO UPDATE SET
+        total = r.total + EXCLUDED.total,
+        high_risk = r.high_risk + EXCLUDED.high_risk,
+        confidence_sum = r.confidence_sum + EXCLUDED.confidence_sum
+)
+SELECT COUNT(*) FROM new
+"""
+
+SAVE_SCAN_SQL = FOLD_ROLLUPS_SQL.format(rows=f"{INSERT_SCAN_SQL} RETURNING {ROLLUP_ROW_COLUMNS}")
+
+SAVE_SCANS_SQL = FOLD_ROLLUPS_SQL.format(rows=f"{INSERT_SCANS_SQL} RETURNING {ROLLUP_ROW_COLUMNS}")
+
+_rollups_available = None
+_rollups_checked_at = 0.0
+
+
+def rollups_available() -> bool:
+    """True once the rollup tables exist and have been backfilled.
+
+    A yes is kept for the life of the process; a no is re-checked every
+    ROLLUP_RECHECK seconds, so the Dashboard switches over soon after the
+    backfill migration commits.
+    """
+    global _rollups_available, _rollups_checked_at
+    if _rollups_available or time.monotonic() - _rollups_checked_at < ROLLUP_RECHECK:
+        return bool(_rollups_available)
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(ROLLUPS_READY_SQL)
+            _rollups_available = cur.fetchone()[0]
+            cur.close()
+    except Exception as e:
+        print(f"Error checking rollup tables: {e}")
+        return False
+    _rollups_checked_at = time.monotonic()
+    return _rollups_available
+
+
+def _rollups_ready_for_write(cur) -> bool:
+    """Whether the write in `cur`'s transaction must fold into the rollups.
+
+    Until the answer is yes, asks inside the transaction on every write
+    rather than trusting the cached no from rollups_available().
+    """
+    global _rollups_available
+    if not _rollups_available:
+        cur.execute(ROLLUPS_READY_FOR_WRITE_SQL)
+        _rollups_available = cur.fetchone()[0]
+    return _rollups_available
+
+
+def lock_user_rollups(cur, user_ids):
+    """Keep rollup rebuilds of `user_ids` out until the transaction ends."""
+    cur.execute(LOCK_USER_ROLLUPS_SQL, (ROLLUP_LOCK_ID, sorted(set(user_ids))))
+
+
 # ─── Scan History Functions ───
 
-def save_scan(user_id: int, disease_name: str, confidence: float, severity: str) -> bool:
-    """Save a scan result to the database."""
+@instrumented
+def save_scan(user_id: int, disease_name: str, confidence: float, severity: str,
+              image_hash: str | None = None) -> bool:
+    """Save a scan result to the database (or to the local spool if it cannot be reached).
+
+    image_hash refers to the scan's image in utils/image_store.py.
+    """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """INSERT INTO scan_history (user_id, disease_name, confidence, severity)
-               VALUES (%s, %s, %s, %s)""",
-            (user_id, disease_name, confidence, severity)
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            if _rollups_ready_for_write(cur):
+                lock_user_rollups(cur, [user_id])
+                cur.execute(SAVE_SCAN_SQL, (user_id, disease_name, confidence, severity, image_hash))
+            else:
+                cur.execute(INSERT_SCAN_SQL, (user_id, disease_name, confidence, severity, image_hash))
+            conn.commit()
+            cur.close()
         return True
+    except (*_UNHEALTHY, psycopg2.pool.PoolError, DatabaseUnavailable) as e:
+        print(f"Error saving scan: {e}")
+        # Not lost: the scan writer spools it locally and replays it once
+        # the database is back.
+        from utils.scan_writer import enqueue_scan
+        return enqueue_scan(user_id, disease_name, confidence, severity, image_hash)
     except Exception as e:
+        # Rejected (constraint or bad value) or a bug: retrying would never succeed
         print(f"Error saving scan: {e}")
         return False
 
 
-def get_scan_history(user_id: int) -> list:
-    """Get the scan history for a user, most recent first."""
+@instrumented
+def save_scans(scans: list[dict]) -> bool:
+    """Insert many scan records in one multi-row INSERT and commit.
+
+    Each record has user_id, disease_name, confidence, severity and
+    scanned_at (the time of the scan, not of the write), and optionally
+    image_hash. Returns False if the database could not be reached; raises
+    ScanRejected if it refused the records (e.g. a deleted user's scans).
+    """
+    if not scans:
+        return True
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute(
-            """SELECT disease_name, confidence, severity, scanned_at
-               FROM scan_history WHERE user_id = %s
-               ORDER BY scanned_at DESC LIMIT 20""",
-            (user_id,)
-        )
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return [dict(r) for r in rows]
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            use_rollups = _rollups_ready_for_write(cur)
+            if use_rollups:
+                lock_user_rollups(cur, [s["user_id"] for s in scans])
+            psycopg2.extras.execute_values(
+                cur,
+                SAVE_SCANS_SQL if use_rollups else INSERT_SCANS_SQL,
+                [(s["user_id"], s["disease_name"], s["confidence"], s["severity"], s["scanned_at"],
+                  s.get("image_hash")) for s in scans],
+                page_size=500,
+            )
+            conn.commit()
+            cur.close()
+        return True
+    except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+        raise ScanRejected(str(e).strip()) from e
+    except Exception as e:
+        print(f"Error saving {len(scans)} scans: {e}")
+        return False
+
+
+def build_scan_history_query(user_id: int, cursor: tuple | None = None, limit: int = SCAN_HISTORY_PAGE_SIZE,
+                             **filters) -> tuple[str, dict]:
+    """SQL and parameters for one page of history. Filters left as None are omitted."""
+    params = {"user_id": user_id, "limit": limit}
+    where = ["user_id = %(user_id)s"]
+    if cursor is not None:
+        params["cursor_at"], params["cursor_id"] = cursor
+        where.append(SCAN_HISTORY_FILTERS["cursor"])
+    for name, value in filters.items():
+        if name not in SCAN_HISTORY_FILTERS:
+            raise ValueError(f"Unknown scan history filter: {name}")
+        if value is not None:
+            params[name] = value
+            where.append(SCAN_HISTORY_FILTERS[name])
+    return SCAN_HISTORY_SQL.format(where=" AND ".join(where)), params
+
+
+@instrumented
+def get_scan_history_page(user_id: int, cursor: tuple | None = None, limit: int = SCAN_HISTORY_PAGE_SIZE,
+                          **filters) -> tuple[list, tuple | None]:
+    """Get one page of a user's scans, most recent first.
+
+    Returns (rows, next_cursor). Pass next_cursor back to get the following
+    page; it is None on the last page. Filters: disease, severity,
+    date_from, date_to (inclusive dates) and min_confidence.
+    """
+    query, params = build_scan_history_query(user_id, cursor, limit + 1, **filters)
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(query, params)
+            rows = [dict(r) for r in cur.fetchall()]
+            cur.close()
     except Exception as e:
         print(f"Error fetching scan history: {e}")
-        return []
+        return [], None
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["scanned_at"], rows[-1]["id"])
 
 
+@instrumented
+def get_scan_history(user_id: int, limit: int = SCAN_HISTORY_PAGE_SIZE, **filters) -> list:
+    """Get the most recent scans for a user (the first history page)."""
+    return get_scan_history_page(user_id, limit=limit, **filters)[0]
+
+
+@instrumented
 def get_disease_frequency(user_id: int) -> list:
     """Get disease name + count for bar chart, ordered by frequency."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute(
-            """SELECT disease_name, COUNT(*) as count
-               FROM scan_history WHERE user_id = %s
-               GROUP BY disease_name ORDER BY count DESC LIMIT 10""",
-            (user_id,)
-        )
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(DISEASE_FREQUENCY_SQL, (user_id,))
+            rows = cur.fetchall()
+            cur.close()
         return [dict(r) for r in rows]
     except Exception as e:
         print(f"Error fetching disease frequency: {e}")
         return []
 
 
+@instrumented
 def get_daily_scan_counts(user_id: int) -> list:
     """Get scan counts per day for the last 30 days."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute(
-            """SELECT DATE(scanned_at) as scan_date, COUNT(*) as count
-               FROM scan_history WHERE user_id = %s
-                 AND scanned_at >= NOW() - INTERVAL '30 days'
-               GROUP BY scan_date ORDER BY scan_date""",
-            (user_id,)
-        )
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(DAILY_SCAN_COUNTS_SQL, (user_id,))
+            rows = cur.fetchall()
+            cur.close()
         return [dict(r) for r in rows]
     except Exception as e:
         print(f"Error fetching daily scans: {e}")
         return []
 
 
+@instrumented
 def get_severity_breakdown(user_id: int) -> list:
     """Get count per severity level."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute(
-            """SELECT severity, COUNT(*) as count
-               FROM scan_history WHERE user_id = %s
-               GROUP BY severity ORDER BY count DESC""",
-            (user_id,)
-        )
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(SEVERITY_BREAKDOWN_SQL, (user_id,))
+            rows = cur.fetchall()
+            cur.close()
         return [dict(r) for r in rows]
     except Exception as e:
         print(f"Error fetching severity breakdown: {e}")
         return []
+
+
+@instrumented
+def get_dashboard_summary(user_id: int) -> dict:
+    """All Dashboard aggregates over the user's full history in one query.
+
+    Reads the per-user rollup tables when they exist, so the cost depends
+    on the number of days shown rather than the number of scans. Without
+    them, falls back to a single GROUPING SETS scan of scan_history.
+    """
+    if rollups_available():
+        rows = _fetch_summary_rows(SUMMARY_FROM_ROLLUPS_SQL, {"uid": user_id})
+    else:
+        rows = _fetch_summary_rows(SUMMARY_FROM_SCANS_SQL, {"uid": user_id})
+    return summary_from_rows(rows or [])
+
+
+def summary_from_rows(rows) -> dict:
+    """Build the Dashboard summary from (kind, key, count, high_risk, confidence_sum) rows."""
+    summary = {
+        "total": 0, "high_risk": 0, "avg_confidence": 0.0, "unique_diseases": 0,
+        "disease_frequency": [], "severity_breakdown": [], "daily_counts": [],
+    }
+    for r in rows:
+        if r["kind"] == "total":
+            summary["total"] = r["count"]
+            summary["high_risk"] = r["high_risk"]
+            summary["avg_confidence"] = float(r["confidence_sum"] or 0.0) / r["count"] if r["count"] else 0.0
+        elif r["kind"] == "disease":
+            summary["disease_frequency"].append({"disease_name": r["key"], "count": r["count"]})
+        elif r["kind"] == "severity":
+            summary["severity_breakdown"].append({"severity": r["key"], "count": r["count"]})
+        elif r["key"] is not None:  # older days fall into one NULL bucket
+            summary["daily_counts"].append({"scan_date": date.fromisoformat(r["key"]), "count": r["count"]})
+
+    summary["unique_diseases"] = len(summary["disease_frequency"])
+    summary["disease_frequency"].sort(key=lambda d: d["count"], reverse=True)
+    summary["disease_frequency"] = summary["disease_frequency"][:10]
+    summary["severity_breakdown"].sort(key=lambda d: d["count"], reverse=True)
+    summary["daily_counts"].sort(key=lambda d: d["scan_date"])
+    return summary
+
+
+def _fetch_summary_rows(query: str, params: dict) -> list | None:
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor(cursor_factory=TimedDictCursor)
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
+        return rows
+    except Exception as e:
+        print(f"Error fetching dashboard summary: {e}")
+        return None
+
+
+# ─── Backend Selection ───
+# DB_BACKEND=sqlite swaps every function in BACKEND_API for the embedded
+# implementation in utils/db_sqlite.py (same signatures), so callers keep
+# importing from utils.db. benchmarks/storage_conformance.py checks both.
+
+DB_BACKEND = os.environ.get("DB_BACKEND", "postgres")
+
+BACKEND_API = (
+    "create_user", "get_user_by_username", "get_user_by_email", "update_password_hash",
+    "save_scan", "save_scans", "build_scan_history_query", "get_scan_history_page", "get_scan_history",
+    "get_disease_frequency", "get_daily_scan_counts", "get_severity_breakdown", "get_dashboard_summary",
+    "get_pool_stats",
+)
+
+if DB_BACKEND == "sqlite":
+    from utils import db_sqlite as _backend
+    globals().update({name: getattr(_backend, name) for name in BACKEND_API})
+elif DB_BACKEND != "postgres":
+    raise ValueError(f"Unknown DB_BACKEND: {DB_BACKEND!r} (expected 'postgres' or 'sqlite')")
+
+metrics.register_gauges("db_pool", get_pool_stats)
+metrics.register_gauges("db_breaker", _breaker.stats)
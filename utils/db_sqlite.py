@@ -0,0 +1,395 @@
+"""
+Embedded SQLite storage backend.
+
+Same functions and signatures as the PostgreSQL implementation in
+utils/db.py, for single-node deployments and test runs that should not
+need a database server. Selected with DB_BACKEND=sqlite; the database file
+is DB_SQLITE_PATH and its schema is created on first connect.
+
+The file runs in WAL mode, so History and Dashboard reads never wait for
+the scan writer. Connections are kept in a small idle list and handed to
+one thread at a time. Rollups, partitions and migrations are Postgres
+features; here the Dashboard aggregates scan_history directly through the
+same indexes.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from utils.db import (SCAN_HISTORY_PAGE_SIZE, ScanRejected, instrumented, record_connect, record_statement,
+                      summary_from_rows)
+
+SQLITE_PATH = os.environ.get("DB_SQLITE_PATH", "data/cropguard.db")
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",      # durable at checkpoints; no fsync per commit in WAL mode
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",       # ms to wait for the write lock
+    "PRAGMA cache_size = -16000",       # 16 MB page cache per connection
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",     # 256 MB
+)
+
+# Timestamps are stored as text with a fixed six-digit fraction, so string
+# order is time order and a cursor read back from a row compares equal to it.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f000', 'now', 'localtime')"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT ({NOW_SQL})
+);
+CREATE TABLE IF NOT EXISTS scan_history (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    disease_name VARCHAR(100),
+    confidence REAL,
+    severity VARCHAR(20),
+    scanned_at TIMESTAMP NOT NULL DEFAULT ({NOW_SQL}),
+    image_hash CHAR(64)
+);
+CREATE INDEX IF NOT EXISTS idx_scan_history_user_scanned_id
+    ON scan_history (user_id, scanned_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scan_history_user_disease_scanned
+    ON scan_history (user_id, disease_name, scanned_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scan_history_user_severity_scanned
+    ON scan_history (user_id, severity, scanned_at DESC, id DESC);
+"""
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime(TIMESTAMP_FORMAT))
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+
+
+# ─── Connections ───
+
+_idle: list = []
+_lock = threading.Lock()
+_stats = {"checkouts": 0, "connects": 0, "in_use": 0, "peak_in_use": 0}
+
+
+def get_connection():
+    """Open a new SQLite connection with the pragmas applied and the schema in place."""
+    if os.path.dirname(SQLITE_PATH):
+        os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
+    conn = sqlite3.connect(SQLITE_PATH, detect_types=sqlite3.PARSE_DECLTYPES,
+                           isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(scan_history)")}
+    if "image_hash" not in columns:  # files created before images were stored
+        conn.execute("ALTER TABLE scan_history ADD COLUMN image_hash CHAR(64)")
+    with _lock:
+        _stats["connects"] += 1
+    return conn
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection for the current thread and return it afterwards."""
+    start = time.perf_counter()
+    with _lock:
+        conn = _idle.pop() if _idle else None
+        _stats["checkouts"] += 1
+        _stats["in_use"] += 1
+        _stats["peak_in_use"] = max(_stats["peak_in_use"], _stats["in_use"])
+    if conn is None:
+        try:
+            conn = get_connection()
+        except Exception as e:
+            with _lock:
+                _stats["in_use"] -= 1
+            record_connect(time.perf_counter() - start, e)
+            raise
+    record_connect(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        with _lock:
+            _idle.append(conn)
+            _stats["in_use"] -= 1
+
+
+def get_pool_stats() -> dict:
+    """Connection usage metrics, in the same shape as the Postgres pool's where they apply."""
+    with _lock:
+        return {**_stats, "idle": len(_idle), "open": len(_idle) + _stats["in_use"]}
+
+
+# ─── Queries ───
+
+USER_BY_USERNAME_SQL = "SELECT * FROM users WHERE username = ?"
+
+USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = ?"
+
+CREATE_USER_SQL = "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)"
+
+UPDATE_PASSWORD_HASH_SQL = "UPDATE users SET password_hash = ? WHERE id = ?"
+
+INSERT_SCAN_SQL = """INSERT INTO scan_history (user_id, disease_name, confidence, severity, image_hash)
+    VALUES (?, ?, ?, ?, ?)"""
+
+INSERT_SCANS_SQL = """INSERT INTO scan_history (user_id, disease_name, confidence, severity, scanned_at, image_hash)
+    VALUES (?, ?, ?, ?, ?, ?)"""
+
+SCAN_HISTORY_SQL = """SELECT id, disease_name, confidence, severity, scanned_at, image_hash
+    FROM scan_history WHERE {where}
+    ORDER BY scanned_at DESC, id DESC LIMIT :limit"""
+
+SCAN_HISTORY_FILTERS = {
+    "cursor": "(scanned_at, id) < (:cursor_at, :cursor_id)",
+    "disease": "disease_name = :disease",
+    "severity": "severity = :severity",
+    "date_from": "scanned_at >= :date_from",
+    "date_to": "scanned_at < date(:date_to, '+1 day')",
+    "min_confidence": "confidence >= :min_confidence",
+}
+
+DISEASE_FREQUENCY_SQL = """SELECT disease_name, COUNT(*) as count
+    FROM scan_history WHERE user_id = ?
+    GROUP BY disease_name ORDER BY count DESC LIMIT 10"""
+
+DAILY_SCAN_COUNTS_SQL = """SELECT DATE(scanned_at) as scan_date, COUNT(*) as count
+    FROM scan_history WHERE user_id = ?
+      AND scanned_at >= date('now', 'localtime', '-30 days')
+    GROUP BY scan_date ORDER BY scan_date"""
+
+SEVERITY_BREAKDOWN_SQL = """SELECT severity, COUNT(*) as count
+    FROM scan_history WHERE user_id = ?
+    GROUP BY severity ORDER BY count DESC"""
+
+# SQLite has no GROUPING SETS; four index-backed aggregates in one statement.
+SUMMARY_SQL = """SELECT 'total' AS kind, NULL AS key, COUNT(*) AS count,
+           SUM(severity = 'High') AS high_risk, SUM(confidence) AS confidence_sum
+    FROM scan_history WHERE user_id = :uid
+    UNION ALL
+    SELECT 'disease', disease_name, COUNT(*), NULL, NULL
+    FROM scan_history WHERE user_id = :uid GROUP BY disease_name
+    UNION ALL
+    SELECT 'severity', severity, COUNT(*), NULL, NULL
+    FROM scan_history WHERE user_id = :uid GROUP BY severity
+    UNION ALL
+    SELECT 'day', DATE(scanned_at), COUNT(*), NULL, NULL
+    FROM scan_history
+    WHERE user_id = :uid AND scanned_at >= date('now', 'localtime', '-30 days')
+    GROUP BY DATE(scanned_at)"""
+
+
+def _execute(conn, sql: str, params=(), many: bool = False) -> sqlite3.Cursor:
+    """Run a write statement, recording its time and row count (see utils/db.py)."""
+    start = time.perf_counter()
+    try:
+        cur = conn.executemany(sql, params) if many else conn.execute(sql, params)
+    except Exception as e:
+        record_statement(sql, None if many else params, time.perf_counter() - start, 0, e)
+        raise
+    record_statement(sql, None if many else params, time.perf_counter() - start, max(cur.rowcount, 0))
+    return cur
+
+
+def _rows(sql: str, params) -> list[dict]:
+    """Run a query and fetch every row; the recorded time includes the fetch,
+    since SQLite steps through results lazily."""
+    with pooled_connection() as conn:
+        start = time.perf_counter()
+        try:
+            rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+        except Exception as e:
+            record_statement(sql, params, time.perf_counter() - start, 0, e)
+            raise
+        record_statement(sql, params, time.perf_counter() - start, len(rows))
+        return rows
+
+
+# ─── User Functions ───
+
+@instrumented
+def create_user(username: str, email: str, password_hash: str) -> bool:
+    """Insert a new user. Returns True on success, False if username/email exists."""
+    try:
+        with pooled_connection() as conn:
+            _execute(conn, CREATE_USER_SQL, (username, email, password_hash))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    except Exception as e:
+        print(f"[DB ERROR] create_user failed: {type(e).__name__}: {e}")
+        return False
+
+
+@instrumented
+def get_user_by_username(username: str) -> dict | None:
+    """Fetch user record by username. Returns dict or None."""
+    try:
+        rows = _rows(USER_BY_USERNAME_SQL, (username,))
+        return rows[0] if rows else None
+    except Exception as e:
+        print(f"Error fetching user: {e}")
+        return None
+
+
+@instrumented
+def get_user_by_email(email: str) -> dict | None:
+    """Fetch user record by email."""
+    try:
+        rows = _rows(USER_BY_EMAIL_SQL, (email,))
+        return rows[0] if rows else None
+    except Exception as e:
+        print(f"Error fetching user by email: {e}")
+        return None
+
+
+@instrumented
+def update_password_hash(user_id: int, password_hash: str) -> bool:
+    """Replace a user's password hash (used to upgrade hashes on login)."""
+    try:
+        with pooled_connection() as conn:
+            _execute(conn, UPDATE_PASSWORD_HASH_SQL, (password_hash, user_id))
+        return True
+    except Exception as e:
+        print(f"Error updating password hash: {e}")
+        return False
+
+
+# ─── Scan History Functions ───
+
+@instrumented
+def save_scan(user_id: int, disease_name: str, confidence: float, severity: str,
+              image_hash: str | None = None) -> bool:
+    """Save a scan result to the database."""
+    try:
+        with pooled_connection() as conn:
+            _execute(conn, INSERT_SCAN_SQL, (user_id, disease_name, confidence, severity, image_hash))
+        return True
+    except Exception as e:
+        print(f"Error saving scan: {e}")
+        return False
+
+
+@instrumented
+def save_scans(scans: list[dict]) -> bool:
+    """Insert many scan records in one transaction.
+
+    Each record has user_id, disease_name, confidence, severity and
+    scanned_at (the time of the scan, not of the write), and optionally
+    image_hash. Returns False if the database could not be written; raises
+    ScanRejected if it refused the records (e.g. a deleted user's scans).
+    """
+    if not scans:
+        return True
+    try:
+        with pooled_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _execute(
+                conn,
+                INSERT_SCANS_SQL,
+                [(s["user_id"], s["disease_name"], s["confidence"], s["severity"], s["scanned_at"],
+                  s.get("image_hash")) for s in scans],
+                many=True,
+            )
+            conn.execute("COMMIT")
+        return True
+    except (sqlite3.IntegrityError, sqlite3.DataError) as e:
+        raise ScanRejected(str(e)) from e
+    except Exception as e:
+        print(f"Error saving {len(scans)} scans: {e}")
+        return False
+
+
+def build_scan_history_query(user_id: int, cursor: tuple | None = None, limit: int = SCAN_HISTORY_PAGE_SIZE,
+                             **filters) -> tuple[str, dict]:
+    """SQL and parameters for one page of history. Filters left as None are omitted."""
+    params = {"user_id": user_id, "limit": limit}
+    where = ["user_id = :user_id"]
+    if cursor is not None:
+        params["cursor_at"], params["cursor_id"] = cursor
+        where.append(SCAN_HISTORY_FILTERS["cursor"])
+    for name, value in filters.items():
+        if name not in SCAN_HISTORY_FILTERS:
+            raise ValueError(f"Unknown scan history filter: {name}")
+        if value is not None:
+            params[name] = value
+            where.append(SCAN_HISTORY_FILTERS[name])
+    return SCAN_HISTORY_SQL.format(where=" AND ".join(where)), params
+
+
+@instrumented
+def get_scan_history_page(user_id: int, cursor: tuple | None = None, limit: int = SCAN_HISTORY_PAGE_SIZE,
+                          **filters) -> tuple[list, tuple | None]:
+    """Get one page of a user's scans, most recent first.
+
+    Returns (rows, next_cursor). Pass next_cursor back to get the following
+    page; it is None on the last page. Filters: disease, severity,
+    date_from, date_to (inclusive dates) and min_confidence.
+    """
+    query, params = build_scan_history_query(user_id, cursor, limit + 1, **filters)
+    try:
+        rows = _rows(query, params)
+    except Exception as e:
+        print(f"Error fetching scan history: {e}")
+        return [], None
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1]["scanned_at"], rows[-1]["id"])
+
+
+@instrumented
+def get_scan_history(user_id: int, limit: int = SCAN_HISTORY_PAGE_SIZE, **filters) -> list:
+    """Get the most recent scans for a user (the first history page)."""
+    return get_scan_history_page(user_id, limit=limit, **filters)[0]
+
+
+@instrumented
+def get_disease_frequency(user_id: int) -> list:
+    """Get disease name + count for bar chart, ordered by frequency."""
+    try:
+        return _rows(DISEASE_FREQUENCY_SQL, (user_id,))
+    except Exception as e:
+        print(f"Error fetching disease frequency: {e}")
+        return []
+
+
+@instrumented
+def get_daily_scan_counts(user_id: int) -> list:
+    """Get scan counts per day for the last 30 days."""
+    try:
+        rows = _rows(DAILY_SCAN_COUNTS_SQL, (user_id,))
+        return [{**r, "scan_date": date.fromisoformat(r["scan_date"])} for r in rows]
+    except Exception as e:
+        print(f"Error fetching daily scans: {e}")
+        return []
+
+
+@instrumented
+def get_severity_breakdown(user_id: int) -> list:
+    """Get count per severity level."""
+    try:
+        return _rows(SEVERITY_BREAKDOWN_SQL, (user_id,))
+    except Exception as e:
+        print(f"Error fetching severity breakdown: {e}")
+        return []
+
+
+@instrumented
+def get_dashboard_summary(user_id: int) -> dict:
+    """All Dashboard aggregates over the user's full history in one query."""
+    try:
+        rows = _rows(SUMMARY_SQL, {"uid": user_id})
+    except Exception as e:
+        print(f"Error fetching dashboard summary: {e}")
+        rows = []
+    # An empty history still yields one 'total' row with count 0
+    return summary_from_rows([r for r in rows if r["count"]])
@@ -0,0 +1,159 @@
+"""
+One scan's diagnosis: model inference and weather risk, run concurrently.
+
+The Detect page needs two slow things per scan: decoding the upload and
+running the model, and (when a location is given) the weather for that
+location. diagnose() starts both at once on worker threads and combines
+them when both are done, so a scan costs the slower of the two rather than
+their sum.
+
+Each branch has its own timeout and its own thread pool. Weather is
+optional: if it is slow or fails, the diagnosis is returned without it
+(weather_status says why) and the fetch finishes in the background,
+warming the cache for the next scan. A timed-out fetch keeps its thread,
+so weather gets a separate pool and is skipped while all of its threads
+are busy; inference never queues behind it. Inference is not optional:
+its errors and timeout propagate.
+"""
+import asyncio
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils.preprocess import preprocess_image
+from utils.weather import assess_disease_risk, get_weather
+
+DIAGNOSIS_WEATHER_TIMEOUT = float(os.environ.get("DIAGNOSIS_WEATHER_TIMEOUT", 1.5))     # seconds
+DIAGNOSIS_INFERENCE_TIMEOUT = float(os.environ.get("DIAGNOSIS_INFERENCE_TIMEOUT", 30))  # seconds
+DIAGNOSIS_INFERENCE_WORKERS = int(os.environ.get("DIAGNOSIS_INFERENCE_WORKERS", 2))
+DIAGNOSIS_WEATHER_WORKERS = int(os.environ.get("DIAGNOSIS_WEATHER_WORKERS", 4))
+
+RISK_LEVELS = ("None", "Low", "Moderate", "High")
+
+# Not the loop's default executor: asyncio.run() waits for that on exit,
+# which would make every scan wait out a timed-out weather request.
+_inference_executor = ThreadPoolExecutor(max_workers=DIAGNOSIS_INFERENCE_WORKERS, thread_name_prefix="inference")
+_weather_executor = ThreadPoolExecutor(max_workers=DIAGNOSIS_WEATHER_WORKERS, thread_name_prefix="weather")
+# One per weather thread, so lookups never queue up behind slow ones
+_weather_slots = threading.BoundedSemaphore(DIAGNOSIS_WEATHER_WORKERS)
+
+
+# ─── Branches ───
+
+def _infer(image_bytes: bytes, model, bundles: tuple) -> dict:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        processed_image = preprocess_image(image)
+    predictions = model.predict(processed_image)
+    idx = int(np.argmax(predictions))
+    return {"bundle": bundles[idx], "confidence": float(predictions[0][idx]) * 100}
+
+
+def _weather(city: str) -> dict | None:
+    weather = get_weather(city)
+    if not weather:
+        return None
+    return {
+        "city": weather.get("name", city),
+        "temp": weather["main"]["temp"],
+        "humidity": weather["main"]["humidity"],
+        "condition": weather["weather"][0]["main"],
+    }
+
+
+def _weather_in_slot(city: str) -> dict | None:
+    try:
+        return _weather(city)
+    finally:
+        _weather_slots.release()
+
+
+async def _timed(executor, fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+# ─── Combining ───
+
+def combine_risk(severity: str, weather_risk: dict | None) -> dict | None:
+    """Overall outlook from the diagnosed severity and the weather risk
+    (None without weather). The level is the higher of the two."""
+    if weather_risk is None:
+        return None
+    weather_level = weather_risk["level"]
+    level = max(severity, weather_level, key=RISK_LEVELS.index)
+    favourable = weather_level in ("Moderate", "High")
+    if severity == "None":
+        message = ("The leaf looks healthy, but current weather favours disease. Inspect crops regularly "
+                   "and consider preventive treatment." if favourable else
+                   "The leaf looks healthy and current weather poses little disease risk.")
+    else:
+        message = ("Current weather favours the spread of this disease. Start treatment promptly and "
+                   "inspect neighbouring plants." if favourable else
+                   "Current weather does not favour its spread. Follow the treatment plan below.")
+    return {"level": level, "message": message}
+
+
+async def diagnose_async(image_bytes: bytes, city: str | None, model, bundles: tuple,
+                         weather_timeout: float = DIAGNOSIS_WEATHER_TIMEOUT,
+                         inference_timeout: float = DIAGNOSIS_INFERENCE_TIMEOUT) -> dict:
+    """Run inference and the weather lookup for `city` concurrently; see diagnose()."""
+    start = time.perf_counter()
+    inference = asyncio.create_task(asyncio.wait_for(
+        _timed(_inference_executor, _infer, image_bytes, model, bundles), inference_timeout))
+    weather, weather_status, timings = None, "skipped", {}
+    weather_task = None
+    if city and city.strip():
+        if _weather_slots.acquire(blocking=False):
+            weather_task = asyncio.create_task(asyncio.wait_for(
+                _timed(_weather_executor, _weather_in_slot, city), weather_timeout))
+        else:
+            weather_status = "timeout"   # every weather thread is stuck on a slow lookup
+
+    if weather_task is not None:
+        try:
+            weather, timings["weather_ms"] = await weather_task
+            weather_status = "ok" if weather else "not_found"
+        except asyncio.TimeoutError:
+            weather_status = "timeout"
+        except Exception as e:
+            print(f"Error fetching weather for diagnosis: {e}")
+            weather_status = "unavailable"
+
+    try:
+        prediction, timings["inference_ms"] = await inference
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Analysis took longer than {inference_timeout:.0f} s") from None
+
+    bundle = prediction["bundle"]
+    weather_risk = (assess_disease_risk(weather["temp"], weather["humidity"], weather["condition"])
+                    if weather else None)
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    return {
+        "bundle": bundle,
+        "confidence": prediction["confidence"],
+        "weather": weather,
+        "weather_status": weather_status,
+        "weather_risk": weather_risk,
+        "outlook": combine_risk(bundle.severity, weather_risk),
+        "timings": timings,
+    }
+
+
+def diagnose(image_bytes: bytes, city: str | None, model, bundles: tuple, **timeouts) -> dict:
+    """
+    Diagnose an uploaded leaf image and, if `city` is given, assess the
+    weather risk there at the same time.
+
+    `bundles` are utils.recommendations.load_bundles(). Returns the
+    predicted class's bundle, confidence (%), weather (temp,
+    humidity, condition or None), weather_status (ok, not_found, timeout,
+    unavailable or skipped), weather_risk, outlook and per-branch timings.
+    Call from synchronous code (the Streamlit script thread).
+    """
+    return asyncio.run(diagnose_async(image_bytes, city, model, bundles, **timeouts))
@@ -0,0 +1,261 @@
+"""
+Streaming export of scan history to CSV, JSONL or Parquet.
+
+Rows are read through a server-side (named) cursor in batches of
+EXPORT_BATCH_SIZE and written out batch by batch, so memory use stays flat
+however many scans are exported. Exports cover one user, several users or
+every user, ordered by user, then time.
+
+The History page's "Export full history" writes to a file in EXPORT_DIR
+(prepare_export_file) and offers it for download. Streamlit sends a
+download from memory, so the page is limited to APP_EXPORT_MAX_ROWS scans;
+larger histories are exported with this CLI. Files left by sessions that
+never downloaded them are deleted after EXPORT_FILE_TTL seconds.
+
+Usage:
+    python -m utils.export --user alice --format csv --out alice_scans.csv
+    python -m utils.export --user alice --user bob --format parquet --out farm.parquet
+    python -m utils.export --all --format jsonl --out all_scans.jsonl.gz
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime
+
+from utils import db
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 10_000))
+EXPORT_COLUMNS = ["id", "user_id", "username", "disease_name", "confidence", "severity", "scanned_at", "image_hash"]
+MEDIA_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "cropguard-exports"))
+EXPORT_FILE_TTL = float(os.environ.get("EXPORT_FILE_TTL", 3600))              # seconds
+APP_EXPORT_MAX_ROWS = int(os.environ.get("APP_EXPORT_MAX_ROWS", 100_000))     # History page downloads
+
+EXPORT_SQL = """SELECT s.id, s.user_id, u.username, s.disease_name, s.confidence, s.severity, s.scanned_at,
+           s.image_hash
+    FROM scan_history s JOIN users u ON u.id = s.user_id
+    {where}
+    ORDER BY s.user_id, s.scanned_at, s.id"""
+
+
+# ─── Reading ───
+
+def iter_scan_batches(user_ids: list[int] | None = None, batch_size: int = EXPORT_BATCH_SIZE,
+                      since: date | None = None, until: date | None = None):
+    """Yield lists of row tuples (EXPORT_COLUMNS order) for the given users, or all users,
+    optionally limited to scans from `since` to `until` (inclusive dates)."""
+    if db.DB_BACKEND == "sqlite":
+        from utils.db_sqlite import pooled_connection
+        params, where = {"since": since, "until": until}, []
+        if user_ids is not None:
+            params.update({f"u{i}": uid for i, uid in enumerate(user_ids)})
+            where.append(f"s.user_id IN ({', '.join(f':u{i}' for i in range(len(user_ids)))})")
+        if since is not None:
+            where.append("s.scanned_at >= :since")
+        if until is not None:
+            where.append("s.scanned_at < date(:until, '+1 day')")
+        with pooled_connection() as conn:
+            # SQLite cursors already step through results lazily
+            cur = conn.execute(EXPORT_SQL.format(where=_where(where)), params)
+            while rows := cur.fetchmany(batch_size):
+                yield [tuple(r) for r in rows]
+        return
+
+    where = []
+    if user_ids is not None:
+        where.append("s.user_id = ANY(%(user_ids)s)")
+    if since is not None:
+        where.append("s.scanned_at >= %(since)s")
+    if until is not None:
+        where.append("s.scanned_at < %(until)s::date + 1")
+    with db.pooled_connection() as conn:
+        db.without_statement_timeout(conn.cursor())  # the first fetch may sort every row
+        # A named cursor keeps the result set on the server; fetchmany pulls
+        # one batch per round trip.
+        cur = conn.cursor(name=f"scan_export_{uuid.uuid4().hex[:8]}")
+        cur.itersize = batch_size
+        cur.execute(EXPORT_SQL.format(where=_where(where)),
+                    {"user_ids": user_ids, "since": since, "until": until})
+        while rows := cur.fetchmany(batch_size):
+            yield rows
+        cur.close()
+
+
+def _where(clauses: list[str]) -> str:
+    return "WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+# ─── Writing ───
+
+def _text(value):
+    return value.isoformat(" ") if isinstance(value, datetime) else value
+
+
+def _csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows([[_text(v) for v in row] for row in rows])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def _jsonl_chunks(batches):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=lambda v: v.isoformat()) + "\n" for row in rows
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back as chunks, for streaming Parquet."""
+
+    def __init__(self):
+        self.chunks, self.position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _parquet_chunks(batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from None
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("username", pa.string()),
+        ("disease_name", pa.string()), ("confidence", pa.float64()), ("severity", pa.string()),
+        ("scanned_at", pa.timestamp("us")), ("image_hash", pa.string()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in batches:  # one row group per batch
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)], schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+WRITERS = {"csv": _csv_chunks, "jsonl": _jsonl_chunks, "parquet": _parquet_chunks}
+
+
+def stream_export(fmt: str, user_ids: list[int] | None = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the export file as byte chunks, one per batch of rows."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    yield from WRITERS[fmt](iter_scan_batches(user_ids, batch_size))
+
+
+def export_scans(out, fmt: str, user_ids: list[int] | None = None, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write an export to `out` (a path or a binary file). Returns the bytes written.
+
+    Paths ending in .gz are gzip-compressed (CSV and JSONL only; Parquet is
+    already compressed, and a gzip'd Parquet file is not readable as one).
+    """
+    if isinstance(out, str):
+        if fmt == "parquet" and out.endswith(".gz"):
+            raise ValueError("Parquet exports are already compressed; use a path without .gz")
+        opener = gzip.open if out.endswith(".gz") else open
+        with opener(out, "wb") as f:
+            return export_scans(f, fmt, user_ids, batch_size)
+    written = 0
+    for chunk in stream_export(fmt, user_ids, batch_size):
+        out.write(chunk)
+        written += len(chunk)
+    return written
+
+
+# ─── Export Files (History page) ───
+
+def remove_export_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_export_files(max_age: float = EXPORT_FILE_TTL) -> int:
+    """Delete export files older than max_age seconds. Returns how many were removed."""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass   # another session swept it first
+    return removed
+
+
+def prepare_export_file(fmt: str, user_ids: list[int]) -> str:
+    """Export to a new file in EXPORT_DIR and return its path (expired files are swept first)."""
+    sweep_export_files()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", dir=EXPORT_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            export_scans(out, fmt, user_ids)
+    except BaseException:
+        remove_export_file(path)
+        raise
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export scan history")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user", action="append", help="Username to export (repeat for several)")
+    who.add_argument("--all", action="store_true", help="Export every user's scans")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--out", required=True, help="Output path ('-' for stdout)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.format == "parquet" and args.out.endswith(".gz"):
+        parser.error("Parquet exports are already compressed; use an --out path without .gz")
+
+    ids = None
+    if args.user:
+        ids = []
+        for name in args.user:
+            user = db.get_user_by_username(name)
+            if user is None:
+                sys.exit(f"Unknown user: {name}")
+            ids.append(user["id"])
+
+    start = time.perf_counter()
+    if args.out == "-":
+        size = export_scans(sys.stdout.buffer, args.format, ids, args.batch_size)
+    else:
+        size = export_scans(args.out, args.format, ids, args.batch_size)
+    print(f"Exported {size / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s", file=sys.stderr)
@@ -0,0 +1,197 @@
+"""
+Content-addressed on-disk store for scan images.
+
+Each uploaded image is stored once, under the SHA-256 of its bytes, in a
+directory tree sharded by the first two bytes of the hash:
+
+    <IMAGE_STORE_DIR>/originals/ab/cd/abcd…   (the upload, byte for byte)
+    <IMAGE_THUMBNAIL_DIR>/ab/cd/abcd….jpg     (THUMBNAIL_SIZE JPEG)
+
+Thumbnails default to static/thumbs, which Streamlit serves as static files,
+so the History page links to them instead of embedding their bytes.
+
+Uploading the same photo twice reuses the stored file. The thumbnail is
+generated when the image is first stored, so History never decodes the
+originals. store_image_in_background() hashes on the caller's thread and
+leaves the writes (and their fsyncs) to a small worker pool, so the
+Detect page does not wait on disk. Files are written to a temporary name and renamed into place,
+so a crash never leaves a partial blob under a valid hash.
+
+Usage:
+    python -m utils.image_store stats
+    python -m utils.image_store verify     # re-hash originals, rebuild missing thumbnails
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "data/images")
+THUMBNAIL_DIR = os.environ.get("IMAGE_THUMBNAIL_DIR", "static/thumbs")
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_QUALITY = 70
+IMAGE_STORE_WORKERS = int(os.environ.get("IMAGE_STORE_WORKERS", 2))
+
+_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+
+# ─── Paths ───
+
+def _check_hash(image_hash: str):
+    # Hashes come back from the database; never let one escape the store
+    if not _HASH.match(image_hash or ""):
+        raise ValueError(f"Not an image hash: {image_hash!r}")
+
+
+def image_path(image_hash: str, root: str = IMAGE_STORE_DIR) -> str:
+    _check_hash(image_hash)
+    return os.path.join(root, "originals", image_hash[:2], image_hash[2:4], image_hash)
+
+
+def thumbnail_relpath(image_hash: str) -> str:
+    """Path of a thumbnail inside the thumbnail directory ('/'-separated, for URLs too)."""
+    _check_hash(image_hash)
+    return f"{image_hash[:2]}/{image_hash[2:4]}/{image_hash}.jpg"
+
+
+def thumbnail_path(image_hash: str, thumb_root: str = THUMBNAIL_DIR) -> str:
+    return os.path.join(thumb_root, *thumbnail_relpath(image_hash).split("/"))
+
+
+def _write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# ─── Store ───
+
+def make_thumbnail(data: bytes) -> bytes:
+    """A THUMBNAIL_SIZE JPEG of the image, upright according to its EXIF orientation."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", THUMBNAIL_SIZE)  # JPEG: decode at reduced scale
+        thumb = ImageOps.exif_transpose(image).convert("RGB")
+    thumb.thumbnail(THUMBNAIL_SIZE)
+    out = io.BytesIO()
+    thumb.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _store(image_hash: str, data: bytes, root: str, thumb_root: str):
+    thumb = thumbnail_path(image_hash, thumb_root)
+    if not os.path.exists(thumb):
+        _write_atomic(thumb, make_thumbnail(data))
+    original = image_path(image_hash, root)
+    if not os.path.exists(original):
+        _write_atomic(original, data)
+
+
+def put_image(data: bytes, root: str = IMAGE_STORE_DIR, thumb_root: str = THUMBNAIL_DIR) -> str:
+    """Store an image (if not already stored) and its thumbnail. Returns its hash."""
+    image_hash = hashlib.sha256(data).hexdigest()
+    _store(image_hash, data, root, thumb_root)
+    return image_hash
+
+
+# Worker threads are joined at interpreter exit, so queued writes still land
+_executor = ThreadPoolExecutor(max_workers=IMAGE_STORE_WORKERS, thread_name_prefix="image-store")
+
+
+def _store_logged(image_hash: str, data: bytes, root: str, thumb_root: str):
+    try:
+        _store(image_hash, data, root, thumb_root)
+    except Exception as e:
+        print(f"Error storing scan image {image_hash[:12]}: {e}")
+
+
+def store_image_in_background(data: bytes, root: str = IMAGE_STORE_DIR,
+                              thumb_root: str = THUMBNAIL_DIR) -> str:
+    """Like put_image, but only the hash is computed before returning; the
+    image and thumbnail are written on a worker thread (errors are logged)."""
+    image_hash = hashlib.sha256(data).hexdigest()
+    _executor.submit(_store_logged, image_hash, data, root, thumb_root)
+    return image_hash
+
+
+def get_thumbnail(image_hash: str, thumb_root: str = THUMBNAIL_DIR) -> bytes | None:
+    """Thumbnail JPEG bytes, or None if the image is not in the store."""
+    try:
+        with open(thumbnail_path(image_hash, thumb_root), "rb") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+def get_image(image_hash: str, root: str = IMAGE_STORE_DIR) -> bytes | None:
+    """Original image bytes, or None if the image is not in the store."""
+    try:
+        with open(image_path(image_hash, root), "rb") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+# ─── Maintenance ───
+
+def _walk(directory: str):
+    for dirpath, _, files in os.walk(directory):
+        for name in files:
+            if not name.startswith(".tmp-"):
+                yield os.path.join(dirpath, name)
+
+
+def store_stats(root: str = IMAGE_STORE_DIR, thumb_root: str = THUMBNAIL_DIR) -> dict:
+    stats = {}
+    for kind, directory in (("originals", os.path.join(root, "originals")), ("thumbs", thumb_root)):
+        paths = list(_walk(directory))
+        stats[kind] = len(paths)
+        stats[f"{kind}_bytes"] = sum(os.path.getsize(p) for p in paths)
+    return stats
+
+
+def verify(root: str = IMAGE_STORE_DIR, thumb_root: str = THUMBNAIL_DIR) -> bool:
+    """Check every original still matches its hash; regenerate missing thumbnails."""
+    ok = True
+    for path in _walk(os.path.join(root, "originals")):
+        with open(path, "rb") as f:
+            data = f.read()
+        name = os.path.basename(path)
+        if hashlib.sha256(data).hexdigest() != name:
+            ok = False
+            print(f"✗ {path}: contents do not match the hash")
+        elif not os.path.exists(thumbnail_path(name, thumb_root)):
+            _write_atomic(thumbnail_path(name, thumb_root), make_thumbnail(data))
+            print(f"  rebuilt thumbnail for {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan image store")
+    parser.add_argument("command", choices=["stats", "verify"])
+    parser.add_argument("--root", default=IMAGE_STORE_DIR)
+    parser.add_argument("--thumb-root", default=THUMBNAIL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        s = store_stats(args.root, args.thumb_root)
+        print(f"{s['originals']} images ({s['originals_bytes'] / 1e6:.1f} MB), "
+              f"{s['thumbs']} thumbnails ({s['thumbs_bytes'] / 1e6:.2f} MB)")
+    else:
+        ok = verify(args.root, args.thumb_root)
+        print("All images verified." if ok else "Corrupt images found — see above.")
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,168 @@
+"""
+In-process metrics: counters, latency histograms and gauges.
+
+Every module records into the one registry here, and the registry renders
+as Prometheus text. With METRICS_PORT set, app.py serves it at
+http://localhost:<port>/metrics.
+
+    from utils import metrics
+    DB_CALLS = metrics.histogram("db_call_seconds", "Latency of each DB function")
+    DB_CALLS.observe(0.012, function="get_scan_history")
+"""
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+
+# Seconds; tuned for DB calls (sub-millisecond lookups up to multi-second scans)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_gauges = {}
+_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _label_text(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_label_text(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q, **labels):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)."""
+        series = self._series.get(_label_key(labels))
+        if not series:
+            return None
+        target, running = q * sum(series[:-1]), 0
+        for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+            running += n
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                running = 0
+                for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                    running += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    le_label = f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{_label_text(key, le_label)} {running}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series[-1]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {running}")
+        return lines
+
+
+def _get_or_create(cls, name, *args):
+    with _lock:
+        if name not in _registry:
+            _registry[name] = cls(name, *args)
+        return _registry[name]
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _get_or_create(Counter, name, help_text)
+
+
+def histogram(name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help_text, buckets)
+
+
+def register_gauges(prefix: str, collect):
+    """Expose every numeric value of `collect()` (a dict) as gauge <prefix>_<key>."""
+    with _lock:
+        _gauges[prefix] = collect
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        metrics, gauges = list(_registry.values()), dict(_gauges)
+    for m in sorted(metrics, key=lambda m: m.name):
+        lines += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} {m.kind}"] + m.render()
+    for prefix, collect in sorted(gauges.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            print(f"Error collecting {prefix} metrics: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+# ─── HTTP Endpoint ───
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int = METRICS_PORT):
+    """Serve /metrics from a daemon thread. Returns the server, or None if port is 0."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,190 @@
+"""
+Versioned schema migrations for the CropGuard database.
+
+Each migration runs once, in order, inside its own transaction, and is
+recorded in schema_migrations. A Postgres advisory lock keeps two
+processes from migrating at the same time. Every statement is written to
+be safe on databases that were created by hand from the README.
+
+Usage:
+    python -m utils.migrations migrate          # apply pending migrations
+    python -m utils.migrations status           # list applied / pending
+    python -m utils.migrations check-indexes    # EXPLAIN every db.py query
+"""
+import argparse
+import json
+import sys
+
+from utils import db
+from utils.partitions import PARTITION_MIGRATION
+from utils.rollups import ROLLUP_BACKFILL, ROLLUP_SCHEMA, USER_BACKFILL
+
+MIGRATION_LOCK_ID = 727601  # arbitrary key for pg_advisory_xact_lock
+
+MIGRATIONS = [
+    (1, "create users and scan_history", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS scan_history (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            disease_name VARCHAR(100),
+            confidence FLOAT,
+            severity VARCHAR(20),
+            scanned_at TIMESTAMP DEFAULT NOW()
+        );
+    """),
+    # create_user() relies on these raising UniqueViolation. The names match
+    # the indexes behind the README's UNIQUE constraints, so existing
+    # databases skip them.
+    (2, "unique indexes on users(username) and users(email)", """
+        CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
+        CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users (email);
+    """),
+    (3, "index scan_history(user_id, scanned_at DESC)", """
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_scanned
+            ON scan_history (user_id, scanned_at DESC);
+    """),
+    (4, "per-user scan rollup tables", ROLLUP_SCHEMA),
+    # History paging walks (scanned_at, id) per user, optionally narrowed to
+    # one disease or severity. The id column supersedes migration 3's index.
+    (5, "keyset pagination indexes on scan_history", """
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_scanned_id
+            ON scan_history (user_id, scanned_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_disease_scanned
+            ON scan_history (user_id, disease_name, scanned_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_scan_history_user_severity_scanned
+            ON scan_history (user_id, severity, scanned_at DESC, id DESC);
+        DROP INDEX IF EXISTS idx_scan_history_user_scanned;
+    """),
+    (6, "partition scan_history by month", PARTITION_MIGRATION),
+    # SHA-256 of the scan's image in utils/image_store.py (NULL for older
+    # scans). Adding a nullable column is catalog-only, even on a big table.
+    (7, "scan_history.image_hash", """
+        ALTER TABLE scan_history ADD COLUMN IF NOT EXISTS image_hash CHAR(64);
+    """),    # Fold the existing scans into the rollups before anything reads them.
+    # Writes wait on the SHARE lock for the length of the backfill.
+    (8, "backfill scan rollups", ROLLUP_BACKFILL),
+]
+
+
+# ─── Migrate ───
+
+def _ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+def applied_versions() -> set[int]:
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        _ensure_migrations_table(cur)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {r[0] for r in cur.fetchall()}
+        conn.commit()
+        cur.close()
+    return versions
+
+
+def migrate() -> list[int]:
+    """Apply every pending migration. Returns the versions applied."""
+    applied = []
+    for version, name, sql in MIGRATIONS:
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            db.without_statement_timeout(cur)
+            _ensure_migrations_table(cur)
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                conn.rollback()
+                continue
+            print(f"Applying migration {version}: {name}")
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            cur.close()
+        applied.append(version)
+    return applied
+
+
+# ─── Index Check ───
+
+# (query name, SQL from utils/db.py, sample parameters)
+INDEX_CHECKS = [
+    ("get_user_by_username", db.USER_BY_USERNAME_SQL, ("someone",)),
+    ("get_user_by_email", db.USER_BY_EMAIL_SQL, ("someone@example.com",)),
+    ("get_scan_history", *db.build_scan_history_query(1)),
+    ("get_scan_history (next page)", *db.build_scan_history_query(1, cursor=("2026-01-01", 1000))),
+    ("get_scan_history (filtered)", *db.build_scan_history_query(
+        1, cursor=("2026-01-01", 1000), disease="Tomato Healthy", severity="None",
+        date_from="2025-01-01", date_to="2026-01-01", min_confidence=50.0)),
+    ("get_disease_frequency", db.DISEASE_FREQUENCY_SQL, (1,)),
+    ("get_daily_scan_counts", db.DAILY_SCAN_COUNTS_SQL, (1,)),
+    ("get_severity_breakdown", db.SEVERITY_BREAKDOWN_SQL, (1,)),
+    ("get_dashboard_summary (rollups)", db.SUMMARY_FROM_ROLLUPS_SQL, {"uid": 1}),
+    ("get_dashboard_summary (scans)", db.SUMMARY_FROM_SCANS_SQL, {"uid": 1}),
+    ("rollups backfill --user", USER_BACKFILL, {"uid": 1}),
+]
+
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan"}
+
+
+def _relation_scans(plan):
+    """Yield (relation, node type) for every table access in a JSON plan."""
+    if "Relation Name" in plan and plan["Node Type"] != "ModifyTable":
+        yield plan["Relation Name"], plan["Node Type"]
+    for child in plan.get("Plans", []):
+        yield from _relation_scans(child)
+
+
+def check_indexes() -> bool:
+    """EXPLAIN each query and fail if any table is read by a sequential scan.
+
+    Sequential scans are disabled for the check, so a Seq Scan in the plan
+    means no usable index exists (on small tables the planner would
+    otherwise pick one regardless).
+    """
+    ok = True
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for name, sql, params in INDEX_CHECKS:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            bad = [f"{rel} ({node})" for rel, node in _relation_scans(plan) if node not in INDEX_NODE_TYPES]
+            if bad:
+                ok = False
+                print(f"✗ {name}: {', '.join(bad)}")
+            else:
+                print(f"✓ {name}")
+        conn.rollback()
+        cur.close()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CropGuard database migrations")
+    parser.add_argument("command", choices=["migrate", "status", "check-indexes"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        done = migrate()
+        print(f"Applied {len(done)} migration(s)." if done else "Database is up to date.")
+    elif args.command == "status":
+        applied = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"[{'x' if version in applied else ' '}] {version:>3}  {name}")
+    else:
+        sys.exit(0 if check_indexes() else 1)
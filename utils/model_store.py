@@ -0,0 +1,184 @@
+"""
+Model artifacts: export the trained model in several formats and load the
+fastest one available.
+
+Formats (all share the same base path, e.g. models/crop_disease_model):
+    h5          legacy HDF5 file                      <base>.h5
+    keras       native Keras zip archive              <base>.keras
+    savedmodel  TensorFlow SavedModel directory       <base>_savedmodel/
+    raw         architecture JSON + one flat weights  <base>_raw/
+                file that is memory-mapped on load
+
+benchmarks/bench_model_load.py measures cold-load time per format and
+writes models/load_benchmark.json; load_best_model() uses that ranking
+when present, otherwise DEFAULT_ORDER.
+
+The .h5 file is the source of truth. Each export records the size and
+modification time of the .h5 it was made from (<artifact>.source.json),
+and is skipped once the .h5 changes, e.g. after retraining without
+exporting or copying in a new .h5.
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+MODEL_BASE = "models/crop_disease_model"
+BENCHMARK_PATH = "models/load_benchmark.json"
+DEFAULT_ORDER = ("raw", "keras", "h5", "savedmodel")
+EXPORT_FORMATS = ("keras", "raw")
+ALIGN = 64  # byte alignment of each tensor inside weights.bin
+
+
+def artifact_path(fmt: str, base: str = MODEL_BASE) -> str:
+    return {
+        "h5": f"{base}.h5",
+        "keras": f"{base}.keras",
+        "savedmodel": f"{base}_savedmodel",
+        "raw": f"{base}_raw",
+    }[fmt]
+
+
+def source_stamp(base: str = MODEL_BASE) -> dict | None:
+    """Size and modification time of the .h5 file, or None if there is none."""
+    try:
+        st = os.stat(artifact_path("h5", base))
+    except OSError:
+        return None
+    return {"h5_size": st.st_size, "h5_mtime_ns": st.st_mtime_ns}
+
+
+def _source_path(fmt: str, base: str) -> str:
+    return artifact_path(fmt, base) + ".source.json"
+
+
+def is_current(fmt: str, base: str = MODEL_BASE) -> bool:
+    """False for an export made from a different .h5 than the one present."""
+    source = source_stamp(base)
+    if fmt == "h5" or source is None:
+        return True
+    try:
+        with open(_source_path(fmt, base)) as f:
+            return json.load(f) == source
+    except (OSError, ValueError):
+        return False
+
+
+# ─── Raw (memory-mapped) weights ───
+
+def save_raw(model, path: str):
+    """Write architecture.json, weights.bin and manifest.json to `path`."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "architecture.json"), "w") as f:
+        f.write(model.to_json())
+
+    manifest, offset = [], 0
+    with open(os.path.join(path, "weights.bin"), "wb") as f:
+        for w in model.get_weights():
+            w = np.ascontiguousarray(w)
+            pad = -offset % ALIGN
+            f.write(b"\0" * pad)
+            offset += pad
+            manifest.append({"offset": offset, "shape": list(w.shape), "dtype": w.dtype.str})
+            f.write(w.tobytes())
+            offset += w.nbytes
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+
+def load_raw(path: str):
+    """Rebuild the model from its architecture and memory-mapped weights."""
+    with open(os.path.join(path, "architecture.json")) as f:
+        model = tf.keras.models.model_from_json(f.read())
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    blob = np.memmap(os.path.join(path, "weights.bin"), dtype=np.uint8, mode="r")
+    weights = [
+        np.frombuffer(blob, dtype=m["dtype"], count=int(np.prod(m["shape"])), offset=m["offset"]).reshape(m["shape"])
+        for m in manifest
+    ]
+    model.set_weights(weights)
+    return model
+
+
+# ─── SavedModel ───
+
+class SavedModelPredictor:
+    """Gives a loaded SavedModel the model.predict() interface app.py uses."""
+
+    def __init__(self, loaded):
+        self._fn = loaded.serve if hasattr(loaded, "serve") else loaded.signatures["serving_default"]
+
+    def predict(self, x, verbose=0):
+        out = self._fn(tf.constant(x, dtype=tf.float32))
+        if isinstance(out, dict):
+            out = next(iter(out.values()))
+        return out.numpy()
+
+
+def save_savedmodel(model, path: str):
+    if hasattr(model, "export"):  # Keras 3
+        model.export(path)
+    else:
+        tf.saved_model.save(model, path)
+
+
+# ─── Export / Load ───
+
+def export_model(model, base: str = MODEL_BASE, formats=EXPORT_FORMATS):
+    """Write the model in each of `formats` next to the .h5 file, which
+    must already hold the same model."""
+    source = source_stamp(base)
+    for fmt in formats:
+        path = artifact_path(fmt, base)
+        if fmt == "raw":
+            save_raw(model, path)
+        elif fmt == "savedmodel":
+            save_savedmodel(model, path)
+        else:
+            model.save(path)
+        with open(_source_path(fmt, base), "w") as f:
+            json.dump(source, f)
+        print(f"Exported {fmt} model to {path}")
+
+
+def load_format(fmt: str, base: str = MODEL_BASE):
+    path = artifact_path(fmt, base)
+    if fmt == "raw":
+        return load_raw(path)
+    if fmt == "savedmodel":
+        return SavedModelPredictor(tf.saved_model.load(path))
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def format_order(benchmark_path: str = BENCHMARK_PATH) -> list[str]:
+    """Formats ranked by measured cold-load time, falling back to DEFAULT_ORDER."""
+    try:
+        with open(benchmark_path) as f:
+            results = json.load(f)
+        ranked = sorted(results, key=lambda fmt: results[fmt]["load_seconds"])
+        return ranked + [fmt for fmt in DEFAULT_ORDER if fmt not in ranked]
+    except (OSError, ValueError, KeyError):
+        return list(DEFAULT_ORDER)
+
+
+def available_formats(base: str = MODEL_BASE) -> list[str]:
+    return [fmt for fmt in DEFAULT_ORDER if os.path.exists(artifact_path(fmt, base))]
+
+
+def load_best_model(base: str = MODEL_BASE):
+    """Load the fastest artifact that exists and matches the .h5, trying the
+    next one on failure."""
+    available = set(available_formats(base))
+    for fmt in format_order():
+        if fmt not in available:
+            continue
+        if not is_current(fmt, base):
+            print(f"Skipping {fmt} model: exported from an older {artifact_path('h5', base)}")
+            continue
+        try:
+            return load_format(fmt, base)
+        except Exception as e:
+            print(f"Could not load {fmt} model: {type(e).__name__}: {e}")
+    raise FileNotFoundError(f"No loadable model artifact found for {base}")
@@ -0,0 +1,294 @@
+"""
+Monthly range partitions for scan_history, and the retention policy.
+
+scan_history is partitioned by RANGE (scanned_at), one partition per
+calendar month (scan_history_YYYY_MM) plus a DEFAULT partition that
+catches rows outside every month created so far. Queries with a time
+bound (the Dashboard's last-30-days counts, dated History filters, History
+pages past the first) only touch the partitions they need.
+
+Future months are created by the SQL function
+ensure_scan_history_partitions(months_ahead), so they can also be
+scheduled from inside Postgres (e.g. pg_cron). Partitions older than the
+retention window are written to gzip'd CSV in ARCHIVE_DIR while still
+attached, checked, and only then detached and dropped, so the lock that
+blocks scan_history is held for the detach rather than the copy.
+
+Usage:
+    python -m utils.partitions maintain          # create ahead + archive old
+    python -m utils.partitions list
+    python -m utils.partitions archive --retention-months 24 [--dry-run]
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+from datetime import date
+
+import psycopg2.errors
+
+from utils.db import ROLLUPS_READY_SQL, pooled_connection, without_statement_timeout
+
+MONTHS_AHEAD = int(os.environ.get("SCAN_PARTITION_MONTHS_AHEAD", 3))
+RETENTION_MONTHS = int(os.environ.get("SCAN_RETENTION_MONTHS", 24))
+ARCHIVE_DIR = os.environ.get("SCAN_ARCHIVE_DIR", "archive")
+# How long the detach waits for running queries before giving up until the
+# next run (while it waits, it queues every other scan_history query)
+DETACH_LOCK_TIMEOUT_MS = int(os.environ.get("SCAN_ARCHIVE_LOCK_TIMEOUT_MS", 2000))
+
+# Parent table, default partition, indexes and the partition functions.
+# Index definitions on the parent are created on every partition.
+PARTITIONED_SCHEMA = """
+CREATE TABLE scan_history (
+    id INTEGER NOT NULL DEFAULT nextval('scan_history_id_seq'),
+    user_id INTEGER REFERENCES users(id),
+    disease_name VARCHAR(100),
+    confidence FLOAT,
+    severity VARCHAR(20),
+    scanned_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, scanned_at)
+) PARTITION BY RANGE (scanned_at);
+
+CREATE TABLE scan_history_default PARTITION OF scan_history DEFAULT;
+
+CREATE INDEX idx_scan_history_user_scanned_id
+    ON scan_history (user_id, scanned_at DESC, id DESC);
+CREATE INDEX idx_scan_history_user_disease_scanned
+    ON scan_history (user_id, disease_name, scanned_at DESC, id DESC);
+CREATE INDEX idx_scan_history_user_severity_scanned
+    ON scan_history (user_id, severity, scanned_at DESC, id DESC);
+
+-- Create the partition for the month containing `month`, moving any rows
+-- for that month out of the default partition first.
+CREATE OR REPLACE FUNCTION create_scan_history_partition(month date) RETURNS boolean AS $$
+DECLARE
+    lo date := date_trunc('month', month)::date;
+    hi date := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    part text := 'scan_history_' || to_char(lo, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE scan_history INCLUDING DEFAULTS)', part);
+    EXECUTE format('WITH moved AS (DELETE FROM scan_history_default
+                        WHERE scanned_at >= %L AND scanned_at < %L RETURNING *)
+                    INSERT INTO %I SELECT * FROM moved', lo, hi, part);
+    EXECUTE format('ALTER TABLE scan_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+    RETURN true;
+END
+$$ LANGUAGE plpgsql;
+
+-- Make sure this month and the next `months_ahead` months have partitions.
+CREATE OR REPLACE FUNCTION ensure_scan_history_partitions(months_ahead integer) RETURNS integer AS $$
+    SELECT COUNT(*) FILTER (WHERE create_scan_history_partition(m::date))::integer
+    FROM generate_series(date_trunc('month', NOW()),
+                         date_trunc('month', NOW()) + months_ahead * INTERVAL '1 month',
+                         INTERVAL '1 month') AS m
+$$ LANGUAGE sql;
+"""
+
+# Migration: swap the plain table for the partitioned one, keeping ids.
+PARTITION_MIGRATION = f"""
+ALTER TABLE scan_history RENAME TO scan_history_unpartitioned;
+ALTER INDEX scan_history_pkey RENAME TO scan_history_unpartitioned_pkey;
+DROP INDEX IF EXISTS idx_scan_history_user_scanned;
+DROP INDEX IF EXISTS idx_scan_history_user_scanned_id;
+DROP INDEX IF EXISTS idx_scan_history_user_disease_scanned;
+DROP INDEX IF EXISTS idx_scan_history_user_severity_scanned;
+{PARTITIONED_SCHEMA}
+SELECT create_scan_history_partition(m::date)
+FROM generate_series(date_trunc('month', (SELECT MIN(scanned_at) FROM scan_history_unpartitioned)),
+                     date_trunc('month', NOW()), INTERVAL '1 month') AS m;
+SELECT ensure_scan_history_partitions({MONTHS_AHEAD});
+
+INSERT INTO scan_history (id, user_id, disease_name, confidence, severity, scanned_at)
+SELECT id, user_id, disease_name, confidence, severity, COALESCE(scanned_at, NOW())
+FROM scan_history_unpartitioned;
+
+ALTER SEQUENCE scan_history_id_seq OWNED BY scan_history.id;
+DROP TABLE scan_history_unpartitioned;
+"""
+
+
+# Take a detached partition's rows back out of the rollups, so the
+# Dashboard and `rollups check` keep describing the retained history.
+REMOVE_FROM_ROLLUPS_SQL = """
+WITH old AS (
+    SELECT user_id, COALESCE(disease_name, 'Unknown') AS disease_name,
+           COALESCE(severity, 'Unknown') AS severity, confidence, scanned_at
+    FROM {table}
+), daily AS (
+    DELETE FROM scan_daily_rollup r USING (SELECT DISTINCT user_id, DATE(scanned_at) AS d FROM old) o
+    WHERE r.user_id = o.user_id AND r.scan_date = o.d
+), disease AS (
+    UPDATE scan_disease_rollup r SET count = r.count - o.n
+    FROM (SELECT user_id, disease_name, COUNT(*) AS n FROM old GROUP BY 1, 2) o
+    WHERE r.user_id = o.user_id AND r.disease_name = o.disease_name
+), severity AS (
+    UPDATE scan_severity_rollup r SET count = r.count - o.n
+    FROM (SELECT user_id, severity, COUNT(*) AS n FROM old GROUP BY 1, 2) o
+    WHERE r.user_id = o.user_id AND r.severity = o.severity
+)
+UPDATE scan_user_totals r
+SET total = r.total - o.n, high_risk = r.high_risk - o.high, confidence_sum = r.confidence_sum - o.conf
+FROM (SELECT user_id, COUNT(*) AS n, COUNT(*) FILTER (WHERE severity = 'High') AS high,
+             COALESCE(SUM(confidence), 0) AS conf
+      FROM old GROUP BY 1) o
+WHERE r.user_id = o.user_id;
+DELETE FROM scan_disease_rollup WHERE count = 0;
+DELETE FROM scan_severity_rollup WHERE count = 0;
+DELETE FROM scan_user_totals WHERE total = 0;
+"""
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> int:
+    """Create missing partitions up to `months_ahead` months out. Returns how many."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)  # may move rows out of the default partition
+        cur.execute("SELECT ensure_scan_history_partitions(%s)", (months_ahead,))
+        created = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return created
+
+
+def list_partitions() -> list[dict]:
+    """Monthly partitions, oldest first: name, first day, first day of next month, rows."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.relname, COALESCE(s.n_live_tup, 0)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE i.inhparent = 'scan_history'::regclass AND c.relname ~ '^scan_history_[0-9]{4}_[0-9]{2}$'
+            ORDER BY c.relname
+        """)
+        rows = cur.fetchall()
+        cur.close()
+    partitions = []
+    for name, estimate in rows:
+        year, month = int(name[-7:-3]), int(name[-2:])
+        start = date(year, month, 1)
+        partitions.append({"name": name, "from": start, "to": _add_months(start, 1), "rows": estimate})
+    return partitions
+
+
+def _copy_partition(name: str, path: str) -> int:
+    """Write a partition, still attached, to gzip'd CSV at `path` and fsync
+    it. Returns the number of rows, counted in the same snapshot."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        without_statement_timeout(cur)
+        cur.execute(f"SELECT COUNT(*) FROM {name}")
+        rows = cur.fetchone()[0]
+        with open(path, "wb") as raw:
+            with gzip.open(raw, "wb") as f:
+                cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            raw.flush()
+            os.fsync(raw.fileno())
+        conn.rollback()
+        cur.close()
+    return rows
+
+
+def _archived_rows(path: str) -> int:
+    """Rows in an archive file, read back from disk (header excluded)."""
+    with gzip.open(path, "rb") as f:
+        return sum(1 for _ in csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))) - 1
+
+
+def _detach_and_drop(name: str, rows: int, tmp_path: str, path: str) -> bool:
+    """Detach and drop an archived partition if it still holds exactly the
+    archived rows, taking them out of the rollups and moving the archive
+    into place. False (nothing changed) if rows arrived since the copy or
+    the lock could not be had in time.
+
+    DETACH ... CONCURRENTLY is not allowed while a default partition
+    exists, so this is a plain detach bounded by lock_timeout; scan_history
+    stays locked only for the row count, the rollup update and the drop.
+    """
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)
+        cur.execute("SET LOCAL lock_timeout = %s", (DETACH_LOCK_TIMEOUT_MS,))
+        try:
+            cur.execute(f"ALTER TABLE scan_history DETACH PARTITION {name}")
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"{name}: scan_history busy, not detached (will retry on the next run)")
+            return False
+        cur.execute(f"SELECT COUNT(*) FROM {name}")
+        if cur.fetchone()[0] != rows:
+            conn.rollback()
+            print(f"{name}: changed while being archived, not detached (will retry on the next run)")
+            return False
+        # Asked with scan_history locked, so a backfill cannot be half done
+        cur.execute(ROLLUPS_READY_SQL)
+        if cur.fetchone()[0]:
+            cur.execute(REMOVE_FROM_ROLLUPS_SQL.format(table=name))
+        cur.execute(f"DROP TABLE {name}")
+        os.replace(tmp_path, path)
+        conn.commit()
+        cur.close()
+    return True
+
+
+def archive_partitions(retention_months: int = RETENTION_MONTHS, archive_dir: str = ARCHIVE_DIR,
+                       dry_run: bool = False) -> list[str]:
+    """Archive and drop every partition that ends before the retention window.
+
+    Each partition is copied to <archive_dir>/<name>.csv.gz while still
+    attached (reads and writes carry on), the file is fsync'd and read back,
+    and only then is the partition detached, taken out of the rollups and
+    dropped, in one short transaction. A partition that fails any step is
+    left in place. Returns the archive paths written.
+    """
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    expired = [p for p in list_partitions() if p["to"] <= cutoff]
+    if dry_run:
+        for p in expired:
+            print(f"Would archive {p['name']} (~{p['rows']} rows)")
+        return []
+
+    os.makedirs(archive_dir, exist_ok=True)
+    written = []
+    for p in expired:
+        path = os.path.join(archive_dir, f"{p['name']}.csv.gz")
+        rows = _copy_partition(p["name"], path + ".tmp")
+        archived = _archived_rows(path + ".tmp")
+        if archived != rows:
+            print(f"{p['name']}: archive holds {archived} of {rows} rows, not detached")
+            os.remove(path + ".tmp")
+            continue
+        if not _detach_and_drop(p["name"], rows, path + ".tmp", path):
+            os.remove(path + ".tmp")
+            continue
+        print(f"Archived {p['name']} to {path} ({rows} rows)")
+        written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage scan_history partitions")
+    parser.add_argument("command", choices=["maintain", "list", "archive"])
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for p in list_partitions():
+            print(f"{p['name']}  {p['from']} – {p['to']}  ~{p['rows']} rows")
+    else:
+        if args.command == "maintain":
+            print(f"Created {ensure_partitions(args.months_ahead)} partition(s).")
+        archive_partitions(args.retention_months, args.archive_dir, args.dry_run)
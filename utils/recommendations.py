@@ -1,72 +1,163 @@
-recommendations = {
-    "Tomato_Early_Blight": {
-        "description": "Early blight involves concentric rings on lower leaves, turning yellow and dropping off.",
-        "treatment": [
-            "Use Mancozeb or Chlorothalonil fungicide.",
-            "Improve air circulation between plants.",
-            "Remove and destroy infected leaves immediately.",
-            "Water at the base of the plant, not overhead."
-        ],
-        "severity": "Moderate"
-    },
-    "Tomato_Late_Blight": {
-        "description": "Late blight causes dark, water-soaked spots on leaves and white fungal growth on undersides.",
-        "treatment": [
-            "Apply copper-based fungicides.",
-            "Destroy all infected plants immediately to prevent spread.",
-            "Keep foliage dry; avoid overhead irrigation."
-        ],
-        "severity": "High"
-    },
-    "Tomato_Healthy": {
-        "description": "The plant appears healthy with no visible signs of disease.",
-        "treatment": [
-            "Continue regular watering and fertilization.",
-            "Monitor regularly for any signs of pests or diseases."
-        ],
-        "severity": "None"
-    },
-     "Potato_Early_Blight": {
-        "description": "Brown spots with concentric rings on older leaves.",
-        "treatment": [
-            "Apply fungicides like Mancozeb.",
-            "Practice crop rotation.",
-            "Ensure proper nitrogen fertilization."
-        ],
-        "severity": "Moderate"
-    },
-    "Potato_Late_Blight": {
-        "description": "Rapidly spreading dark lesions on leaves and stems.",
-        "treatment": [
-            "Apply fungicides immediately.",
-            "Destroy infected tubers.",
-            "Ensure good drainage."
-        ],
-        "severity": "High"
-    },
-    "Potato_Healthy": {
-        "description": "No disease detected.",
-        "treatment": [
-            "Maintain good agricultural practices."
-        ],
-        "severity": "None"
-    }
+"""
+Treatment recommendations per disease class, and the per-class result
+bundles the Detect page shows.
+
+Recommendations live in models/recommendations.json, keyed by class name.
+load_bundles() turns them into one immutable ResultBundle per model output
+index, with everything about a result that does not depend on the scan
+(display name, severity styling, rendered HTML, report text) worked out
+once. It checks the bundles against models/class_indices.json and refuses
+to load if any class the model can predict has no recommendation, so a
+prediction never falls through to "Disease not recognized".
+"""
+import html
+import json
+import os
+from typing import NamedTuple
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+RECOMMENDATIONS_PATH = os.environ.get("RECOMMENDATIONS_PATH", os.path.join(MODELS_DIR, "recommendations.json"))
+CLASS_INDICES_PATH = os.path.join(MODELS_DIR, "class_indices.json")
+
+# severity -> (CSS class, progress score, card colour)
+SEVERITY_STYLES = {
+    "None": ("sv-none", 0, "green"),
+    "Low": ("sv-low", 25, "amber"),
+    "Moderate": ("sv-mod", 50, "amber"),
+    "High": ("sv-high", 85, "red"),
 }
 
+UNKNOWN_RECOMMENDATION = {
+    "description": "Disease not recognized.",
+    "treatment": ["Consult an expert agriculturalist."],
+    "severity": "Unknown"
+}
+
+
+def load_recommendations(path: str = RECOMMENDATIONS_PATH) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+recommendations = load_recommendations()
+
+
 def get_recommendation(disease_name):
     """
     Returns the recommendation info for a given disease.
     """
-    return recommendations.get(disease_name, {
-        "description": "Disease not recognized.",
-        "treatment": ["Consult an expert agriculturalist."],
-        "severity": "Unknown"
-    })
+    return recommendations.get(disease_name, UNKNOWN_RECOMMENDATION)
+
+
+# ─── Result Bundles ───
+
+class ResultBundle(NamedTuple):
+    index: int
+    name: str                   # class name, e.g. "Tomato_Late_Blight"
+    display_name: str           # as shown and stored in scan history
+    severity: str
+    severity_class: str
+    severity_score: int
+    card_class: str
+    description: str            # report text
+    treatments: tuple
+    report_filename: str
+    disease_html: str           # Detect page result cards
+    severity_html: str
+    description_html: str
+    treatment_html: str
+
+
+def _validate(name: str, info: dict) -> list[str]:
+    problems = []
+    if not isinstance(info.get("description"), str) or not info["description"]:
+        problems.append(f"{name}: missing description")
+    treatment = info.get("treatment")
+    if not isinstance(treatment, list) or not treatment or not all(isinstance(t, str) for t in treatment):
+        problems.append(f"{name}: treatment must be a non-empty list of strings")
+    if info.get("severity") not in SEVERITY_STYLES:
+        problems.append(f"{name}: severity {info.get('severity')!r} is not one of {', '.join(SEVERITY_STYLES)}")
+    return problems
+
+
+def _bundle(index: int, name: str, info: dict) -> ResultBundle:
+    display_name = name.replace("_", " ")
+    severity = info["severity"]
+    severity_class, severity_score, card_class = SEVERITY_STYLES[severity]
+    treatments = tuple(info["treatment"])
+    items = "".join(
+        f'<div class="tx-item"><span class="tx-check"><i class="fa-solid fa-circle-check"></i></span>{html.escape(t)}</div>'
+        for t in treatments
+    )
+    return ResultBundle(
+        index=index,
+        name=name,
+        display_name=display_name,
+        severity=severity,
+        severity_class=severity_class,
+        severity_score=severity_score,
+        card_class=card_class,
+        description=info["description"],
+        treatments=treatments,
+        report_filename=f"CropGuard_Report_{name}.pdf",
+        disease_html=f"""
+            <div class="r-card">
+                <div class="r-label"><i class="fa-solid fa-virus" style="margin-right:4px; color:#6366f1;"></i>Detected Disease</div>
+                <div class="r-val">{html.escape(display_name)}</div>
+            </div>
+            """,
+        severity_html=f"""
+                <div class="r-card {card_class}">
+                    <div class="r-label"><i class="fa-solid fa-gauge-high" style="margin-right:4px;"></i>Severity</div>
+                    <div class="r-val {severity_class}">{severity}</div>
+                </div>
+                """,
+        description_html=f"""
+            <div class="r-card green">
+                <div class="r-label"><i class="fa-solid fa-circle-info" style="margin-right:4px; color:#10b981;"></i>About This Disease</div>
+                <div class="r-val-sm">{html.escape(info['description'])}</div>
+            </div>
+            """,
+        treatment_html=f"""
+            <div class="tx-box">
+                <div class="tx-title"><i class="fa-solid fa-kit-medical"></i> Treatment Recommendations</div>
+                {items}
+            </div>
+            """,
+    )
+
+
+def load_bundles(class_indices_path: str = CLASS_INDICES_PATH, recs: dict | None = None) -> tuple[ResultBundle, ...]:
+    """
+    One ResultBundle per model output, indexed by class index. Raises
+    ValueError listing every problem if class_indices.json and the
+    recommendations do not line up.
+    """
+    recs = recommendations if recs is None else recs
+    with open(class_indices_path, "r") as f:
+        class_indices = json.load(f)
+
+    problems = []
+    if sorted(class_indices.values()) != list(range(len(class_indices))):
+        problems.append(f"class indices must be 0..{len(class_indices) - 1}, got {sorted(class_indices.values())}")
+    for name in class_indices:
+        if name not in recs:
+            problems.append(f"{name}: no recommendation in {os.path.basename(RECOMMENDATIONS_PATH)}")
+        else:
+            problems += _validate(name, recs[name])
+    if problems:
+        raise ValueError("Result bundles do not match the model's classes:\n  " + "\n  ".join(problems))
+
+    by_index = sorted(class_indices.items(), key=lambda item: item[1])
+    return tuple(_bundle(index, name, recs[name]) for name, index in by_index)
+
 
 if __name__ == "__main__":
-    # Test the module
-    disease = "Tomato_Early_Blight"
-    info = get_recommendation(disease)
-    print(f"Disease: {disease}")
-    print(f"Severity: {info['severity']}")
-    print(f"Treatment: {info['treatment']}")
+    # Validate the data file against the model's classes
+    bundles = load_bundles()
+    for b in bundles:
+        print(f"{b.index}: {b.display_name:<24} severity {b.severity:<8} {len(b.treatments)} treatments")
+    extra = sorted(set(recommendations) - {b.name for b in bundles})
+    if extra:
+        print(f"Not predicted by the current model: {', '.join(extra)}")
+    print("Result bundles OK ✓")
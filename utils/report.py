@@ -1,5 +1,20 @@
-from fpdf import FPDF
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
+
+from fpdf import FPDF
+
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", 128))  # finished PDFs kept in memory
+
+DISCLAIMER = (
+    "Disclaimer: This report is generated by an AI model and is intended for "
+    "informational purposes only. Please consult a certified agronomist for "
+    "professional advice."
+)
 
 
 class CropReport(FPDF):
@@ -41,6 +56,47 @@ class CropReport(FPDF):
         self.set_text_color(*val_rgb)
         self.cell(0, 7, value, ln=True)
 
+    def wrapped_text(self, text: str, line_height: float):
+        """Like multi_cell(epw, ...) in the current font, left-aligned, with the
+        line breaks computed once per text and reused (see _wrap)."""
+        for line in _wrap(text, self.epw, self.font_style, self.font_size_pt):
+            self.cell(0, line_height, line, ln=True)
+
+
+# ─── Template ───
+# Line breaking is most of the cost of a report, and the long texts (the
+# disclaimer and each disease's description and treatments) are the same in
+# every report. They are broken into lines once, on a measuring document
+# with the report's fonts, and later reports only draw the cached lines.
+
+_measure = None
+_measure_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
+def _wrap(text: str, width: float, style: str, size: float) -> tuple[str, ...]:
+    global _measure
+    with _measure_lock:
+        if _measure is None:
+            _measure = FPDF()
+            _measure.add_page()
+        _measure.set_font("Helvetica", style, size)
+        return tuple(_measure.multi_cell(width, 5, text, dry_run=True, output="LINES"))
+
+
+# ─── Report Cache ───
+# Reports are pure functions of their inputs, so a finished PDF is cached
+# under a hash of them: the Download button can be pressed again, or the
+# page rerun, without rendering anything.
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+
+
+def report_key(**fields) -> str:
+    """Content hash identifying a report."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
 
 def generate_report_pdf(
     username: str,
@@ -49,9 +105,32 @@ def generate_report_pdf(
     severity: str,
     description: str,
     treatments: list,
+    scanned_at: datetime | None = None,
 ) -> bytes:
-    """Generate a styled PDF report and return as bytes."""
-
+    """Generate a styled PDF report and return as bytes.
+
+    Pass scanned_at (the time of the scan) to make the report cacheable;
+    identical inputs then return the cached PDF.
+    """
+    if scanned_at is None:
+        return _render_report(username, disease_name, confidence, severity, description, treatments,
+                              datetime.now())
+    key = report_key(username=username, disease_name=disease_name, confidence=confidence, severity=severity,
+                     description=description, treatments=list(treatments), scanned_at=scanned_at)
+    with _reports_lock:
+        if key in _reports:
+            _reports.move_to_end(key)
+            return _reports[key]
+    pdf_bytes = _render_report(username, disease_name, confidence, severity, description, treatments, scanned_at)
+    with _reports_lock:
+        _reports[key] = pdf_bytes
+        while len(_reports) > REPORT_CACHE_SIZE:
+            _reports.popitem(last=False)
+    return pdf_bytes
+
+
+def _render_report(username, disease_name, confidence, severity, description, treatments,
+                   scanned_at: datetime) -> bytes:
     pdf = CropReport()
     pdf.set_margins(left=15, top=10, right=15)
     pdf.set_auto_page_break(auto=True, margin=20)
@@ -60,7 +139,7 @@ def generate_report_pdf(
     # ── Scan Summary ──
     pdf.section_title("Scan Summary")
     pdf.key_value("Analysed By:", username)
-    pdf.key_value("Date & Time:", datetime.now().strftime("%d %B %Y, %I:%M %p"))
+    pdf.key_value("Date & Time:", scanned_at.strftime("%d %B %Y, %I:%M %p"))
     pdf.ln(4)
 
     # ── Detection Results ──
@@ -93,8 +172,7 @@ def generate_report_pdf(
         pdf.section_title("About This Disease")
         pdf.set_font("Helvetica", "", 10)
         pdf.set_text_color(51, 65, 85)
-        # Use effective page width for multi_cell
-        pdf.multi_cell(pdf.epw, 6, description)
+        pdf.wrapped_text(description, 6)
         pdf.ln(4)
 
     # ── Treatment Recommendations ──
@@ -103,19 +181,13 @@ def generate_report_pdf(
         pdf.set_font("Helvetica", "", 10)
         pdf.set_text_color(51, 65, 85)
         for i, t in enumerate(treatments, 1):
-            # Use a full-width multi_cell with numbered prefix in the text
-            pdf.multi_cell(pdf.epw, 7, f"{i}. {t}")
+            pdf.wrapped_text(f"{i}. {t}", 7)
             pdf.ln(1)
         pdf.ln(2)
 
     # ── Disclaimer ──
     pdf.set_font("Helvetica", "I", 8)
     pdf.set_text_color(148, 163, 184)
-    pdf.multi_cell(
-        pdf.epw, 5,
-        "Disclaimer: This report is generated by an AI model and is intended for "
-        "informational purposes only. Please consult a certified agronomist for "
-        "professional advice."
-    )
+    pdf.wrapped_text(DISCLAIMER, 5)
 
     return bytes(pdf.output())
@@ -0,0 +1,125 @@
+"""
+Vectorised disease risk over forecast grids (location x hour).
+
+Evaluates the same rules as utils.weather.assess_disease_risk, using its
+thresholds, over whole NumPy arrays at once, plus duration features that
+a single reading cannot give:
+
+  leaf wetness     - an hour counts as wet when humidity is at least
+                     LEAF_WETNESS_HUMIDITY or it is raining/drizzling
+  wet_run          - consecutive wet hours up to and including each hour
+  wet_hours        - wet hours in the trailing window
+  humid_hours      - hours with humidity >= HIGH_RISK_HUMIDITY in the window
+
+All inputs are broadcast to shape (locations, hours); time is the last
+axis. Conditions can be given as OpenWeatherMap condition ids (forecasts
+carry them; 2xx-5xx are wet) or as main condition strings.
+
+    from utils.risk_grid import assess_risk_grid
+    grid = assess_risk_grid(temp, humidity, condition_ids=ids)   # (10000, 120) each
+    grid["risk"]          # RISK_* codes, as risk_code() per reading
+    grid["wet_run"]       # hours of continuous leaf wetness
+"""
+import os
+
+import numpy as np
+
+from utils.weather import (HEAT_STRESS_TEMP, HIGH_RISK_HUMIDITY, HIGH_RISK_TEMP, MODERATE_RISK_HUMIDITY,
+                           RISK_HEAT, RISK_HIGH, RISK_LEVELS, RISK_LOW, RISK_MODERATE, WET_CONDITIONS)
+
+LEAF_WETNESS_HUMIDITY = float(os.environ.get("LEAF_WETNESS_HUMIDITY", 90))  # % RH treated as wet leaves
+RISK_WINDOW_HOURS = int(os.environ.get("RISK_WINDOW_HOURS", 24))
+
+
+# ─── Inputs ───
+
+def wet_from_condition_ids(condition_ids) -> np.ndarray:
+    """Thunderstorm (2xx), drizzle (3xx) and rain (5xx) OpenWeatherMap ids."""
+    ids = np.asarray(condition_ids)
+    return (ids >= 200) & (ids < 600)
+
+
+def wet_from_conditions(conditions) -> np.ndarray:
+    """Main condition strings ("Rain", "Clouds", ...) that the scalar rules treat as wet."""
+    values, inverse = np.unique(np.asarray(conditions, dtype=str), return_inverse=True)
+    wet = np.array([v.lower() in WET_CONDITIONS for v in values], dtype=bool)
+    return wet[inverse].reshape(np.shape(conditions))
+
+
+# ─── Rules ───
+
+def risk_codes(temp, humidity, wet) -> np.ndarray:
+    """RISK_* code per reading; the same rules, in the same order, as weather.risk_code."""
+    temp, humidity, wet = np.broadcast_arrays(np.asarray(temp), np.asarray(humidity), np.asarray(wet, dtype=bool))
+    codes = np.full(temp.shape, RISK_LOW, dtype=np.int8)
+    # Lowest precedence first, so each later rule overrides
+    codes[temp >= HEAT_STRESS_TEMP] = RISK_HEAT
+    codes[(humidity >= MODERATE_RISK_HUMIDITY) | wet] = RISK_MODERATE
+    codes[(humidity >= HIGH_RISK_HUMIDITY) & (temp >= HIGH_RISK_TEMP[0]) & (temp <= HIGH_RISK_TEMP[1])] = RISK_HIGH
+    return codes
+
+
+def risk_levels(codes) -> np.ndarray:
+    """Level name ("Low", "Moderate" or "High") for each code."""
+    return np.array([r["level"] for r in RISK_LEVELS])[np.asarray(codes)]
+
+
+# ─── Duration Features ───
+
+def rolling_hours(flags, window: int = RISK_WINDOW_HOURS) -> np.ndarray:
+    """Number of true hours in the trailing `window` hours (inclusive), along the last axis."""
+    counts = np.cumsum(flags, axis=-1, dtype=np.int32)
+    if window < counts.shape[-1]:
+        counts[..., window:] -= counts[..., :-window]
+    return counts.astype(np.int16)
+
+
+def run_lengths(flags) -> np.ndarray:
+    """Consecutive true hours ending at each hour (0 where false), along the last axis."""
+    flags = np.asarray(flags, dtype=bool)
+    hours = np.arange(flags.shape[-1], dtype=np.int32)
+    last_false = np.where(flags, -1, hours)
+    np.maximum.accumulate(last_false, axis=-1, out=last_false)
+    return (hours - last_false).astype(np.int16)
+
+
+def assess_risk_grid(temp, humidity, condition_ids=None, conditions=None, wet=None,
+                     window: int = RISK_WINDOW_HOURS) -> dict:
+    """
+    Risk codes and leaf-wetness / humidity-duration features for a grid of
+    hourly readings. Give the weather as condition_ids, conditions or a
+    precomputed boolean `wet` (precipitation) array; without any, only
+    humidity counts.
+    """
+    temp, humidity = np.asarray(temp), np.asarray(humidity)
+    if wet is None:
+        if condition_ids is not None:
+            wet = wet_from_condition_ids(condition_ids)
+        elif conditions is not None:
+            wet = wet_from_conditions(conditions)
+        else:
+            wet = np.zeros(humidity.shape, dtype=bool)
+    temp, humidity, wet = np.broadcast_arrays(temp, humidity, np.asarray(wet, dtype=bool))
+
+    leaf_wet = wet | (humidity >= LEAF_WETNESS_HUMIDITY)
+    return {
+        "risk": risk_codes(temp, humidity, wet),
+        "leaf_wet": leaf_wet,
+        "wet_run": run_lengths(leaf_wet),
+        "wet_hours": rolling_hours(leaf_wet, window),
+        "humid_hours": rolling_hours(humidity >= HIGH_RISK_HUMIDITY, window),
+    }
+
+
+def summarize_grid(grid: dict) -> dict:
+    """Per-location totals over the forecast: peak risk code, hours at High and
+    Moderate, longest leaf-wetness run and the first High hour (-1 if none)."""
+    risk = grid["risk"]
+    high = risk == RISK_HIGH
+    return {
+        "peak_risk": risk.max(axis=-1),
+        "high_hours": high.sum(axis=-1, dtype=np.int32),
+        "moderate_hours": (risk == RISK_MODERATE).sum(axis=-1, dtype=np.int32),
+        "max_wet_run": grid["wet_run"].max(axis=-1),
+        "first_high_hour": np.where(high.any(axis=-1), high.argmax(axis=-1), -1),
+    }
@@ -0,0 +1,232 @@
+"""
+Per-user scan rollup tables: schema, backfill, catch-up and consistency check.
+
+The rollups hold per-user daily counts, per-disease counts, per-severity
+counts and running totals (count, high-risk count, confidence sum), so the
+Dashboard reads O(days shown) rows instead of aggregating every scan.
+db.save_scan / db.save_scans fold in exactly the rows they insert, in the
+same statement; `catch-up` repairs users whose scans were written by any
+other path.
+
+The tables are only used once ROLLUP_BACKFILL has run (the migrations run
+it; so does `init`). It holds a SHARE lock on scan_history while it
+aggregates the existing scans, so scan writes wait for it rather than
+being missed.
+
+Usage:
+    python -m utils.rollups init          # create and backfill the tables
+    python -m utils.rollups backfill      # rebuild everything from scan_history
+    python -m utils.rollups backfill --user 42
+    python -m utils.rollups catch-up      # rebuild users that drifted from scan_history
+    python -m utils.rollups check         # compare rollups with scan_history
+"""
+import argparse
+import sys
+
+from utils.db import (FOLD_ROLLUPS_SQL, ROLLUP_LOCK_ID, ROLLUP_ROW_COLUMNS, pooled_connection,
+                      without_statement_timeout)
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_daily_rollup (
+    user_id INTEGER NOT NULL,
+    scan_date DATE NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    high_risk BIGINT NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, scan_date)
+);
+
+CREATE TABLE IF NOT EXISTS scan_disease_rollup (
+    user_id INTEGER NOT NULL,
+    disease_name VARCHAR(100) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, disease_name)
+);
+
+CREATE TABLE IF NOT EXISTS scan_severity_rollup (
+    user_id INTEGER NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, severity)
+);
+
+CREATE TABLE IF NOT EXISTS scan_user_totals (
+    user_id INTEGER PRIMARY KEY,
+    total BIGINT NOT NULL DEFAULT 0,
+    high_risk BIGINT NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+"""
+
+ROLLUP_TABLES = ("scan_daily_rollup", "scan_disease_rollup", "scan_severity_rollup", "scan_user_totals")
+
+# Rebuild every rollup from scan_history, then mark them ready
+# (db.ROLLUPS_READY_SQL). scan_rollup_state is the watermark table of
+# earlier versions, no longer used.
+ROLLUP_BACKFILL = f"""
+LOCK TABLE scan_history IN SHARE MODE;
+TRUNCATE {', '.join(ROLLUP_TABLES)};
+{FOLD_ROLLUPS_SQL.format(rows=f"SELECT {ROLLUP_ROW_COLUMNS} FROM scan_history")};
+DROP TABLE IF EXISTS scan_rollup_state;
+CREATE TABLE IF NOT EXISTS scan_rollup_backfill (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    finished_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+INSERT INTO scan_rollup_backfill (id) VALUES (1) ON CONFLICT (id) DO UPDATE SET finished_at = NOW();
+"""
+
+USER_BACKFILL = FOLD_ROLLUPS_SQL.format(rows=f"SELECT {ROLLUP_ROW_COLUMNS} FROM scan_history WHERE user_id = %(uid)s")
+
+# Users whose scan count differs from their rollup total.
+DRIFTED_USERS_SQL = """
+SELECT COALESCE(s.user_id, t.user_id)
+FROM (SELECT user_id, COUNT(*) AS n FROM scan_history WHERE user_id IS NOT NULL GROUP BY 1) s
+FULL JOIN scan_user_totals t ON t.user_id = s.user_id
+WHERE s.n IS DISTINCT FROM t.total
+ORDER BY 1
+"""
+
+# Each check: (name, rollup query, equivalent query over raw scan_history),
+# optionally restricted to one user (%(uid)s; NULL means all users).
+CONSISTENCY_CHECKS = [
+    (
+        "daily",
+        """SELECT user_id, scan_date, count, high_risk, ROUND(confidence_sum::numeric, 4)
+           FROM scan_daily_rollup WHERE %(uid)s::int IS NULL OR user_id = %(uid)s""",
+        """SELECT user_id, DATE(scanned_at), COUNT(*), COUNT(*) FILTER (WHERE severity = 'High'),
+                  ROUND(COALESCE(SUM(confidence), 0)::numeric, 4)
+           FROM scan_history WHERE %(uid)s::int IS NULL OR user_id = %(uid)s
+           GROUP BY 1, 2""",
+    ),
+    (
+        "disease",
+        """SELECT user_id, disease_name, count
+           FROM scan_disease_rollup WHERE %(uid)s::int IS NULL OR user_id = %(uid)s""",
+        """SELECT user_id, COALESCE(disease_name, 'Unknown'), COUNT(*)
+           FROM scan_history WHERE %(uid)s::int IS NULL OR user_id = %(uid)s
+           GROUP BY 1, 2""",
+    ),
+    (
+        "severity",
+        """SELECT user_id, severity, count
+           FROM scan_severity_rollup WHERE %(uid)s::int IS NULL OR user_id = %(uid)s""",
+        """SELECT user_id, COALESCE(severity, 'Unknown'), COUNT(*)
+           FROM scan_history WHERE %(uid)s::int IS NULL OR user_id = %(uid)s
+           GROUP BY 1, 2""",
+    ),
+    (
+        "totals",
+        """SELECT user_id, total, high_risk, ROUND(confidence_sum::numeric, 4)
+           FROM scan_user_totals WHERE %(uid)s::int IS NULL OR user_id = %(uid)s""",
+        """SELECT user_id, COUNT(*), COUNT(*) FILTER (WHERE severity = 'High'),
+                  ROUND(COALESCE(SUM(confidence), 0)::numeric, 4)
+           FROM scan_history WHERE %(uid)s::int IS NULL OR user_id = %(uid)s
+           GROUP BY 1""",
+    ),
+]
+
+
+def create_rollup_tables():
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)
+        cur.execute(ROLLUP_SCHEMA)
+        cur.execute(ROLLUP_BACKFILL)
+        conn.commit()
+        cur.close()
+    print("Rollup tables ready.")
+
+
+def rebuild_user(user_id: int) -> int:
+    """Rebuild one user's rollups from scan_history. Returns their scan count."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)
+        cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (ROLLUP_LOCK_ID, user_id))
+        for table in ROLLUP_TABLES:
+            cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+        cur.execute(USER_BACKFILL, {"uid": user_id})
+        scans = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return scans
+
+
+def catch_up() -> list[int]:
+    """Rebuild every user whose rollups no longer match scan_history
+    (scans written or deleted outside db.save_scan / db.save_scans).
+    Returns the user ids rebuilt."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)
+        cur.execute(DRIFTED_USERS_SQL)
+        drifted = [r[0] for r in cur.fetchall()]
+        cur.close()
+    for user_id in drifted:
+        rebuild_user(user_id)
+    return drifted
+
+
+def backfill(user_id: int | None = None) -> int:
+    """Rebuild the rollups (all users, or one) from scan_history.
+
+    A full rebuild holds a SHARE lock on scan_history throughout, so scan
+    writes wait for it; a one-user rebuild only waits for, and holds up,
+    that user's writes. Returns the number of scans folded in.
+    """
+    if user_id is not None:
+        return rebuild_user(user_id)
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        without_statement_timeout(cur)
+        cur.execute(ROLLUP_BACKFILL)
+        cur.execute("SELECT COALESCE(SUM(total), 0) FROM scan_user_totals")
+        scans = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return scans
+
+
+def check_consistency(user_id: int | None = None, show: int = 5) -> bool:
+    """Compare every rollup with the same aggregate over scan_history.
+
+    Runs in one REPEATABLE READ snapshot; writes fold in atomically, so
+    scans saved meanwhile cannot show up as differences.
+    """
+    ok = True
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        without_statement_timeout(cur)
+        params = {"uid": user_id}
+        for name, rollup_sql, raw_sql in CONSISTENCY_CHECKS:
+            cur.execute(f"({rollup_sql}) EXCEPT ({raw_sql})", params)
+            extra = cur.fetchall()
+            cur.execute(f"({raw_sql}) EXCEPT ({rollup_sql})", params)
+            missing = cur.fetchall()
+            if extra or missing:
+                ok = False
+                print(f"✗ {name}: {len(extra)} rollup rows differ, {len(missing)} raw rows unmatched")
+                for row in (extra[:show] + missing[:show]):
+                    print(f"    {row}")
+            else:
+                print(f"✓ {name}")
+        cur.close()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain scan rollup tables")
+    parser.add_argument("command", choices=["init", "backfill", "catch-up", "check"])
+    parser.add_argument("--user", type=int, default=None, help="Limit backfill/check to one user id")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        create_rollup_tables()
+    elif args.command == "backfill":
+        print(f"Backfill complete ({backfill(args.user)} scans).")
+    elif args.command == "catch-up":
+        rebuilt = catch_up()
+        print(f"Rebuilt rollups for {len(rebuilt)} user(s)." if rebuilt else "Rollups match scan_history.")
+    else:
+        sys.exit(0 if check_consistency(args.user) else 1)
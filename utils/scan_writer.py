@@ -0,0 +1,297 @@
+"""
+Write-behind persistence for scan results.
+
+save_scan() costs a database round trip on the request path of every
+prediction. enqueue_scan() instead puts the record on an in-memory queue
+that a background thread flushes with one multi-row INSERT (db.save_scans)
+whenever FLUSH_SIZE records are waiting or FLUSH_INTERVAL seconds have
+passed. If Postgres is unavailable the batch is appended (and fsynced) to
+a local JSONL spill file, which is replayed (a chunk at a time) before the
+next flush; while the database circuit breaker is open batches go straight
+to the spill file. db.save_scan() falls back to this writer when the
+database cannot be reached. Remaining records are flushed at interpreter
+exit.
+
+Records the database refuses (db.ScanRejected, e.g. scans of a deleted
+user) and spill lines that cannot be read back are moved to a dead-letter
+file instead of being retried, so one bad record never holds up the rest.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from utils import metrics
+from utils.db import ScanRejected, database_available, save_scans
+
+FLUSH_SIZE = int(os.environ.get("SCAN_FLUSH_SIZE", 100))
+FLUSH_INTERVAL = float(os.environ.get("SCAN_FLUSH_INTERVAL", 1.0))  # seconds
+MAX_QUEUE = int(os.environ.get("SCAN_MAX_QUEUE", 10000))
+SPILL_PATH = os.environ.get("SCAN_SPILL_PATH", "spool/scans.jsonl")
+DEAD_LETTER_PATH = os.environ.get("SCAN_DEAD_LETTER_PATH", "spool/scans.rejected.jsonl")
+REPLAY_CHUNK = int(os.environ.get("SCAN_REPLAY_CHUNK", 1000))  # spilled records per INSERT on replay
+
+SPILLED = metrics.counter("scan_writer_spilled_total", "Scans written to the spill file instead of the database")
+DEAD_LETTERED = metrics.counter("scan_writer_dead_lettered_total",
+                                "Spilled lines or scans the database rejected, moved to the dead-letter file")
+ERRORS = metrics.counter("scan_writer_errors_total", "Unexpected errors in the scan writer thread")
+
+
+class ScanWriter:
+    """Buffers scan records and writes them to the database in batches."""
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE,
+                 spill_path=SPILL_PATH, dead_letter_path=DEAD_LETTER_PATH, replay_chunk=REPLAY_CHUNK,
+                 writer=save_scans, available=database_available):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.replay_path = spill_path + ".replay"        # spill file taken over for replay
+        self.replay_position_path = self.replay_path + ".pos"
+        self.dead_letter_path = dead_letter_path
+        self.replay_chunk = replay_chunk
+        self._write = writer
+        self._available = available
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Condition()
+        self._flush_requests = 0   # flush() calls made
+        self._flushes_done = 0     # flush() calls fully served by the writer thread
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+        self._thread.start()
+
+    # ── Producer side ──
+
+    def submit(self, user_id: int, disease_name: str, confidence: float, severity: str,
+               image_hash: str | None = None) -> bool:
+        """Queue a scan for writing. Never blocks on the database."""
+        record = {
+            "user_id": user_id,
+            "disease_name": disease_name,
+            "confidence": confidence,
+            "severity": severity,
+            "scanned_at": datetime.now().isoformat(),
+            "image_hash": image_hash,
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Writer is far behind (database down for a long time): go straight to disk.
+            self._spill([record])
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Ask the writer thread to flush now and wait for it to finish."""
+        with self._flushed:
+            self._flush_requests += 1
+            ticket = self._flush_requests
+            self._flush_requested.set()
+            return self._flushed.wait_for(lambda: self._flushes_done >= ticket, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything that is queued and stop the writer thread."""
+        self._stop.set()
+        self._flush_requested.set()
+        self._thread.join(timeout)
+
+    # ── Writer thread ──
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            while (self._queue.qsize() < self.flush_size and not self._flush_requested.is_set()
+                   and time.monotonic() < deadline):
+                self._flush_requested.wait(min(0.05, max(0.0, deadline - time.monotonic())))
+            with self._flushed:
+                serving = self._flush_requests
+                self._flush_requested.clear()
+
+            try:
+                self._replay_spill()
+                while True:
+                    batch = self._drain(self.flush_size)
+                    if not batch:
+                        break
+                    self._write_batch(batch)
+                    if len(batch) < self.flush_size:
+                        break
+            except Exception as e:
+                # Never let one bad flush stop all scan persistence
+                ERRORS.inc()
+                print(f"[scan-writer] Error flushing scans: {e}")
+
+            with self._flushed:
+                self._flushes_done = serving
+                self._flushed.notify_all()
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _write_batch(self, batch):
+        unwritten = self._write_records(batch) if self._available() else batch
+        if unwritten:
+            self._spill(unwritten)
+
+    def _write_records(self, records) -> list:
+        """Write records in order, dead-lettering any the database rejects.
+
+        Returns the records that were not written because the database
+        could not be reached (or failed unexpectedly): always a tail of
+        `records`, everything before it having been written or dead-lettered.
+        """
+        pending = [records]   # slices still to write, next one last
+        while pending:
+            part = pending.pop()
+            rows = [dict(r, scanned_at=datetime.fromisoformat(r["scanned_at"])) for r in part]
+            try:
+                if self._write(rows):
+                    continue
+            except ScanRejected as e:
+                if len(part) == 1:
+                    self._dead_letter([{"record": part[0], "error": str(e)}])
+                    continue
+                # Halve until the rejected records are isolated; the rest go in
+                mid = len(part) // 2
+                pending += [part[mid:], part[:mid]]
+                continue
+            except Exception as e:
+                ERRORS.inc()
+                print(f"[scan-writer] Error writing scans: {e}")
+            return [r for p in [part] + pending[::-1] for r in p]
+        return []
+
+    # ── Spill file ──
+
+    def _spill(self, records):
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a") as f:
+                for r in records:
+                    f.write(json.dumps(r) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        SPILLED.inc(len(records))
+        print(f"[scan-writer] database unavailable, spilled {len(records)} scans to {self.spill_path}")
+
+    def _dead_letter(self, entries):
+        os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+        with open(self.dead_letter_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        DEAD_LETTERED.inc(len(entries))
+        print(f"[scan-writer] moved {len(entries)} unwritable scans to {self.dead_letter_path}: "
+              f"{entries[0]['error']}")
+
+    def _replay_position(self) -> int:
+        try:
+            with open(self.replay_position_path) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_replay_position(self, position: int):
+        tmp = self.replay_position_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.replay_position_path)
+
+    def _read_chunk(self, f) -> tuple[list, list]:
+        """Up to replay_chunk records from the replay file, and the file
+        offset each one starts at. Unreadable lines (e.g. half-written by a
+        crash) are dead-lettered."""
+        records, offsets, bad = [], [], []
+        while len(records) < self.replay_chunk:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                datetime.fromisoformat(record["scanned_at"])
+                records.append(record)
+                offsets.append(offset)
+            except (ValueError, KeyError, TypeError) as e:
+                bad.append({"line": line.decode("utf-8", "replace").rstrip("\n"), "error": f"unreadable: {e}"})
+        if bad:
+            self._dead_letter(bad)
+        return records, offsets
+
+    def _replay_spill(self):
+        """Write spilled records back to the database, oldest first.
+
+        The spill file is renamed to replay_path first (under the spill lock,
+        briefly), so producers spilling meanwhile start a new file instead of
+        waiting on the database. After each chunk the position of the first
+        record not yet written is saved, so a failed or interrupted replay
+        resumes there without writing any record twice.
+        """
+        if not self._available():
+            return
+        with self._spill_lock:
+            if not os.path.exists(self.replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, self.replay_path)
+
+        replayed, finished = 0, False
+        with open(self.replay_path, "rb") as f:
+            f.seek(self._replay_position())
+            while True:
+                records, offsets = self._read_chunk(f)
+                if not records:
+                    finished = True
+                    break
+                unwritten = self._write_records(records)
+                replayed += len(records) - len(unwritten)
+                if unwritten:
+                    # Still down; resume from the first record not written
+                    self._save_replay_position(offsets[len(records) - len(unwritten)])
+                    break
+                self._save_replay_position(f.tell())
+        if finished:
+            os.remove(self.replay_path)
+            if os.path.exists(self.replay_position_path):
+                os.remove(self.replay_position_path)
+        if replayed:
+            print(f"[scan-writer] replayed {replayed} spilled scans")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_scan_writer() -> ScanWriter:
+    """The process-wide writer, started on first use and flushed at exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ScanWriter()
+                atexit.register(_writer.close)
+                metrics.register_gauges("scan_writer", lambda: {"queued": _writer._queue.qsize()})
+    return _writer
+
+
+def enqueue_scan(user_id: int, disease_name: str, confidence: float, severity: str,
+                 image_hash: str | None = None) -> bool:
+    """Drop-in replacement for db.save_scan() that returns immediately."""
+    return get_scan_writer().submit(user_id, disease_name, confidence, severity, image_hash)
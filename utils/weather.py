@@ -0,0 +1,251 @@
+"""
+OpenWeatherMap integration and weather-based disease risk.
+
+Lookups are cached per city (normalised: trimmed, single-spaced,
+case-folded) so repeated checks and page reruns do not each wait on the
+API:
+
+  fresh  - younger than WEATHER_CACHE_TTL: returned as is
+  stale  - up to WEATHER_STALE_TTL older: returned at once while a
+           background refresh fetches the current conditions
+  missing/expired - fetched, with concurrent lookups of the same city
+           sharing one request
+
+"City not found" answers are cached for WEATHER_NEGATIVE_TTL; errors are
+not cached. Requests go through one pooled HTTP session, so the
+connection to the API is kept alive between lookups. Point
+OPENWEATHER_BASE_URL at benchmarks/fake_openweather.py to work offline.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import metrics
+
+OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY", "")
+BASE_URL = os.environ.get("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5/weather")
+WEATHER_TIMEOUT = float(os.environ.get("WEATHER_TIMEOUT", 5))             # seconds per request
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", 600))       # OpenWeatherMap updates ~10 min
+WEATHER_STALE_TTL = float(os.environ.get("WEATHER_STALE_TTL", 3600))      # served while refreshing
+WEATHER_NEGATIVE_TTL = float(os.environ.get("WEATHER_NEGATIVE_TTL", 60))  # unknown cities
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", 512))
+WEATHER_POOL_SIZE = int(os.environ.get("WEATHER_POOL_SIZE", 8))           # kept-alive connections
+
+LOOKUPS = metrics.counter("weather_lookups_total", "Weather lookups by cache result (hit, stale, miss, coalesced)")
+FETCH_SECONDS = metrics.histogram("weather_fetch_seconds", "OpenWeatherMap request time")
+
+
+# ─── HTTP ───
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEATHER_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _fetch(city: str) -> tuple[bool, dict | None]:
+    """(cacheable, data): the API's JSON, or None if the city is unknown or the call failed."""
+    start = time.perf_counter()
+    try:
+        response = _get_session().get(
+            BASE_URL,
+            params={"q": city, "appid": OPENWEATHER_API_KEY, "units": "metric"},
+            timeout=WEATHER_TIMEOUT,
+        )
+        if response.status_code == 200:
+            return True, response.json()
+        return response.status_code == 404, None
+    except Exception as e:
+        print(f"Weather API error: {e}")
+        return False, None
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - start)
+
+
+# ─── Cache ───
+
+_cache = OrderedDict()   # city key -> (fetched_at, data)
+_inflight = {}           # city key -> Future of the fetch in progress
+_lock = threading.Lock()
+_refresher = None
+
+
+def normalize_city(city: str) -> str:
+    return " ".join((city or "").split()).casefold()
+
+
+def _load(key: str, future: Future):
+    """Fetch `key`, store the answer and resolve everyone waiting on `future`."""
+    data = None
+    try:
+        cacheable, data = _fetch(key)
+        with _lock:
+            if cacheable:
+                _cache[key] = (time.monotonic(), data)
+                _cache.move_to_end(key)
+                while len(_cache) > WEATHER_CACHE_SIZE:
+                    _cache.popitem(last=False)
+            elif key in _cache and _cache[key][1] is not None:
+                data = _cache[key][1]  # failed refresh: keep serving what we have
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        future.set_result(data)
+
+
+def _refresh_in_background(key: str):
+    # Called with _lock held
+    global _refresher
+    if key in _inflight:
+        return
+    if _refresher is None:
+        _refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather")
+    future = _inflight[key] = Future()
+    _refresher.submit(_load, key, future)
+
+
+def get_weather(city: str) -> dict | None:
+    """Fetch current weather for a city. Returns dict or None on failure."""
+    key = normalize_city(city)
+    if not key:
+        return None
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            fetched_at, data = entry
+            age = time.monotonic() - fetched_at
+            if age < (WEATHER_CACHE_TTL if data is not None else WEATHER_NEGATIVE_TTL):
+                _cache.move_to_end(key)
+                LOOKUPS.inc(result="hit")
+                return data
+            if data is not None and age < WEATHER_CACHE_TTL + WEATHER_STALE_TTL:
+                _refresh_in_background(key)
+                LOOKUPS.inc(result="stale")
+                return data
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if leader:
+        LOOKUPS.inc(result="miss")
+        _load(key, future)
+    else:
+        LOOKUPS.inc(result="coalesced")
+    return future.result()
+
+
+def clear_weather_cache():
+    with _lock:
+        _cache.clear()
+
+
+def get_weather_cache_stats() -> dict:
+    with _lock:
+        return {"entries": len(_cache), "in_flight": len(_inflight)}
+
+
+metrics.register_gauges("weather_cache", get_weather_cache_stats)
+
+
+# ─── Disease Risk ───
+
+# Thresholds shared with the vectorised engine in utils/risk_grid.py
+HIGH_RISK_HUMIDITY = 80            # % RH, with temperature in HIGH_RISK_TEMP
+HIGH_RISK_TEMP = (18, 30)          # °C, fungal growth range
+MODERATE_RISK_HUMIDITY = 65        # % RH
+WET_CONDITIONS = ("rain", "drizzle", "thunderstorm")
+HEAT_STRESS_TEMP = 35              # °C
+
+# Risk codes, in order of precedence of the rules below
+RISK_LOW, RISK_HEAT, RISK_MODERATE, RISK_HIGH = range(4)
+RISK_LEVELS = (
+    {
+        "level": "Low",
+        "color": "#10b981",
+        "bg": "#ecfdf5",
+        "border": "#bbf7d0",
+        "icon": "fa-circle-check",
+        "message": "Current weather conditions have low disease risk. Continue regular monitoring.",
+    },
+    {
+        "level": "Low",
+        "color": "#eab308",
+        "bg": "#fefce8",
+        "border": "#fde68a",
+        "icon": "fa-circle-info",
+        "message": "High heat may cause heat stress on crops. Ensure adequate irrigation.",
+    },
+    {
+        "level": "Moderate",
+        "color": "#f97316",
+        "bg": "#fff7ed",
+        "border": "#fed7aa",
+        "icon": "fa-circle-exclamation",
+        "message": "Moderate risk — wet or humid conditions may promote leaf spot and rust diseases. "
+                   "Monitor closely.",
+    },
+    {
+        "level": "High",
+        "color": "#ef4444",
+        "bg": "#fef2f2",
+        "border": "#fecaca",
+        "icon": "fa-triangle-exclamation",
+        "message": "High humidity & warm temperatures — ideal conditions for fungal diseases "
+                   "(blight, mildew). Inspect crops immediately.",
+    },
+)
+
+
+def risk_code(temp: float, humidity: float, condition: str) -> int:
+    """The RISK_* code for one reading."""
+    if humidity >= HIGH_RISK_HUMIDITY and HIGH_RISK_TEMP[0] <= temp <= HIGH_RISK_TEMP[1]:
+        return RISK_HIGH
+    elif humidity >= MODERATE_RISK_HUMIDITY or condition.lower() in WET_CONDITIONS:
+        return RISK_MODERATE
+    elif temp >= HEAT_STRESS_TEMP:
+        return RISK_HEAT
+    return RISK_LOW
+
+
+def assess_disease_risk(temp: float, humidity: float, condition: str) -> dict:
+    """
+    Return a disease risk level and message based on weather conditions.
+    High humidity + moderate temp = high fungal disease risk.
+    """
+    return dict(RISK_LEVELS[risk_code(temp, humidity, condition)])
+
+
+def weather_icon_emoji(condition: str) -> str:
+    """Map OpenWeatherMap condition to an emoji."""
+    condition_lower = condition.lower()
+    if "clear" in condition_lower:
+        return "☀️"
+    elif "cloud" in condition_lower:
+        return "⛅"
+    elif "rain" in condition_lower:
+        return "🌧️"
+    elif "drizzle" in condition_lower:
+        return "🌦️"
+    elif "thunder" in condition_lower:
+        return "⛈️"
+    elif "snow" in condition_lower:
+        return "❄️"
+    elif "mist" in condition_lower or "fog" in condition_lower:
+        return "🌫️"
+    return "🌡️"